@@ -0,0 +1,378 @@
+"""
+This module stores many finished games (runs) in a single archive file, instead of the three text files per run written
+by `Engine.save`.
+
+The archive is a NumPy `.npz` file of columns: one entry per run for the scalars (run ID, level, numbers of qubits and
+swaps, and whether the final circuit was optimized with the report of `peephole.optimize`), and the variable length
+data of all the runs concatenated into typed arrays (mappings, architecture edges, swaps and the gates of both
+circuits), with an array of offsets giving where each run starts. A whole column can then be read at once without
+parsing any text, e.g.
+
+    save_archive('runs.npz', [run_from_engine(engine, 'level_5_#1')])
+    archive = RunArchive('runs.npz')
+    archive.num_swaps[archive.select(level='level_5')].mean()
+
+The runs saved as text files can be converted with `python archive.py runs.npz tests/game_outputs ...`.
+"""
+
+import ast
+import os
+import re
+
+import numpy as np
+from qiskit import QuantumCircuit
+
+
+FORMAT_VERSION = 2
+
+# the keys of the report of `peephole.optimize`, stored in one row of the 'peephole' column for each run (-1 if the run
+# was not optimized)
+PEEPHOLE_KEYS = ('cx_before', 'cx_after', 'depth_before', 'depth_after', 'cancelled', 'merged')
+
+# the columns with one row per item of a run, and the column of offsets which splits them into runs
+RAGGED_COLUMNS = {
+        'initial_mapping': 'qubit_offsets',
+        'final_mapping': 'qubit_offsets',
+        'architecture': 'edge_offsets',
+        'swaps': 'swap_offsets',
+        'initial_gates': 'initial_gate_offsets',
+        'initial_qubits': 'initial_gate_offsets',
+        'initial_params': 'initial_gate_offsets',
+        'final_gates': 'final_gate_offsets',
+        'final_qubits': 'final_gate_offsets',
+        'final_params': 'final_gate_offsets',
+        }
+
+MAX_QUBITS_PER_GATE = 2
+MAX_PARAMS_PER_GATE = 3
+
+# the type and the shape of a row of each column (the unused qubits of a gate are -1 and its unused parameters NaN)
+COLUMN_TYPES = {
+        'initial_mapping': (np.int32, ()),
+        'final_mapping': (np.int32, ()),
+        'architecture': (np.int32, (2,)),
+        'swaps': (np.int32, (2,)),
+        'initial_gates': (np.uint8, ()),
+        'initial_qubits': (np.int32, (MAX_QUBITS_PER_GATE,)),
+        'initial_params': (np.float64, (MAX_PARAMS_PER_GATE,)),
+        'final_gates': (np.uint8, ()),
+        'final_qubits': (np.int32, (MAX_QUBITS_PER_GATE,)),
+        'final_params': (np.float64, (MAX_PARAMS_PER_GATE,)),
+        }
+
+
+def run_from_engine(engine, run_id, level=None, optimize=False):
+    """
+    Returns a run (as used by `save_archive`) of a finished game.
+
+    :param engine:      An `Engine`, normally in stage 3.
+    :param run_id:      The name of the run, e.g. the `output_filename` of the game.
+    :param level:       The name of the level, by default found from `run_id` (see `level_of`).
+    :param optimize:    If `True`, the final circuit is optimized, as by `Engine.save`.
+    """
+    result = engine.result(optimize=optimize)
+    return {
+            'run_id': run_id,
+            'level': level if level is not None else level_of(run_id),
+            'initial_circuit': engine.initial_circ,
+            'final_circuit': result['final_circuit'],
+            'details': result['details'],
+            }
+
+
+def level_of(run_id):
+    """
+    Returns the level of a run from its ID, i.e. the ID without the run number, e.g. 'test_level_5_#2' --> 'test_level_5'.
+    """
+    return run_id.split('#')[0].rstrip(' _')
+
+
+def read_run_files(directory):
+    """
+    Reads all the runs saved as text files (see `Engine.save`) in `directory`, returning a list of runs.
+    """
+    runs = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.startswith('initial_circuit'):
+            continue
+        initial_path = os.path.join(directory, filename)
+        final_path = initial_path.replace('initial_circuit', 'final_circuit')
+        details_path = initial_path.replace('initial_circuit', 'details')
+        if not (os.path.exists(final_path) and os.path.exists(details_path)):
+            continue
+
+        with open(details_path, 'r') as file:
+            details = ast.literal_eval(file.read().replace('\n', ''))  # converts to dictionary
+        with open(final_path, 'r') as file:
+            final_qasm = file.read()
+        if 'swaps' not in details:  # saved before the swaps were recorded
+            with open(initial_path, 'r') as file:
+                details['swaps'] = swaps_from_qasm(file.read(), final_qasm, details['initial_mapping'])
+
+        run_id = os.path.splitext(filename[len('initial_circuit'):])[0].lstrip(' _')
+        runs.append({
+                'run_id': run_id,
+                'level': level_of(run_id),
+                'initial_circuit': QuantumCircuit.from_qasm_file(initial_path),
+                'final_circuit': QuantumCircuit.from_qasm_str(final_qasm),
+                'details': details,
+                })
+    return runs
+
+
+_QASM_GATE = re.compile(r'^\s*(\w+)\s*(?:\(([^)]*)\))?\s+(.*);')
+
+
+def _qasm_gates(qasm):
+    """
+    Returns the (name, parameters, qubits) of each gate in a QASM string in the order written, which is the order of the
+    gates in the game (reading the circuit with qiskit may reorder gates on different qubits).
+    """
+    gates = []
+    for line in qasm.splitlines():
+        match = _QASM_GATE.match(line)
+        if match is None or match.group(1) in ('OPENQASM', 'include', 'qreg', 'creg', 'barrier', 'measure'):
+            continue
+        name, params, qubits = match.groups()
+        gates.append((name, (params or '').replace(' ', ''), tuple(int(q) for q in re.findall(r'\[(\d+)\]', qubits))))
+    return gates
+
+
+def swaps_from_qasm(initial_qasm, final_qasm, initial_mapping):
+    """
+    Recovers the swaps made in a game from its QASM files: the final circuit is the initial circuit (relabelled by the
+    mapping) with three CNOTs added for each swap.
+
+    :return: The swaps as a list of pairs of physical qubits.
+    """
+    initial_gates, final_gates = _qasm_gates(initial_qasm), _qasm_gates(final_qasm)
+    mapping = list(initial_mapping)
+    swaps = []
+    i, j = 0, 0
+    while j < len(final_gates):
+        name, params, qubits = final_gates[j]
+        if i < len(initial_gates):
+            initial_name, initial_params, initial_qubits = initial_gates[i]
+            if (name, params) == (initial_name, initial_params) and \
+                    qubits == tuple(mapping[q] for q in initial_qubits):
+                i += 1
+                j += 1
+                continue
+
+        if name == 'cx' and [g[0] for g in final_gates[j:j + 3]] == ['cx'] * 3 and \
+                final_gates[j + 1][2] == qubits[::-1] and final_gates[j + 2][2] == qubits:
+            x, y = qubits
+            mapping = [y if p == x else x if p == y else p for p in mapping]
+            swaps.append((x, y))
+            j += 3
+        else:
+            raise ValueError('The final circuit is not the initial circuit with swaps added.')
+
+    return swaps
+
+
+def save_archive(filename, runs, compressed=True):
+    """
+    Saves the runs to a single archive file.
+
+    :param filename:    The name of the `.npz` file.
+    :param runs:        A list of runs, each a dictionary with the keys 'run_id', 'level', 'initial_circuit',
+                        'final_circuit' and 'details' (as returned by `Engine.details`, with the 'swaps'), see
+                        `run_from_engine` and `read_run_files`.
+    :param compressed:  If `True` the columns are compressed (which makes the file several times smaller).
+    """
+    columns = {key: [] for key in RAGGED_COLUMNS}
+    lengths = {offsets: [] for offsets in set(RAGGED_COLUMNS.values())}
+    gate_names = {}
+
+    for run in runs:
+        details = run['details']
+        columns['initial_mapping'].append(details['initial_mapping'])
+        columns['final_mapping'].append(details['final_mapping'])
+        lengths['qubit_offsets'].append(len(details['initial_mapping']))
+        columns['architecture'].append(details['architecture'])
+        lengths['edge_offsets'].append(len(details['architecture']))
+        columns['swaps'].append(details['swaps'])
+        lengths['swap_offsets'].append(len(details['swaps']))
+
+        for which in ('initial', 'final'):
+            names, qubits, params = _gate_columns(run[which + '_circuit'], gate_names)
+            columns[which + '_gates'].append(names)
+            columns[which + '_qubits'].append(qubits)
+            columns[which + '_params'].append(params)
+            lengths[which + '_gate_offsets'].append(len(names))
+
+    arrays = {
+            'format_version': np.array(FORMAT_VERSION),
+            'run_ids': np.array([run['run_id'] for run in runs], dtype=str),
+            'levels': np.array([run['level'] for run in runs], dtype=str),
+            'num_circuit_qubits': np.array([run['initial_circuit'].num_qubits for run in runs], dtype=np.int32),
+            'num_arc_qubits': np.array([len(run['details']['initial_mapping']) for run in runs], dtype=np.int32),
+            'num_swaps': np.array([run['details']['num_swaps'] for run in runs], dtype=np.int32),
+            'optimized': np.array([bool(run['details'].get('optimized')) for run in runs], dtype=bool),
+            'peephole': np.array([[run['details'].get('peephole', {}).get(key, -1) for key in PEEPHOLE_KEYS]
+                                  for run in runs], dtype=np.int64).reshape(-1, len(PEEPHOLE_KEYS)),
+            'gate_names': np.array(sorted(gate_names, key=gate_names.get), dtype=str),
+            }
+    for offsets, counts in lengths.items():
+        arrays[offsets] = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+    for key, values in columns.items():
+        dtype, row_shape = COLUMN_TYPES[key]
+        arrays[key] = np.concatenate([np.zeros((0,) + row_shape, dtype=dtype)] +
+                                     [np.asarray(v, dtype=dtype).reshape((-1,) + row_shape) for v in values])
+
+    (np.savez_compressed if compressed else np.savez)(filename, **arrays)
+
+
+def _gate_columns(circuit, gate_names):
+    names = np.zeros(len(circuit.data), dtype=np.uint8)
+    qubits = np.full((len(circuit.data), MAX_QUBITS_PER_GATE), -1, dtype=np.int32)
+    params = np.full((len(circuit.data), MAX_PARAMS_PER_GATE), np.nan)
+    for k, g in enumerate(circuit.data):
+        name = g[0].name
+        if name not in gate_names:
+            gate_names[name] = len(gate_names)
+        names[k] = gate_names[name]
+        qubits[k, :len(g[1])] = [q.index for q in g[1]]
+        params[k, :len(g[0].params)] = [float(p) for p in g[0].params]
+    return names, qubits, params
+
+
+class RunArchive:
+    """
+        The runs of an archive saved by `save_archive`. All the columns are loaded at once, so the scalars of every run
+        (`run_ids`, `levels`, `num_circuit_qubits`, `num_arc_qubits`, `num_swaps` and `optimized`) are NumPy arrays,
+        and the other data of a run is a slice of a column.
+    """
+
+    def __init__(self, filename):
+        with np.load(filename) as data:
+            self.columns = {key: data[key] for key in data.files}
+
+        version = int(self.columns['format_version'])
+        if version > FORMAT_VERSION:
+            raise ValueError('The archive has format version {}, which is newer than {}.'.format(version,
+                                                                                               FORMAT_VERSION))
+
+        self.run_ids = self.columns['run_ids']
+        self.levels = self.columns['levels']
+        self.num_circuit_qubits = self.columns['num_circuit_qubits']
+        self.num_arc_qubits = self.columns['num_arc_qubits']
+        self.num_swaps = self.columns['num_swaps']
+        if 'optimized' not in self.columns:  # saved before the optimized runs were stored (format version 1)
+            self.columns['optimized'] = np.zeros(len(self.run_ids), dtype=bool)
+            self.columns['peephole'] = np.full((len(self.run_ids), len(PEEPHOLE_KEYS)), -1, dtype=np.int64)
+        self.optimized = self.columns['optimized']
+        self.gate_names = list(self.columns['gate_names'])
+
+    def __len__(self):
+        return len(self.run_ids)
+
+    def select(self, level=None, run_id=None):
+        """
+        Returns the indices of the runs of a level and/or with a run ID.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if level is not None:
+            mask &= self.levels == level
+        if run_id is not None:
+            mask &= self.run_ids == run_id
+        return np.flatnonzero(mask)
+
+    def by_level(self):
+        """
+        Returns a dictionary of the indices of the runs of each level.
+        """
+        return {level: self.select(level=level) for level in np.unique(self.levels)}
+
+    def column(self, key, i):
+        """
+        Returns the rows of a column (see `RAGGED_COLUMNS`) which belong to run `i`.
+        """
+        offsets = self.columns[RAGGED_COLUMNS[key]]
+        return self.columns[key][offsets[i]:offsets[i + 1]]
+
+    def split(self, key):
+        """
+        Returns the rows of a column split into a list of arrays, one for each run.
+        """
+        return np.split(self.columns[key], self.columns[RAGGED_COLUMNS[key]][1:-1])
+
+    def initial_mapping(self, i):
+        return self.column('initial_mapping', i)
+
+    def final_mapping(self, i):
+        return self.column('final_mapping', i)
+
+    def architecture(self, i):
+        return [tuple(edge) for edge in self.column('architecture', i).tolist()]
+
+    def swaps(self, i):
+        return [tuple(swap) for swap in self.column('swaps', i).tolist()]
+
+    def circuit(self, i, which='final'):
+        """
+        Rebuilds the initial or final circuit of run `i`.
+
+        :param which:   'initial' or 'final'.
+        """
+        num_qubits = int(self.num_circuit_qubits[i] if which == 'initial' else self.num_arc_qubits[i])
+        circuit = QuantumCircuit(num_qubits)
+        names = self.column(which + '_gates', i)
+        qubits = self.column(which + '_qubits', i).tolist()
+        params = self.column(which + '_params', i)
+        for name, gate_qubits, gate_params in zip(names, qubits, params):
+            gate_params = gate_params[~np.isnan(gate_params)].tolist()
+            gate_qubits = [q for q in gate_qubits if q >= 0]
+            getattr(circuit, self.gate_names[name])(*gate_params, *gate_qubits)
+        return circuit
+
+    def details(self, i):
+        """
+        Returns the details of run `i`, as returned by `Engine.details` (or `Engine.result` for an optimized run).
+        """
+        details = {
+                'num_circuit_qubits': int(self.num_circuit_qubits[i]),
+                'num_arc_qubits': int(self.num_arc_qubits[i]),
+                'architecture': self.architecture(i),
+                'initial_mapping': self.initial_mapping(i).tolist(),
+                'final_mapping': self.final_mapping(i).tolist(),
+                'num_swaps': int(self.num_swaps[i]),
+                'swaps': self.swaps(i),
+                }
+        if self.optimized[i]:
+            details['optimized'] = True
+            details['peephole'] = dict(zip(PEEPHOLE_KEYS, self.columns['peephole'][i].tolist()))
+        return details
+
+    def run(self, i):
+        """
+        Returns run `i`, in the form taken by `save_archive`.
+        """
+        return {
+                'run_id': str(self.run_ids[i]),
+                'level': str(self.levels[i]),
+                'initial_circuit': self.circuit(i, 'initial'),
+                'final_circuit': self.circuit(i, 'final'),
+                'details': self.details(i),
+                }
+
+
+def convert(filename, directories, compressed=True):
+    """
+    Saves all the runs stored as text files in `directories` to a single archive.
+
+    :return: The number of runs saved.
+    """
+    runs = [run for directory in directories for run in read_run_files(directory)]
+    save_archive(filename, runs, compressed=compressed)
+    return len(runs)
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) < 3:
+        print('Usage: python archive.py <archive.npz> <directory> [<directory> ...]')
+        sys.exit(1)
+    print('Saved {} runs to {}'.format(convert(sys.argv[1], sys.argv[2:]), sys.argv[1]))
@@ -0,0 +1,73 @@
+import sys, os
+import argparse
+import statistics
+import subprocess
+import time
+
+"""
+Measures the cold start of the headless path, i.e. a new Python process which imports the engine and the router, loads
+a level from the catalog, routes it and gets the details of its outputs (with no plotting, and no output circuit). Each
+run is a fresh process, so nothing is cached in memory; the level cache on disk is filled first, as it would be after
+the first run.
+
+The median time must stay below `TARGET_SECONDS` (the script exits with a non-zero status otherwise). Run as
+`python cold_start.py`.
+"""
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+TARGET_SECONDS = 0.8
+
+# the modules which the headless path must not import: the plotting modules, and `qiskit` (the cached level is only
+# tables of numbers, and a circuit is built from them only when one is asked for)
+HEAVY_MODULES = ('matplotlib', 'networkx', 'qiskit')
+
+HEADLESS = '''
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+from catalog import level_by_number
+from router import Router
+imported = time.perf_counter()
+engine = level_by_number({level}).engine()
+loaded = time.perf_counter()
+Router(engine.arc).play(engine)
+engine.details()
+done = time.perf_counter()
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(imported - start, loaded - imported, done - loaded, ','.join(heavy))
+'''
+
+
+def cold_start(level=10):
+    """
+    Runs the headless path in a new process.
+
+    :return: a tuple of the time (in seconds) of the whole process, of the imports, of loading the level and of routing
+             it, and a list of the heavy modules which were imported.
+    """
+    code = HEADLESS.format(root=os.path.abspath(ROOT), level=level, heavy=HEAVY_MODULES)
+    start = time.perf_counter()
+    output = subprocess.check_output([sys.executable, '-c', code], stderr=subprocess.DEVNULL).decode().split()
+    total = time.perf_counter() - start
+    heavy = output[3].split(',') if len(output) > 3 else []
+    return (total,) + tuple(float(x) for x in output[:3]) + (heavy,)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measures the cold start of the headless path.')
+    parser.add_argument('--level', type=int, default=10)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    cold_start(args.level)  # fills the level cache
+    runs = [cold_start(args.level) for _ in range(args.repeats)]
+
+    median = statistics.median(run[0] for run in runs)
+    print('process: {:.3f} s    imports: {:.3f} s    load level: {:.3f} s    route: {:.3f} s    (medians of {})'.format(
+        median, *(statistics.median(run[i] for run in runs) for i in (1, 2, 3)), args.repeats))
+    heavy = sorted(set(name for run in runs for name in run[4]))
+    if heavy:
+        print('Heavy modules imported: {}'.format(', '.join(heavy)))
+    print('Target: {:.3f} s -- {}'.format(TARGET_SECONDS, 'met' if median <= TARGET_SECONDS and not heavy else 'MISSED'))
+    sys.exit(0 if median <= TARGET_SECONDS and not heavy else 1)
@@ -0,0 +1,298 @@
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import argparse
+import json
+import multiprocessing
+import time
+
+from engine import NATIVE_GATES
+from tests.check_outputs import simulate_statevector
+from util import device_snapshots
+from tests.verify_outputs import find_runs, load_run
+
+"""
+An offline version of the notebooks `Running on real IBMQ machines, <n> qubits.ipynb`, for many runs at once and with
+no IBMQ account. Each run saved by the game (see `Engine.save`, e.g. in `output_data`) is compared with `qiskit`: the
+same initial circuit is transpiled by `qiskit` onto the same architecture, and both routed circuits are run on a local
+`Aer` simulator with a noise model built from the stored calibration of a device. For each run this reports
+* the CNOT count and the depth of the game's circuit and of `qiskit`'s,
+* the fidelity (Hellinger) of the measured distribution of each circuit to its ideal distribution.
+
+The ideal distribution of each routed circuit is that of the same circuit simulated without noise (not that of the
+initial circuit), so the fidelity measures only what the noise does to it, and neither the final mapping of the game
+nor the layout chosen by `qiskit` has to be tracked. That the game's circuit is equivalent to the initial circuit is
+checked by `tests/verify_outputs.py`. The runs are compared in parallel. Run as
+
+    python noisy_comparison.py output_data --summary summary.json
+
+The calibration is a JSON file of the properties of a device (as in `backend.properties().to_dict()`) or a stored
+snapshot of a device (`--device ibm_washington`, see `util.device_snapshots`), by default the stored calibration of
+`ibmq_16_melbourne` which comes with `qiskit` (the architecture of the runs in `output_data`).
+"""
+
+
+def default_calibration_file():
+    import qiskit.providers.fake_provider
+    return os.path.join(os.path.dirname(qiskit.providers.fake_provider.__file__), 'backends', 'melbourne',
+                        'props_melbourne.json')
+
+
+def load_calibration(filename=None, device=None):
+    """
+    Reads the calibration of a device from the JSON file of its properties, or from the stored snapshot of `device`
+    (see `util.device_snapshots`).
+
+    :return: a dictionary with the keys 'name', 'num_qubits', 'gates' ({(gate name, qubits): error}) and 'readout'
+             ({qubit: (probability of measuring 1 after preparing 0, of measuring 0 after preparing 1)}).
+    """
+    if device is not None:
+        snapshots = device_snapshots()
+        if device not in snapshots:
+            raise ValueError('There is no snapshot of {} (the devices stored are {}).'.format(
+                device, ', '.join(snapshots)))
+        properties = snapshots[device]['properties']
+    else:
+        with open(filename if filename is not None else default_calibration_file(), 'r') as file:
+            properties = json.load(file)
+
+    gates = {}
+    for gate in properties['gates']:
+        for parameter in gate['parameters']:
+            if parameter['name'] == 'gate_error':
+                gates[(gate['gate'], tuple(gate['qubits']))] = parameter['value']
+
+    readout = {}
+    for q, parameters in enumerate(properties['qubits']):
+        values = {parameter['name']: parameter['value'] for parameter in parameters}
+        error = values.get('readout_error', 0.)
+        readout[q] = (values.get('prob_meas1_prep0', error), values.get('prob_meas0_prep1', error))
+
+    return {'name': properties.get('backend_name'), 'num_qubits': len(properties['qubits']), 'gates': gates,
+            'readout': readout}
+
+
+def noise_model(calibration, architecture):
+    """
+    Builds a noise model of the device on `architecture`: a depolarizing error on each gate with the calibrated error
+    rate (the mean over the device where a gate was not calibrated, e.g. a CNOT on an edge which the device does not
+    have), and the calibrated readout error of each qubit.
+    """
+    from qiskit_aer.noise import NoiseModel, ReadoutError, depolarizing_error
+
+    num_qubits = max(max(edge) for edge in architecture) + 1
+    if num_qubits > calibration['num_qubits']:
+        raise ValueError('The architecture has {} qubits, but the device only has {}.'.format(
+            num_qubits, calibration['num_qubits']))
+
+    def error(name, qubits):
+        for key in ((name, qubits), (name, qubits[::-1])):
+            if key in calibration['gates']:
+                return calibration['gates'][key]
+        errors = [e for (gate, _), e in calibration['gates'].items() if gate == name]
+        return sum(errors) / len(errors) if errors else 0.
+
+    def depolarizing(gate_error, n):
+        # the average gate infidelity of a depolarizing channel with parameter p is p (d - 1) / d, for d = 2^n
+        return depolarizing_error(min(gate_error * 2**n / (2**n - 1), 1.), n)
+
+    model = NoiseModel(basis_gates=NATIVE_GATES)
+    for q in range(num_qubits):
+        for name in ('u2', 'u3'):  # `u1` is done in software, so has no error
+            gate_error = error(name, (q,))
+            if gate_error > 0:
+                model.add_quantum_error(depolarizing(gate_error, 1), name, [q])
+        p1_given_0, p0_given_1 = calibration['readout'][q]
+        model.add_readout_error(ReadoutError([[1 - p1_given_0, p1_given_0], [p0_given_1, 1 - p0_given_1]]), [q])
+    for a, b in architecture:
+        gate_error = error('cx', (a, b))
+        if gate_error > 0:
+            for edge in ((a, b), (b, a)):
+                model.add_quantum_error(depolarizing(gate_error, 2), 'cx', list(edge))
+    return model
+
+
+def transpile_with_qiskit(circuit, architecture, optimization_level=1, seed=0):
+    """
+    Routes `circuit` onto `architecture` with `qiskit`, in the same native gates as the game.
+    """
+    from qiskit import transpile
+    from qiskit.transpiler import CouplingMap
+
+    coupling_map = CouplingMap([list(edge) for edge in architecture] + [[b, a] for a, b in architecture])
+    return transpile(circuit, coupling_map=coupling_map, basis_gates=NATIVE_GATES,
+                     optimization_level=optimization_level, seed_transpiler=seed)
+
+
+def ideal_distribution(circuit):
+    """
+    Returns the probabilities of measuring every qubit of `circuit` (started in |0...0>) without noise, by bit string.
+    """
+    import numpy as np
+
+    circuit = circuit.remove_final_measurements(inplace=False)
+    n = circuit.num_qubits
+    state = np.zeros(2**n, dtype=complex)
+    state[0] = 1
+    probabilities = np.abs(simulate_statevector(circuit, state, n))**2
+    return {format(i, '0{}b'.format(n)): p for i, p in enumerate(probabilities) if p > 1e-12}
+
+
+def noisy_counts(circuit, model, shots=2000, seed=0):
+    from qiskit_aer import AerSimulator
+
+    circuit = circuit.remove_final_measurements(inplace=False)
+    circuit.measure_all()
+    result = AerSimulator(noise_model=model).run(circuit, shots=shots, seed_simulator=seed).result()
+    return result.get_counts()
+
+
+def compare(initial_circ, final_circ, details, calibration, shots=2000, seed=0, optimization_level=1,
+            simulate_max_qubits=20):
+    """
+    Compares a single run of the game with `qiskit`.
+
+    :param initial_circ:        The circuit routed by the game.
+    :param final_circ:          The output of the game.
+    :param details:             The details of the run (see `Engine.details`).
+    :param calibration:         The calibration of the device, see `load_calibration`.
+    :param shots:               The number of shots of each noisy simulation.
+    :param seed:                The seed of `qiskit`'s transpiler and of the simulator.
+    :param optimization_level:  The optimization level of `qiskit`'s transpiler.
+    :param simulate_max_qubits: The largest number of qubits which are simulated (the fidelities are `None` above it).
+    :return: a dictionary with 'num_qubits', and the 'cx', 'depth' and 'fidelity' of both 'game' and 'qiskit', where
+             the fidelity of each circuit is to its own output without noise (see `ideal_distribution`).
+    """
+    from qiskit.quantum_info import hellinger_fidelity
+
+    architecture = details['architecture']
+    qiskit_circ = transpile_with_qiskit(initial_circ, architecture, optimization_level, seed)
+    result = {'num_qubits': final_circ.num_qubits, 'num_swaps': details.get('num_swaps')}
+    model = noise_model(calibration, architecture) if final_circ.num_qubits <= simulate_max_qubits else None
+
+    for name, circuit in (('game', final_circ), ('qiskit', qiskit_circ)):
+        result[name] = {'cx': circuit.count_ops().get('cx', 0), 'depth': circuit.depth(), 'fidelity': None}
+        if model is not None:
+            counts = noisy_counts(circuit, model, shots, seed)
+            result[name]['fidelity'] = float(hellinger_fidelity(counts, ideal_distribution(circuit)))
+    return result
+
+
+def compare_engine(engine, calibration, **kwargs):
+    """
+    Compares a finished game (an `Engine`, or the `engine` of a `Game`) with `qiskit`, see `compare`.
+    """
+    return compare(engine.initial_circ, engine.final_circ, engine.details(), calibration, **kwargs)
+
+
+def compare_run(paths, calibration, **kwargs):
+    """
+    Compares a run saved by the game, from the paths of its initial circuit, final circuit and details files.
+    """
+    start = time.perf_counter()
+    try:
+        result = compare(*load_run(paths), calibration, **kwargs)
+        result['error'] = None
+    except Exception as error:  # a run which cannot be compared is reported, rather than stopping the batch
+        result = {'error': '{}: {}'.format(type(error).__name__, error)}
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def _compare_run(args):
+    name, paths, calibration, kwargs = args
+    return name, compare_run(paths, calibration, **kwargs)
+
+
+def compare_directories(directories, calibration=None, processes=None, verbose=False, **kwargs):
+    """
+    Compares every run in `directories` with `qiskit`, on a pool of processes. The keyword arguments are passed on
+    to `compare`.
+
+    :return: a dictionary with the results of each run (by name, see `compare`) and their 'summary'.
+    """
+    calibration = calibration if calibration is not None else load_calibration()
+    jobs = []
+    for directory in directories:
+        for name, paths in find_runs(directory).items():
+            jobs.append((os.path.join(os.path.basename(os.path.normpath(directory)), name), paths, calibration,
+                         kwargs))
+
+    runs = {}
+    with multiprocessing.Pool(processes) as pool:
+        for name, result in pool.imap_unordered(_compare_run, jobs):
+            runs[name] = result
+            if verbose:
+                print(format_result(name, result))
+
+    runs = dict(sorted(runs.items()))
+    return {'device': calibration['name'], 'runs': runs, 'summary': summarize(runs)}
+
+
+def summarize(runs):
+    """
+    Returns the totals and means over the runs which were compared: the CNOT counts, depths and fidelities of the game
+    and of `qiskit`, and in how many runs the game used fewer CNOTs or had a higher fidelity.
+    """
+    compared = [result for result in runs.values() if result.get('error') is None]
+    summary = {'num_runs': len(runs), 'num_compared': len(compared),
+               'failed': sorted(name for name, result in runs.items() if result.get('error') is not None)}
+    for name in ('game', 'qiskit'):
+        fidelities = [r[name]['fidelity'] for r in compared if r[name]['fidelity'] is not None]
+        summary[name] = {
+                'total_cx': sum(r[name]['cx'] for r in compared),
+                'mean_depth': sum(r[name]['depth'] for r in compared) / len(compared) if compared else None,
+                'mean_fidelity': sum(fidelities) / len(fidelities) if fidelities else None,
+                }
+    summary['game_fewer_cx'] = sum(r['game']['cx'] < r['qiskit']['cx'] for r in compared)
+    summary['game_higher_fidelity'] = sum(r['game']['fidelity'] is not None and
+                                          r['game']['fidelity'] > r['qiskit']['fidelity'] for r in compared)
+    return summary
+
+
+def format_result(name, result):
+    if result.get('error') is not None:
+        return '{:<30} FAILED {}'.format(name, result['error'])
+
+    def fidelity(value):
+        return '{:.3f}'.format(value) if value is not None else '  -  '
+    game, qiskit = result['game'], result['qiskit']
+    return '{:<30} {:>3} qubits   cx {:>4} vs {:>4}   depth {:>4} vs {:>4}   fidelity {} vs {}'.format(
+        name, result['num_qubits'], game['cx'], qiskit['cx'], game['depth'], qiskit['depth'],
+        fidelity(game['fidelity']), fidelity(qiskit['fidelity']))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compares saved runs of the game with qiskit on a noisy simulator.')
+    parser.add_argument('directories', nargs='*', default=[os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                        'output_data')])
+    parser.add_argument('--calibration', default=None, help='a JSON file of device properties')
+    parser.add_argument('--device', default=None, help='the name of a stored device snapshot')
+    parser.add_argument('--shots', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--optimization-level', type=int, default=1)
+    parser.add_argument('--simulate-max-qubits', type=int, default=20)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--summary', default=None, help='a JSON file to write every result to')
+    args = parser.parse_args()
+
+    calibration = load_calibration(args.calibration, args.device)
+    print('Game (first) vs qiskit (second), on a noisy simulator of {}:'.format(calibration['name']))
+    start = time.perf_counter()
+    results = compare_directories(args.directories, calibration, processes=args.processes, verbose=True,
+                                  shots=args.shots, seed=args.seed, optimization_level=args.optimization_level,
+                                  simulate_max_qubits=args.simulate_max_qubits)
+    summary = results['summary']
+    print('\n{} of {} runs compared in {:.1f} s'.format(summary['num_compared'], summary['num_runs'],
+                                                       time.perf_counter() - start))
+    for name in ('game', 'qiskit'):
+        mean_fidelity = summary[name]['mean_fidelity']
+        print('  {:<7} total cx {:>6}   mean depth {:8.1f}   mean fidelity {}'.format(
+            name, summary[name]['total_cx'], summary[name]['mean_depth'] or 0,
+            '{:.3f}'.format(mean_fidelity) if mean_fidelity is not None else '-'))
+    print('  the game used fewer CNOTs in {} runs and had a higher fidelity in {}'.format(
+        summary['game_fewer_cx'], summary['game_higher_fidelity']))
+
+    if args.summary is not None:
+        with open(args.summary, 'w') as file:
+            json.dump(results, file, indent=1)
+    sys.exit(1 if summary['failed'] else 0)
@@ -0,0 +1,50 @@
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import time
+import matplotlib
+matplotlib.use('Agg')  # no window needed, we only time the drawing
+import matplotlib.pyplot as plt
+from qiskit.circuit.random import random_circuit
+
+from game import Game
+from util import lattice_architecture
+
+"""
+Compares the time taken to redraw the board after a click, when redrawing the whole figure (`incremental=False`)
+and when only updating and blitting the artists which change (`incremental=True`).
+
+Run as `python plot_latency.py`.
+"""
+
+
+def time_plot(game, repeats=20):
+    """
+    Returns the mean time (in seconds) of a redraw of `game`, where each redraw follows a highlighted node.
+    """
+    times = []
+    for i in range(repeats):
+        game.node_colors[i % game.num_arc_qubits] = 'khaki'
+        start = time.perf_counter()
+        game.plot()
+        times.append(time.perf_counter() - start)
+        game.reset_colors()
+    return sum(times) / len(times)
+
+
+def compare(circuit, architecture, title, repeats=20):
+    results = {}
+    for incremental in (False, True):
+        plt.close('all')
+        game = Game(circuit, architecture, title=title, incremental=incremental)
+        results[incremental] = time_plot(game, repeats=repeats)
+
+    print('{:<28} full: {:8.1f} ms ({:6.1f} fps)    incremental: {:8.1f} ms ({:6.1f} fps)    speed-up: {:5.1f}x'.format(
+        title, 1000*results[False], 1/results[False], 1000*results[True], 1/results[True], results[False]/results[True]))
+    return results
+
+
+if __name__ == '__main__':
+    for a, b in [(2, 3), (5, 3), (5, 10)]:
+        n = a*b
+        compare(random_circuit(num_qubits=n, depth=3, seed=0), lattice_architecture(a, b),
+                title='{} qubit lattice ({}x{})'.format(n, a, b))
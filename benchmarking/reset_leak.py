@@ -0,0 +1,80 @@
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import gc
+import time
+import tracemalloc
+import matplotlib
+matplotlib.use('Agg')  # no window needed, we only time the resets
+import matplotlib.pyplot as plt
+from qiskit.circuit.random import random_circuit
+
+from game import Game
+from router import Router, cnot_pairs
+from util import lattice_architecture
+
+"""
+Checks that restarting a game (pressing 'Reset' twice) is cheap and does not leak: the time taken by each reset, the
+memory allocated by Python and the number of open figures and callbacks should all stay flat over many restarts.
+
+The memory grows over the first few hundred resets (to under 200 KiB here), while `matplotlib` fills its bounded
+caches of the layouts and glyphs of the text drawn (e.g. the scores, which change from game to game), and then stays
+flat to within a few KiB.
+
+Run as `python reset_leak.py`.
+"""
+
+
+def play(game, router, pairs, num_moves=10):
+    """
+    Makes some moves, as the router would, where `pairs` are the CNOTs of the game (see `cnot_pairs`).
+    """
+    for _ in range(num_moves):
+        engine = game.engine
+        if engine.stage == 3:
+            break
+        if engine.stage == 1 or engine.is_legal():
+            game.next_gate()
+        else:
+            game.swap_nodes(*router.best_swap(pairs, engine.num_cnots_done, engine.current_mapping))
+
+
+def run(num_resets=1500, report_every=250):
+    a, b = 3, 5
+    arc = lattice_architecture(a, b)
+    game = Game(random_circuit(num_qubits=a*b, depth=5, max_operands=2, seed=0), arc, title='reset leak')
+    router = Router(arc)
+    pairs = cnot_pairs(game.engine)  # the same for every game, as a reset keeps the circuit
+
+    # the time of a reset, without tracing the memory (which slows everything down)
+    restore_times, reset_times = [], []
+    for _ in range(report_every):
+        play(game, router, pairs)
+        start = time.perf_counter()
+        game.engine.restore(game.initial_state)
+        restore_times.append(time.perf_counter() - start)
+
+        play(game, router, pairs)
+        start = time.perf_counter()
+        game.reset(best_score=game.num_swaps)
+        reset_times.append(time.perf_counter() - start)
+    print('engine restore: {:.3f} ms    reset (with redraw): {:.2f} ms'.format(
+        1000*sum(restore_times)/len(restore_times), 1000*sum(reset_times)/len(reset_times)))
+
+    # the memory, figures and callbacks after many resets
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.take_snapshot()
+    print('{:>8} {:>14} {:>9} {:>10}'.format('resets', 'memory (KiB)', 'figures', 'callbacks'))
+    for i in range(1, num_resets + 1):
+        play(game, router, pairs)
+        game.reset(best_score=game.num_swaps)
+        if i % report_every == 0:
+            gc.collect()  # the figure's text and paths make reference cycles, which are otherwise freed only rarely
+            growth = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(baseline, 'filename'))
+            callbacks = sum(len(c) for c in game.fig.canvas.callbacks.callbacks.values())
+            print('{:>8} {:>14.1f} {:>9} {:>10}'.format(i, growth/1024, len(plt.get_fignums()), callbacks))
+    tracemalloc.stop()
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,103 @@
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import argparse
+import asyncio
+import time
+import tracemalloc
+
+from router import Router
+from server import Server, LevelStore, Client
+
+"""
+Measures the throughput of the multi-session server (`server.py`): many clients, each on its own connection, open a
+session on a level and play it to the end with the moves of the `Router`, `batch` moves per request. The server and the
+clients run in the same process (over local connections), so the numbers include the cost of the clients. Also measures
+the memory of a session. Run as `python server_throughput.py --clients 100 --batch 1`.
+"""
+
+
+def routed_moves(store, level):
+    engine = store.new_engine(level)
+    return [list(move) for move in Router(engine.arc).play(engine).moves]
+
+
+async def player(port, level, moves, batch, games):
+    client = await Client.connect('127.0.0.1', port)
+    requests = 0
+    for _ in range(games):
+        status, state = await client.request('POST', '/sessions', {'level': level})
+        assert status == 200, state
+        path = '/sessions/{}/moves'.format(state['session'])
+        for i in range(0, len(moves), batch):
+            status, state = await client.request('POST', path, {'moves': moves[i:i + batch]})
+            assert status == 200, state
+        assert state['stage'] == 3
+        await client.request('DELETE', '/sessions/{}'.format(state['session']))
+        requests += 2 + (len(moves) + batch - 1) // batch
+    await client.close()
+    return requests
+
+
+async def throughput(store, level=10, clients=100, games=3, batch=1):
+    """
+    Plays `games` games with each of `clients` clients at once.
+
+    :return: a dictionary of the sessions, moves and requests per second.
+    """
+    moves = routed_moves(store, level)
+    server = Server(store, max_sessions=clients)
+    port = await server.start()
+    try:
+        start = time.perf_counter()
+        requests = await asyncio.gather(*(player(port, level, moves, batch, games) for _ in range(clients)))
+        seconds = time.perf_counter() - start
+    finally:
+        await server.close()
+    return {
+            'seconds': seconds,
+            'sessions_per_second': clients * games / seconds,
+            'moves_per_second': clients * games * len(moves) / seconds,
+            'requests_per_second': sum(requests) / seconds,
+            }
+
+
+def session_memory(store, level=10, num_sessions=1000):
+    """
+    Returns the memory (in bytes) of a session at the start of the level, and after the game is played.
+    """
+    moves = routed_moves(store, level)
+    server = Server(store, max_sessions=num_sessions + 1)
+    server.open_session(level)  # the level itself is loaded (and shared) before measuring
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    sessions = [server.open_session(level) for _ in range(num_sessions)]
+    opened = tracemalloc.take_snapshot()
+    for session in sessions:
+        for move in moves:
+            session.engine.play_move(tuple(move))
+    played = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    def size(snapshot):
+        return sum(stat.size_diff for stat in snapshot.compare_to(before, 'filename'))
+    return size(opened) / num_sessions, size(played) / num_sessions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measures the throughput of the multi-session server.')
+    parser.add_argument('--level', type=int, default=10)
+    parser.add_argument('--clients', type=int, default=100)
+    parser.add_argument('--games', type=int, default=3, help='games played by each client')
+    parser.add_argument('--batch', type=int, default=1, help='moves sent in each request')
+    args = parser.parse_args()
+
+    store = LevelStore()
+    store.preload()
+    result = asyncio.run(throughput(store, args.level, args.clients, args.games, args.batch))
+    print('{} clients, {} games each, {} move(s) per request: {:.1f} s'.format(
+        args.clients, args.games, args.batch, result['seconds']))
+    print('  {:9.1f} sessions/s  {:9.1f} moves/s  {:9.1f} requests/s'.format(
+        result['sessions_per_second'], result['moves_per_second'], result['requests_per_second']))
+    opened, played = session_memory(store, args.level)
+    print('Memory per session: {:.1f} kB at the start, {:.1f} kB after the game'.format(opened / 1024, played / 1024))
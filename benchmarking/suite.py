@@ -0,0 +1,248 @@
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import argparse
+import datetime
+import glob
+import json
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import matplotlib
+matplotlib.use('Agg')  # no window needed, we only time the drawing
+import matplotlib.pyplot as plt
+from qiskit.circuit.random import random_circuit
+
+from catalog import levels
+from game import Game
+from router import Router, cnot_pairs
+from util import lattice_architecture
+from tests.verify_outputs import verify_run
+
+"""
+An offline benchmark suite, which needs no IBMQ account: for each level in `levels` and for random circuits on lattice
+architectures (up to a few hundred qubits) it times
+* 'construct': creating the `Game` (unrolling the circuit and drawing the board),
+* 'move_mean' and 'move_p90': a move on the engine (a swap or "Next Gate"), over a game played by the `Router`,
+* 'render': redrawing the board after a move,
+* 'save': writing the outputs at the end of the game (`Engine.save`),
+* 'verify': verifying the outputs (`verify_run` in `tests/verify_outputs.py`).
+
+The results (in seconds) are saved in `benchmarking/results`, named by the time and the git commit, and compared with
+the previous results: any time which got worse by more than the tolerance is flagged as a regression. Run as
+
+    python suite.py                       # everything, compared with the latest saved results
+    python suite.py --quick               # only the small cases
+    python suite.py --compare results/<file>.json --fail-on-regression
+"""
+
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# (rows, columns, depth) of the random circuits on lattice architectures
+LATTICES = [(3, 5, 10), (5, 10, 10), (10, 10, 10), (10, 20, 5), (15, 20, 5)]
+QUICK_LATTICES = LATTICES[:2]
+
+# the metrics where larger is worse, i.e. the times
+TIMED_METRICS = ('construct', 'move_mean', 'move_p90', 'render', 'save', 'verify')
+
+
+def cases(quick=False):
+    """
+    Returns a list of the benchmark cases as (name, circuit, architecture).
+    """
+    found = []
+    for level in levels():
+        engine = level.engine()  # already native, so `Game` does not unroll it again
+        found.append((level.name, engine.initial_circ, engine.arc))
+
+    for a, b, depth in (QUICK_LATTICES if quick else LATTICES):
+        circuit = random_circuit(num_qubits=a*b, depth=depth, max_operands=2, seed=0)
+        found.append(('lattice_{}x{}'.format(a, b), circuit, lattice_architecture(a, b)))
+
+    return found
+
+
+def best_time(function, repeats):
+    """
+    Returns the smallest time (in seconds) of `repeats` calls of `function`.
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def play(engine, router):
+    """
+    Plays the game on `engine` as the router would, returning the time of each move on the engine.
+    """
+    pairs = cnot_pairs(engine)
+    times = []
+
+    mapping = router.initial_mapping(pairs, engine.current_mapping)
+    start = time.perf_counter()
+    engine.set_initial_mapping(mapping)
+    times.append(time.perf_counter() - start)
+
+    while engine.stage != 3:
+        if engine.is_legal():
+            start = time.perf_counter()
+            engine.advance()
+        else:
+            swap = router.best_swap(pairs, engine.current_cnot(), engine.current_mapping)
+            start = time.perf_counter()
+            engine.apply_swap(*swap)
+        times.append(time.perf_counter() - start)
+
+    return times
+
+
+def benchmark(name, circuit, architecture, repeats=3, renders=20, simulate_max_qubits=12):
+    """
+    Runs every benchmark of a single case.
+
+    :return: a dictionary of the times (in seconds) of each metric, and the size of the case.
+    """
+    result = {}
+
+    def construct():
+        plt.close('all')
+        return Game(circuit, architecture, title=name)
+    result['construct'] = best_time(construct, repeats)
+
+    game = construct()
+    move_times = sorted(play(game.engine, Router(architecture)))
+    result['move_mean'] = sum(move_times) / len(move_times)
+    result['move_p90'] = move_times[int(0.9 * (len(move_times) - 1))]
+
+    render_times = []
+    for i in range(renders):
+        game.node_colors[i % game.num_arc_qubits] = 'khaki'
+        start = time.perf_counter()
+        game.plot()
+        render_times.append(time.perf_counter() - start)
+        game.reset_colors()
+    result['render'] = statistics.median(render_times)
+
+    directory = tempfile.mkdtemp()
+    try:
+        result['save'] = best_time(lambda: game.engine.save(name, directory), repeats)
+        paths = [os.path.join(directory, prefix + name + '.txt')
+                 for prefix in ('initial_circuit_', 'final_circuit_', 'details_')]
+        verified = []
+        result['verify'] = best_time(lambda: verified.append(verify_run(paths, simulate_max_qubits)), repeats)
+        if not verified[-1]['passed']:
+            raise AssertionError('The outputs of {} did not verify: {}'.format(name, verified[-1]))
+    finally:
+        shutil.rmtree(directory)
+
+    result['num_qubits'] = game.num_arc_qubits
+    result['num_gates'] = len(game.initial_circ.data)
+    result['num_moves'] = len(move_times)
+    result['num_swaps'] = game.num_swaps
+    plt.close('all')
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(RESULTS_DIR),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(quick=False, repeats=3, verbose=True):
+    """
+    Runs the whole suite, returning the results with the metadata of the run (commit, time and machine).
+    """
+    results = {
+            'commit': git_commit(),
+            'time': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.platform(),
+            'quick': quick,
+            'cases': {},
+            }
+    for name, circuit, architecture in cases(quick):
+        results['cases'][name] = result = benchmark(name, circuit, architecture, repeats=repeats)
+        if verbose:
+            print('{:<16} {:>4} qubits  construct {:8.1f} ms  move {:7.1f} us  render {:7.1f} ms  '
+                  'save {:7.1f} ms  verify {:8.1f} ms'.format(name, result['num_qubits'], 1000*result['construct'],
+                                                            1e6*result['move_mean'], 1000*result['render'],
+                                                            1000*result['save'], 1000*result['verify']))
+    return results
+
+
+def save(results, directory=RESULTS_DIR):
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    filename = os.path.join(directory, '{}_{}.json'.format(results['time'].replace(':', '-'), results['commit']))
+    with open(filename, 'w') as file:
+        json.dump(results, file, indent=1)
+    return filename
+
+
+def latest(directory=RESULTS_DIR, exclude=None):
+    """
+    Returns the filename of the most recent saved results (other than `exclude`), or `None` if there are none.
+    """
+    filenames = [f for f in sorted(glob.glob(os.path.join(directory, '*.json'))) if f != exclude]
+    return filenames[-1] if filenames else None
+
+
+def compare(old, new, tolerance=0.25, min_seconds=1e-5):
+    """
+    Compares two sets of results, flagging every time which is more than `tolerance` (relatively) and `min_seconds`
+    (absolutely) slower in `new` than in `old`.
+
+    :return: a list of the regressions as (case, metric, old time, new time).
+    """
+    regressions = []
+    for name, result in new['cases'].items():
+        if name not in old['cases']:
+            continue
+        for metric in TIMED_METRICS:
+            before, after = old['cases'][name].get(metric), result.get(metric)
+            if before is None or after is None:
+                continue
+            if after > (1 + tolerance) * before and after - before > min_seconds:
+                regressions.append((name, metric, before, after))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs the offline benchmark suite.')
+    parser.add_argument('--quick', action='store_true', help='only the levels and the small lattices')
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--compare', default=None, help='the results to compare with (default: the latest saved)')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='the relative slow-down flagged as a regression')
+    parser.add_argument('--no-save', action='store_true', help='do not save the results')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args()
+
+    results = run(quick=args.quick, repeats=args.repeats)
+    filename = None
+    if not args.no_save:
+        filename = save(results)
+        print('\nSaved the results to {}'.format(filename))
+
+    baseline = args.compare if args.compare is not None else latest(exclude=filename)
+    if baseline is None:
+        print('No previous results to compare with.')
+        sys.exit(0)
+
+    with open(baseline, 'r') as file:
+        old = json.load(file)
+    regressions = compare(old, results, tolerance=args.tolerance)
+    print('Compared with {} (commit {}): {} regression(s)'.format(os.path.basename(baseline), old.get('commit'),
+                                                                  len(regressions)))
+    for name, metric, before, after in regressions:
+        print('  REGRESSION {:<16} {:<10} {:10.3f} ms --> {:10.3f} ms ({:+.0f}%)'.format(
+            name, metric, 1000*before, 1000*after, 100*(after/before - 1)))
+    sys.exit(1 if regressions and args.fail_on_regression else 0)
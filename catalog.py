@@ -0,0 +1,211 @@
+"""
+This module lists the levels in the `levels` folder without importing them, and builds their circuits only when asked.
+
+Importing a level module builds its circuit (and imports `qiskit` and `matplotlib`), and every game then unrolls it, so
+the first time a level is loaded its native gate circuit (as the tables of numbers of `Engine.circuit_tables`) and
+metadata are saved in a cache on disk, keyed by a hash of the level's source. Loading it again (in any process) only
+reads the cache, without importing `qiskit`, e.g.
+
+    for level in levels():              # only lists the files
+        print(level.name, level.info()['num_cnots'])
+    game = level_by_number(5).game()    # the same game as `Level5()`
+"""
+
+import glob
+import hashlib
+import importlib.metadata
+import importlib.util
+import json
+import os
+import pickle
+import re
+from functools import lru_cache
+
+
+LEVELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'levels')
+CACHE_DIR = '.cache'  # inside the directory of the levels, so that each directory of levels has its own cache
+
+# changing what is cached must change this, so that old cache files are not used
+CACHE_VERSION = 2
+
+# the modules which the cached circuits depend on (the unrolling in `engine`, the helpers in `util` which levels build
+# their architectures with, and the base class of the levels in `game`), whose source is part of the key of the cache
+DEPENDENCIES = ('engine.py', 'util.py', 'game.py')
+
+
+class Level:
+    """
+        A level of the game, i.e. a file `level_<number>.py` in the `levels` folder which defines `circ` and `arc`.
+        Nothing is imported or built until `load` (or `info`, `engine` or `game`) is called.
+    """
+
+    def __init__(self, number, path, cache_dir=CACHE_DIR):
+        """
+
+        :param number:      The number of the level.
+        :param path:        The path of the level's module.
+        :param cache_dir:   The directory of the cache, relative to the directory of the module (or absolute).
+        """
+        self.number = number
+        self.name = 'level_{}'.format(number)
+        self.path = path
+        self.cache_dir = os.path.join(os.path.dirname(os.path.abspath(path)), cache_dir)
+        self._loaded = None
+
+    def __repr__(self):
+        return 'Level({}, {!r})'.format(self.number, self.path)
+
+    @property
+    def title(self):
+        from game import NAME
+        return NAME + ' Level {}'.format(self.number)
+
+    def key(self):
+        """
+        Returns the hash of the level's source, together with everything else which changes the cached circuit: the
+        source of the modules in `DEPENDENCIES`, `CACHE_VERSION` and the version of `qiskit`.
+        """
+        digest = hashlib.sha256('{} {} {}'.format(CACHE_VERSION, _qiskit_version(), _dependencies_hash()).encode())
+        with open(self.path, 'rb') as file:
+            digest.update(file.read())
+        return digest.hexdigest()
+
+    def cache_file(self, extension='.pickle'):
+        """
+        The circuit is cached in a pickle file, and the metadata (see `info`) in a JSON file beside it.
+        """
+        return os.path.join(self.cache_dir, '{}_{}{}'.format(self.name, self.key()[:16], extension))
+
+    def load(self):
+        """
+        Returns the level as a dictionary with the keys 'tables' (the circuit in native gate form, see
+        `Engine.circuit_tables`), 'architecture' and the metadata in `info`. The level is read from the cache if it
+        is there, otherwise it is built and cached.
+        """
+        if self._loaded is not None:
+            return self._loaded
+
+        cache_file = self.cache_file()
+        if os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'rb') as file:
+                    self._loaded = pickle.load(file)
+                return self._loaded
+            except Exception:  # an unreadable cache file is built again
+                pass
+
+        self._loaded = self.build()
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        for old in glob.glob(os.path.join(self.cache_dir, self.name + '_*')):
+            os.remove(old)  # from older versions of the level
+        _write_atomic(cache_file, pickle.dumps(self._loaded))
+        _write_atomic(self.cache_file('.json'), json.dumps(self._info(self._loaded)).encode())
+        return self._loaded
+
+    def build(self):
+        """
+        Imports the level module and unrolls its circuit, without the cache.
+        """
+        from engine import Engine
+
+        spec = importlib.util.spec_from_file_location(self.name, self.path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+
+        engine = Engine(module.circ, module.arc)
+        return {
+                'tables': engine.circuit_tables(),
+                'architecture': engine.arc,
+                'num_circuit_qubits': engine.num_circuit_qubits,
+                'num_arc_qubits': engine.num_arc_qubits,
+                'num_gates': len(engine.gate_ops),
+                'num_cnots': engine.cnot_gates_in_initial_circ,
+                }
+
+    def info(self):
+        """
+        Returns the metadata of the level: 'num_circuit_qubits', 'num_arc_qubits', 'num_gates' and 'num_cnots'. Once
+        the level is cached this only reads a small JSON file, so it does not even import `qiskit`.
+        """
+        if self._loaded is None:
+            try:
+                with open(self.cache_file('.json'), 'r') as file:
+                    return json.load(file)
+            except (OSError, ValueError):
+                pass
+        return self._info(self.load())
+
+    @staticmethod
+    def _info(loaded):
+        return {key: value for key, value in loaded.items() if key not in ('tables', 'architecture')}
+
+    def engine(self):
+        """
+        Returns a new `Engine` on the level. Once the level is cached, this does not import `qiskit` (see
+        `Engine.from_tables`).
+        """
+        from engine import Engine
+        loaded = self.load()
+        return Engine.from_tables(loaded['tables'], loaded['architecture'])
+
+    def game(self, **kwargs):
+        """
+        Returns a new `Game` on the level, as the level's own class would make it. The keyword arguments are passed
+        on to `Game`, e.g. `output_filename`.
+        """
+        from game import Game
+        engine = self.engine()
+        kwargs.setdefault('title', self.title)
+        return Game(engine.initial_circ, engine.arc, native=True, **kwargs)
+
+
+def levels(directory=LEVELS_DIR, cache_dir=CACHE_DIR):
+    """
+    Returns the levels in `directory`, in order of their number, without importing any of them.
+    """
+    found = []
+    for path in glob.glob(os.path.join(directory, 'level_*.py')):
+        match = re.fullmatch(r'level_(\d+)\.py', os.path.basename(path))
+        if match:
+            found.append(Level(int(match.group(1)), path, cache_dir=cache_dir))
+    return sorted(found, key=lambda level: level.number)
+
+
+def level_by_number(number, directory=LEVELS_DIR, cache_dir=CACHE_DIR):
+    """
+    Returns the level `number` in `directory`.
+    """
+    path = os.path.join(directory, 'level_{}.py'.format(number))
+    if not os.path.exists(path):
+        raise ValueError('There is no level {}.'.format(number))
+    return Level(number, path, cache_dir=cache_dir)
+
+
+@lru_cache(maxsize=None)
+def _dependencies_hash():
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in DEPENDENCIES:
+        with open(os.path.join(directory, name), 'rb') as file:
+            contents = file.read()
+        digest.update(str(len(contents)).encode())
+        digest.update(contents)
+    return digest.hexdigest()
+
+
+def _qiskit_version():
+    # read from the installed package, since importing `qiskit` is slow
+    for package in ('qiskit-terra', 'qiskit'):
+        try:
+            return importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            pass
+    return None
+
+
+def _write_atomic(filename, data):
+    temporary = '{}.{}'.format(filename, os.getpid())
+    with open(temporary, 'wb') as file:
+        file.write(data)
+    os.replace(temporary, filename)  # so that other processes never see a half written file
@@ -0,0 +1,758 @@
+"""
+This module defines the Engine class, which holds the state of a game of Swaperation without any plotting.
+
+The `Game` class in `game.py` is a view over an `Engine`: all the rules (swapping, advancing gates, scoring)
+live here, so a routing session can be driven from scripts or tests at CPU speed, e.g.
+
+    engine = Engine(circuit, architecture)
+    engine.apply_swap(0, 1)
+    engine.advance()
+    ...
+    engine.result()
+
+Every move is recorded in `engine.moves`, so moves can be undone (`undo`) and redone (`redo`), and the game can be
+replayed up to any move (`replay`).
+
+By default the gates are done strictly in the order of the circuit. With `front_layer=True` the engine instead tracks
+the front layer of the circuit's dependency graph (the gates whose earlier gates on the same qubits are all done), and
+each "Next Gate" does every gate of the front layer which lies on the architecture, repeatedly, so a CNOT which is
+blocked no longer holds up the gates on other qubits.
+"""
+
+import hashlib
+import os
+from array import array
+from collections import OrderedDict
+
+from util import Permutation
+
+
+NATIVE_GATES = ['id', 'u1', 'u2', 'u3', 'cx']
+
+# the most recently unrolled circuits, by their fingerprint (see `unroll`)
+UNROLL_CACHE_SIZE = 32
+_unrolled = OrderedDict()
+
+# the attributes computed from the circuit and the architecture, which are shared by `Engine.new_game`
+TABLES = ('_circuit', 'front_layer', 'arc', 'arc_edges', 'num_circuit_qubits', 'num_arc_qubits', 'num_qubits',
+          'gate_names', 'gate_ops', 'gate_q0', 'gate_q1', 'circuit_pairs', 'first_cnot_index',
+          'cnot_gates_in_initial_circ', 'cnot_ranks', 'wires')
+
+# the kinds of moves in the log of moves
+SWAP = 'swap'
+ADVANCE = 'advance'
+
+
+class Engine:
+    """
+        The state of a single game: the input circuit, the architecture, the qubit mappings and the output circuit.
+        Qubits on the architecture are called 'physical' and qubits of the input circuit are called 'logical'.
+    """
+
+    def __init__(self, circuit, architecture, native=False, front_layer=False):
+        """
+
+        :param circuit:             A `qiskit.QuantumCircuit` object.
+        :param architecture:        A list of edges as tuples,  e.g. [(1,2), (2,3), (1,3)].
+        :param native:              If `True` the circuit is already in native gate form (e.g. unrolled by an earlier
+                                    game, or loaded from the level cache in `catalog.py`), so it is not checked or
+                                    unrolled, see `unroll`.
+        :param front_layer:         If `True` every gate of the front layer which lies on the architecture is done at
+                                    each advance, rather than only the gates up to the next CNOT (see `advance`).
+        """
+
+        self._start(circuit if native else unroll(circuit), architecture, front_layer=front_layer)
+
+    @classmethod
+    def from_tables(cls, tables, architecture, front_layer=False):
+        """
+        Returns a new game on a circuit given by its tables (see `circuit_tables`), e.g. from the level cache in
+        `catalog.py`. The circuit is only built as `qiskit` objects if it is asked for (e.g. by `final_circ`), so a game
+        can be played and its details read without importing `qiskit`.
+        """
+        engine = cls.__new__(cls)
+        engine._compile_tables(tables['num_circuit_qubits'], tables['gate_names'], tables['gate_ops'], tables['gate_q0'],
+                               tables['gate_q1'], architecture, front_layer, _CircuitSource(tables))
+        engine._new_state()
+        return engine
+
+    def _start(self, native_circuit, architecture, front_layer=False):
+        """
+        Sets up a new game on a circuit which is already in native gate form.
+        """
+        self._compile(native_circuit, architecture, front_layer)
+        self._new_state()
+
+    def _compile(self, native_circuit, architecture, front_layer):
+        """
+        Computes the tables of the circuit and the architecture (`TABLES`), which are never changed by playing.
+        """
+        # the gates of the initial circuit compiled to integers, so that the game is played without any qiskit objects:
+        # gate `i` is `gate_names[gate_ops[i]]` on the logical qubits `gate_q0[i]` and `gate_q1[i]` (-1 if none)
+        gate_names = []
+        gate_ops, gate_q0, gate_q1 = array('B'), array('l'), array('l')
+        gate_objects = []  # the qiskit gates themselves, which are only needed to build the final circuit
+        qubit_indices = {qubit: i for i, qubit in enumerate(native_circuit.qubits)}
+        names = {}
+        for gate, qubits, _ in native_circuit.data:
+            if gate.name not in names:
+                names[gate.name] = len(gate_names)
+                gate_names.append(gate.name)
+            gate_ops.append(names[gate.name])
+            gate_q0.append(qubit_indices[qubits[0]])
+            gate_q1.append(qubit_indices[qubits[1]] if len(qubits) > 1 else -1)
+            gate_objects.append(gate)
+
+        self._compile_tables(native_circuit.num_qubits, gate_names, gate_ops, gate_q0, gate_q1, architecture,
+                             front_layer, _CircuitSource(circuit=native_circuit, gate_objects=gate_objects))
+
+    def _compile_tables(self, num_circuit_qubits, gate_names, gate_ops, gate_q0, gate_q1, architecture, front_layer,
+                        circuit):
+        """
+        Computes the rest of `TABLES` from the gates of the circuit as integers, and `circuit` (a `_CircuitSource`).
+        """
+        self._circuit = circuit
+        self.front_layer = front_layer
+
+        self.arc = list(architecture)  # as a list of edges
+        self.arc_edges = set(self.arc) | set((b, a) for a, b in self.arc)  # for constant time adjacency checks
+
+        self.num_circuit_qubits = num_circuit_qubits
+        self.num_arc_qubits = max([max(x) for x in self.arc])+1
+        self.num_qubits = self.num_arc_qubits
+
+        self.gate_names, self.gate_ops, self.gate_q0, self.gate_q1 = gate_names, gate_ops, gate_q0, gate_q1
+
+        # number of CNOTs on each (ordered) pair of logical qubits, e.g. {(1,2) : 3}
+        self.circuit_pairs = {}
+        self.first_cnot_index = None
+        for i, (a, b) in enumerate(zip(self.gate_q0, self.gate_q1)):  # for each gate
+            if b >= 0:  # if 2 qubit gate
+                if self.first_cnot_index is None:
+                    self.first_cnot_index = i
+
+                self.circuit_pairs[(a, b)] = self.circuit_pairs.get((a, b), 0) + 1
+
+        self.cnot_gates_in_initial_circ = sum(self.circuit_pairs.values())
+
+        # the position of each CNOT among the CNOTs (-1 for the single qubit gates), i.e. its index in `cnot_pairs`
+        self.cnot_ranks = array('l', [-1] * len(self.gate_q1))
+        rank = 0
+        for i, b in enumerate(self.gate_q1):
+            if b >= 0:
+                self.cnot_ranks[i] = rank
+                rank += 1
+
+        if front_layer:
+            # the gates on each logical qubit in order, and the position in it of the first gate not yet done
+            self.wires = [array('l') for _ in range(self.num_circuit_qubits)]
+            for i, (a, b) in enumerate(zip(self.gate_q0, self.gate_q1)):
+                self.wires[a].append(i)
+                if b >= 0:
+                    self.wires[b].append(i)
+
+    @property
+    def initial_circ(self):
+        """
+        The input circuit in native gate form, on the logical qubits.
+        """
+        return self._circuit.circuit()
+
+    def circuit_tables(self):
+        """
+        Returns the initial circuit as tables of numbers (a dictionary of the number of qubits, the global phase, and
+        the name, qubits and parameters of each gate), which can be stored without `qiskit`, see `from_tables`.
+        """
+        circuit = self.initial_circ
+        return {
+                'num_circuit_qubits': self.num_circuit_qubits,
+                'global_phase': float(circuit.global_phase),
+                'gate_names': list(self.gate_names),
+                'gate_ops': self.gate_ops,
+                'gate_q0': self.gate_q0,
+                'gate_q1': self.gate_q1,
+                'gate_params': [tuple(float(x) for x in gate.params) for gate in self._circuit.gate_objects()],
+                }
+
+    def _new_state(self):
+        """
+        Sets up the state of a new game (everything which changes as it is played) on the tables from `_compile`.
+        """
+        # the gates of the final circuit, as triples of the index of the gate in the initial circuit (-1 for the CNOTs of
+        # a swap) and the physical qubits (-1 if none); the final circuit is only built from these when asked for
+        self.final_gates = array('l')
+        self._final_circ = None
+        self._final_circ_length = 0  # the number of entries of `final_gates` in `_final_circ`
+
+        self.num_swaps = 0
+        self.swaps = []  # the swaps (as pairs of physical qubits) made in stage 2, in order
+        self.num_cnots_done = 0
+        self.current_gate_index = 0  # this will loop over the gates
+        self.previous_gate_indices = None
+
+        self.stage = 1  # stage 1 is initial stage, stage 2 is looping over the gates, stage 3 is game over
+
+        # these are the 'circuit qubits' --> 'architecture qubits' mapping
+        # initial mapping is the identity, this will specify the initial layout of qubits
+        self.initial_mapping = Permutation(self.num_arc_qubits)
+        # the current mapping determines how logical CNOTs should be applied onto the current qubits.
+        self.current_mapping = Permutation(self.num_arc_qubits)
+
+        self.remaining_pairs = dict(self.circuit_pairs)  # as `circuit_pairs`, but only counting the CNOTs not yet done
+        if self.front_layer:
+            self.wire_positions = array('l', [0] * self.num_circuit_qubits)
+
+        # every move made, in order, as ('swap', x, y) or ('advance',), see `undo`, `redo` and `replay`
+        self.moves = []
+        self._undo_records = []  # what is needed to undo each move
+        self._redo_moves = []  # the moves undone, most recent last
+
+    def current_gate(self):
+        """
+        Returns the logical qubits of the CNOT that has to be done next, or `None` if the game is over.
+        """
+        if self.stage == 1:
+            i = self.first_cnot_index
+        elif self.stage == 2:
+            i = self.current_gate_index
+        else:
+            return None
+
+        return self.gate_q0[i], self.gate_q1[i]
+
+    def physical(self, gate):
+        """
+        Returns the physical qubits that the logical qubits of `gate` currently lie on.
+        """
+        return self.current_mapping(gate[0]), self.current_mapping(gate[1])
+
+    def is_adjacent(self, x, y):
+        """
+        Checks if the physical qubits `x` and `y` are connected on the architecture.
+        """
+        return (x, y) in self.arc_edges
+
+    def current_cnot(self):
+        """
+        Returns the position of the current gate among the CNOTs (see `router.cnot_pairs`), or `None` if the game is
+        over. In order, this is the number of CNOTs done.
+        """
+        gate = self.first_cnot_index if self.stage == 1 else self.current_gate_index
+        return self.cnot_ranks[gate] if self.stage != 3 else None
+
+    def is_legal(self, gate=None):
+        """
+        Checks if a CNOT on the logical qubits `gate` lies on the architecture under the current mapping.
+        If `gate` is `None` then the current gate is checked, or with `front_layer` every CNOT in the front layer (so
+        that the game can advance if any of them lies on the architecture).
+        """
+        if gate is None and self.front_layer and self.stage != 3:
+            return any(self.is_legal(self.gate_pair(i)) for i in self.front_cnots())
+        if gate is None:
+            gate = self.current_gate()
+            if gate is None:
+                return False
+
+        return self.is_adjacent(*self.physical(gate))
+
+    def gate_pair(self, i):
+        return self.gate_q0[i], self.gate_q1[i]
+
+    def front_cnots(self):
+        """
+        Returns the indices of the CNOTs in the front layer, i.e. the first gate not yet done on both of their qubits
+        (with `front_layer`, the single qubit gates in the front layer are always done straight away).
+        """
+        q0 = self.gate_q0
+        front = []
+        for a in range(self.num_circuit_qubits):
+            i = self._next_cnot(a)
+            if i >= 0 and q0[i] == a and self._next_cnot(self.gate_q1[i]) == i:
+                front.append(i)
+        return front
+
+    def _next_cnot(self, a):
+        """
+        Returns the index of the first CNOT not yet done on the logical qubit `a` (-1 if none). The single qubit gates
+        before it are skipped, since they never block it.
+        """
+        wire, q1 = self.wires[a], self.gate_q1
+        position = self.wire_positions[a]
+        while position < len(wire) and q1[wire[position]] < 0:
+            position += 1
+        return wire[position] if position < len(wire) else -1
+
+    def relabel_circuit(self, x, y):
+        """
+        Swaps the logical qubits on the physical qubits `x` and `y`.
+        """
+        self.current_mapping.transpose(x, y)
+
+        if self.stage == 1:  # update initial mapping only if in initial stage
+            self.initial_mapping.transpose(x, y)
+
+    def apply_swap(self, x, y):
+        """
+        Swaps the physical qubits `x` and `y`. In stage 1 any two qubits can be swapped for free (this relabels the
+        circuit), in stage 2 they must be connected on the architecture and a swap gate is added to the final circuit.
+
+        :return: `True` if the swap was made, `False` if it was not allowed.
+        """
+        if self.stage == 3 or (self.stage == 2 and not self.is_adjacent(x, y)):
+            return False
+
+        self._record((SWAP, x, y), self.stage)
+
+        if self.stage != 1:  # add a swap gate to the new circuit
+            self.final_gates.extend((-1, x, y, -1, y, x, -1, x, y))
+
+            self.num_swaps += 1
+            self.swaps.append((x, y))
+
+        self.relabel_circuit(x, y)
+        return True
+
+    def set_initial_mapping(self, mapping):
+        """
+        Relabels the qubits (which is only allowed in stage 1) so that each logical qubit `i` lies on the physical
+        qubit `mapping(i)`.
+
+        :param mapping:     A `Permutation`, or a list of the physical qubit of each logical qubit.
+        :return: `True` if the qubits were relabelled, `False` if not in stage 1.
+        """
+        if self.stage != 1:
+            return False
+
+        if not isinstance(mapping, Permutation):
+            mapping = Permutation(mapping)
+
+        for logical in range(self.num_arc_qubits):
+            physical = self.current_mapping(logical)
+            if physical != mapping(logical):
+                self.apply_swap(physical, mapping(logical))
+
+        return True
+
+    def advance(self):
+        """
+        Does the current gate (and all single qubit gates up to the next CNOT), as happens when the "Next Gate"
+        button is pressed. If the next CNOT acts on the same logical qubits as the one just done, it is also done.
+        With `front_layer`, does every gate in the front layer which lies on the architecture, until there are none
+        left, and the current gate becomes the first CNOT (in the order of the circuit) of the new front layer.
+
+        :return: `True` if the gate was done, `False` if it does not lie on the architecture (or the game is over).
+        """
+        if not self.is_legal():
+            return False
+
+        if self.front_layer:
+            self._advance_front_layer()
+            return True
+
+        self._record((ADVANCE,), (self.stage, self.current_gate_index, self.previous_gate_indices, len(self.final_gates)))
+
+        while True:
+            self._advance()
+
+            if self.stage == 3:
+                return True
+
+            next_gate_indices = self.current_gate()
+            if self.previous_gate_indices != next_gate_indices and self.previous_gate_indices[::-1] != next_gate_indices:
+                return True
+
+    def _advance(self):
+        q0, q1, final_gates, mapping = self.gate_q0, self.gate_q1, self.final_gates, self.current_mapping
+
+        if self.stage == 1:
+            # the single qubit gates before the first CNOT
+            for i in range(self.current_gate_index, self.first_cnot_index):
+                final_gates.extend((i, mapping(q0[i]), -1))
+            self.current_gate_index = self.first_cnot_index
+            self.stage = 2
+
+        i = self.current_gate_index
+        gate_indices = (q0[i], q1[i])
+        self.previous_gate_indices = gate_indices
+
+        self.remaining_pairs[gate_indices] -= 1
+        self.num_cnots_done += 1
+        final_gates.extend((i, mapping(q0[i]), mapping(q1[i])))
+        i += 1
+
+        # add gates to new circuit and get next 2 qubit gate
+        num_gates = len(q0)
+        while i < num_gates and q1[i] < 0:
+            final_gates.extend((i, mapping(q0[i]), -1))
+            i += 1
+        self.current_gate_index = i
+
+        if i == num_gates:
+            self.stage = 3  # no more gates left -- end of game
+
+    def _advance_front_layer(self):
+        q0, q1, final_gates, mapping = self.gate_q0, self.gate_q1, self.final_gates, self.current_mapping
+        wires, positions = self.wires, self.wire_positions
+        done = array('l')  # the gates done, in order, to undo them
+        self._record((ADVANCE,), (self.stage, self.current_gate_index, self.previous_gate_indices, len(final_gates),
+                                  done))
+
+        # the qubits whose first gate not yet done might now be possible
+        qubits = list(range(self.num_circuit_qubits))
+        while qubits:
+            a = qubits.pop()
+            if positions[a] == len(wires[a]):
+                continue
+            i = wires[a][positions[a]]
+            b = q1[i]
+            if b < 0:
+                final_gates.extend((i, mapping(a), -1))
+            else:
+                other = b if a == q0[i] else q0[i]
+                if positions[other] == len(wires[other]) or wires[other][positions[other]] != i:
+                    continue  # waiting for an earlier gate on the other qubit
+                if not self.is_adjacent(mapping(q0[i]), mapping(b)):
+                    continue
+                final_gates.extend((i, mapping(q0[i]), mapping(b)))
+                self.remaining_pairs[(q0[i], b)] -= 1
+                self.num_cnots_done += 1
+                positions[other] += 1
+                qubits.append(other)
+            positions[a] += 1
+            qubits.append(a)
+            done.append(i)
+
+        front = self.front_cnots()
+        if front:
+            self.stage = 2
+            self.current_gate_index = min(front)
+        else:
+            self.stage = 3  # no more gates left -- end of game
+            self.current_gate_index = len(q0)
+
+    @property
+    def final_circ(self):
+        """
+        The output circuit, on the architecture qubits. It is built from `final_gates` when asked for, and afterwards
+        only the gates added since are appended to it.
+        """
+        if self._final_circ is None or self._final_circ_length > len(self.final_gates):
+            from qiskit import QuantumCircuit
+            # final circuit will be on the number of architecture qubits (if different from input circuit number of qubits).
+            self._final_circ = QuantumCircuit(self.num_arc_qubits)
+            self._final_circ_length = 0
+
+        circuit, final_gates, gate_objects = self._final_circ, self.final_gates, self._circuit.gate_objects()
+        if self._final_circ_length == len(final_gates):
+            return circuit
+
+        from qiskit.circuit.library.standard_gates.x import CXGate
+        qubits = circuit.qubits
+        cx = CXGate()
+        for j in range(self._final_circ_length, len(final_gates), 3):
+            i, p0, p1 = final_gates[j], final_gates[j + 1], final_gates[j + 2]
+            if i < 0:
+                circuit._append(cx, [qubits[p0], qubits[p1]], [])
+            elif p1 < 0:
+                circuit._append(gate_objects[i], [qubits[p0]], [])
+            else:
+                circuit._append(gate_objects[i], [qubits[p0], qubits[p1]], [])
+        self._final_circ_length = len(final_gates)
+
+        return circuit
+
+    def _record(self, move, undo_record):
+        self.moves.append(move)
+        self._undo_records.append(undo_record)
+        self._redo_moves.clear()  # a new move replaces the moves which were undone
+
+    def undo(self):
+        """
+        Takes back the last move, by popping the gates it added to the final circuit and swapping the qubits back
+        (nothing is recomputed).
+
+        :return: `True` if a move was undone, `False` if there are no moves to undo.
+        """
+        if not self.moves:
+            return False
+
+        move = self.moves.pop()
+        record = self._undo_records.pop()
+
+        if move[0] == SWAP:
+            x, y = move[1:]
+            stage = record
+            if stage != 1:
+                del self.final_gates[-9:]
+                self.num_swaps -= 1
+                self.swaps.pop()
+            self.current_mapping.transpose(x, y)
+            if stage == 1:
+                self.initial_mapping.transpose(x, y)
+        elif self.front_layer:
+            stage, gate_index, previous_gate_indices, num_final_gates, done = record
+            for i in done:
+                self.wire_positions[self.gate_q0[i]] -= 1
+                if self.gate_q1[i] >= 0:
+                    self.wire_positions[self.gate_q1[i]] -= 1
+                    self.remaining_pairs[(self.gate_q0[i], self.gate_q1[i])] += 1
+                    self.num_cnots_done -= 1
+            del self.final_gates[num_final_gates:]
+            self.stage = stage
+            self.current_gate_index = gate_index
+            self.previous_gate_indices = previous_gate_indices
+        else:
+            stage, gate_index, previous_gate_indices, num_final_gates = record
+            for i in range(gate_index, self.current_gate_index):
+                if self.gate_q1[i] >= 0:
+                    self.remaining_pairs[(self.gate_q0[i], self.gate_q1[i])] += 1
+                    self.num_cnots_done -= 1
+            del self.final_gates[num_final_gates:]
+            self.stage = stage
+            self.current_gate_index = gate_index
+            self.previous_gate_indices = previous_gate_indices
+
+        if self._final_circ_length > len(self.final_gates):
+            self._final_circ = None  # the gates undone are in the final circuit, which has to be built again
+
+        self._redo_moves.append(move)
+        return True
+
+    def redo(self):
+        """
+        Makes the last move undone again.
+
+        :return: `True` if a move was redone, `False` if there are no moves to redo.
+        """
+        if not self._redo_moves:
+            return False
+
+        redo_moves = self._redo_moves  # kept, as making the move clears the moves to redo
+        move = redo_moves.pop()
+        self._redo_moves = []
+        self.play_move(move)
+        self._redo_moves = redo_moves
+        return True
+
+    def play_move(self, move):
+        """
+        Makes a move, as recorded in `moves`.
+
+        :return: `True` if the move was made, `False` if it was not allowed.
+        """
+        if move[0] == SWAP:
+            return self.apply_swap(*move[1:])
+        elif move[0] == ADVANCE:
+            return self.advance()
+        raise ValueError('Unknown move {}.'.format(move))
+
+    def replay(self, moves=None, num_moves=None):
+        """
+        Plays moves from the start of the game on a new engine, reusing the (already unrolled) circuit of this one. This
+        rebuilds the state of the game after any number of moves, or its output after engine changes.
+
+        :param moves:       The moves to play, by default the moves made on this engine.
+        :param num_moves:   The number of moves to play, by default all of them.
+        :return: The new `Engine`.
+        """
+        moves = self.moves if moves is None else moves
+        engine = self.new_game()
+        for move in moves[:num_moves]:
+            if not engine.play_move(move):
+                raise ValueError('The move {} is not allowed.'.format(move))
+        return engine
+
+    def new_game(self):
+        """
+        Returns a new engine at the start of the same game, which shares the tables of this one (`TABLES`, which are
+        never changed by playing), so it only needs the memory of its own state. This is how many games of the same
+        level are played at once, e.g. by `server.py`.
+        """
+        engine = Engine.__new__(Engine)
+        for name in TABLES:
+            if hasattr(self, name):
+                setattr(engine, name, getattr(self, name))
+        engine._new_state()
+        return engine
+
+    def snapshot(self):
+        """
+        Returns a copy of the state of the game (everything which changes as it is played), see `restore`.
+        """
+        return {
+                'stage': self.stage,
+                'num_swaps': self.num_swaps,
+                'swaps': list(self.swaps),
+                'num_cnots_done': self.num_cnots_done,
+                'current_gate_index': self.current_gate_index,
+                'previous_gate_indices': self.previous_gate_indices,
+                'initial_mapping': self.initial_mapping.copy(),
+                'current_mapping': self.current_mapping.copy(),
+                'remaining_pairs': dict(self.remaining_pairs),
+                'final_gates': array('l', self.final_gates),
+                'moves': list(self.moves),
+                'undo_records': list(self._undo_records),
+                'redo_moves': list(self._redo_moves),
+                'wire_positions': array('l', self.wire_positions) if self.front_layer else None,
+                }
+
+    def restore(self, snapshot):
+        """
+        Returns the game to the state in `snapshot` (taken by `snapshot`), keeping the unrolled circuit and the tables
+        computed from it. The snapshot is not changed, so it can be restored again.
+        """
+        self.stage = snapshot['stage']
+        self.num_swaps = snapshot['num_swaps']
+        self.swaps = list(snapshot['swaps'])
+        self.num_cnots_done = snapshot['num_cnots_done']
+        self.current_gate_index = snapshot['current_gate_index']
+        self.previous_gate_indices = snapshot['previous_gate_indices']
+        self.initial_mapping = snapshot['initial_mapping'].copy()
+        self.current_mapping = snapshot['current_mapping'].copy()
+        self.remaining_pairs = dict(snapshot['remaining_pairs'])
+        self.final_gates = array('l', snapshot['final_gates'])
+        self._final_circ = None
+        self.moves = list(snapshot['moves'])
+        self._undo_records = list(snapshot['undo_records'])
+        self._redo_moves = list(snapshot['redo_moves'])
+        if self.front_layer:
+            self.wire_positions = array('l', snapshot['wire_positions'])
+
+    def gates_remaining(self):
+        return self.cnot_gates_in_initial_circ - self.num_cnots_done
+
+    def result(self, optimize=False):
+        """
+        Returns the output of the game as a dictionary; the 'details' are exactly what is saved by `save`.
+
+        :param optimize:    If `True`, the final circuit is shortened by `peephole.optimize`, and the details also have
+                            'optimized' (`True`) and 'peephole' (its report).
+        """
+        final_circ, details = self.final_circ, self.details()
+        if optimize:
+            from peephole import optimize as peephole_optimize
+            final_circ, report = peephole_optimize(final_circ)
+            details.update(optimized=True, peephole=report)
+        return {
+                'final_circuit': final_circ,
+                'details': details,
+                }
+
+    def details(self):
+        return {
+                'num_circuit_qubits': self.num_circuit_qubits,
+                'num_arc_qubits': self.num_arc_qubits,
+                'architecture': self.arc,
+                'initial_mapping': self.initial_mapping.to_list(),
+                'final_mapping': self.current_mapping.to_list(),
+                'num_swaps': self.num_swaps,
+                'swaps': list(self.swaps),
+                }
+
+    def save(self, output_filename, output_dir=None, optimize=False):
+        """
+        Saves the initial and final circuits (as QASM) and the details of the game to `output_dir`. If `optimize` is
+        `True` the final circuit is shortened first, see `result`.
+        """
+        output_dir = output_dir if output_dir is not None else ''
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+        self.initial_circ.qasm(filename=os.path.join(output_dir, 'initial_circuit_{}.txt'.format(output_filename)))
+        result = self.result(optimize=optimize)
+        result['final_circuit'].qasm(filename=os.path.join(output_dir, 'final_circuit_{}.txt'.format(output_filename)))
+
+        details = result['details']
+        with open(os.path.join(output_dir, 'details_' + output_filename + '.txt'), 'w') as f:
+            f.write(str(details))
+
+        return details
+
+
+class _CircuitSource:
+    """
+        The initial circuit of a game as `qiskit` objects, shared by every game on it (see `Engine.new_game`). A circuit
+        given by its tables (see `Engine.from_tables`) is only built when it is first asked for.
+    """
+
+    __slots__ = ('tables', '_circuit', '_gate_objects')
+
+    def __init__(self, tables=None, circuit=None, gate_objects=None):
+        self.tables = tables
+        self._circuit = circuit
+        self._gate_objects = gate_objects
+
+    def circuit(self):
+        if self._circuit is None:
+            from qiskit import QuantumCircuit
+            from qiskit.circuit.library.standard_gates import get_standard_gate_name_mapping
+
+            gate_classes = {name: type(gate) for name, gate in get_standard_gate_name_mapping().items()}
+            tables = self.tables
+            circuit = QuantumCircuit(tables['num_circuit_qubits'], global_phase=tables['global_phase'])
+            qubits, names = circuit.qubits, tables['gate_names']
+            for op, q0, q1, params in zip(tables['gate_ops'], tables['gate_q0'], tables['gate_q1'],
+                                          tables['gate_params']):
+                gate_qubits = [qubits[q0]] if q1 < 0 else [qubits[q0], qubits[q1]]
+                circuit._append(gate_classes[names[op]](*params), gate_qubits, [])
+            self._circuit = circuit
+        return self._circuit
+
+    def gate_objects(self):
+        if self._gate_objects is None:
+            self._gate_objects = [gate for gate, _, _ in self.circuit().data]
+        return self._gate_objects
+
+
+def unroll(circuit):
+    """
+    Returns `circuit` in native gate form (`NATIVE_GATES`). A circuit which is already native is returned as it is,
+    with its gates in their original order, and other circuits are unrolled by `qiskit`, which is slow for large
+    circuits, so the most recent results are kept by the fingerprint of the circuit (see `circuit_fingerprint`). The
+    circuit returned may be shared, so it must not be modified.
+    """
+    if set(circuit.count_ops()) <= set(NATIVE_GATES):
+        return circuit
+
+    fingerprint = circuit_fingerprint(circuit)
+    if fingerprint in _unrolled:
+        _unrolled.move_to_end(fingerprint)
+        return _unrolled[fingerprint]
+
+    # the transpiler is only imported when there is something to unroll
+    from qiskit.transpiler import PassManager
+    from qiskit.transpiler.passes import Unroller
+
+    pass_ = Unroller(NATIVE_GATES)
+    pm = PassManager(pass_)
+    native_circuit = pm.run(circuit)
+
+    _unrolled[fingerprint] = native_circuit
+    if len(_unrolled) > UNROLL_CACHE_SIZE:
+        _unrolled.popitem(last=False)
+    return native_circuit
+
+
+def circuit_fingerprint(circuit):
+    """
+    Returns a hash of everything in `circuit` which changes its unrolled form: the registers, the global phase and each
+    instruction (its name, parameters, condition and bits). The definitions of gates which are not from the standard
+    library (e.g. made with `to_gate`) are included too, since gates with the same name can have different definitions.
+    """
+    digest = hashlib.sha256(repr((circuit.qregs, circuit.cregs, circuit.global_phase)).encode())
+    _update_fingerprint(digest, circuit)
+    return digest.hexdigest()
+
+
+def _update_fingerprint(digest, circuit):
+    bit_indices = {bit: i for i, bit in enumerate(circuit.qubits)}
+    bit_indices.update({bit: -1 - i for i, bit in enumerate(circuit.clbits)})
+    for instruction in circuit.data:
+        operation = instruction.operation
+        digest.update(repr((operation.name, operation.params, getattr(operation, 'condition', None),
+                            [bit_indices[bit] for bit in instruction.qubits],
+                            [bit_indices[bit] for bit in instruction.clbits])).encode())
+        if not type(operation).__module__.startswith('qiskit.circuit.library') and operation.definition is not None:
+            digest.update(b'(')
+            _update_fingerprint(digest, operation.definition)
+            digest.update(b')')
@@ -1,21 +1,16 @@
 """
 This is the main module in which we define the Game class.
+
+`networkx` and `matplotlib` are only imported when a game is made (and `qiskit` only when a circuit is unrolled or
+output, see `engine.py`), so importing this module is cheap for scripts which only need its constants.
 """
 
-import os
 import time
-import networkx as nx
-import matplotlib.pyplot as plt
-
-from qiskit import QuantumRegister, QuantumCircuit
-from qiskit.circuit.quantumregister import Qubit
-from qiskit.circuit.library.standard_gates.u1 import U1Gate
-from qiskit.circuit.library.standard_gates.u2 import U2Gate
-from qiskit.circuit.library.standard_gates.u3 import U3Gate
-from qiskit.transpiler import PassManager
-from qiskit.transpiler.passes import Unroller
+from functools import lru_cache
 
-from util import compose
+from engine import Engine
+from profiling import Profiler
+from util import GridIndex, row_layout
 
 
 BASE_NODE_COLOR = 'seagreen'
@@ -27,15 +22,145 @@ ARCHITECTURE_EDGE_COLOR = 'r'
 
 NAME = "Swaperation"
 
+# the regions of the board (in data coordinates) which respond to clicks
+NODE_RADIUS = 0.003**0.5
+BUTTON_RADIUS = 0.03**0.5
+NEXT_GATE_BUTTON = 'next gate'
+RESET_BUTTON = 'reset'
+
+UNDO_KEYS = ('z', 'ctrl+z')
+REDO_KEYS = ('y', 'ctrl+y')
+
+# the methods timed when profiling (see `profiling.py`), and the event handlers which also get latency histograms
+PROFILED_METHODS = ('plot', 'create_artists', 'update_artists', 'next_gate', 'swap_nodes', 'gates_remaining', 'reset',
+                    'undo', 'redo')
+PROFILED_HANDLERS = ('onClick', 'onKey')
+
+
+# boards with more qubits than this are laid out like the architecture (see `board_layout`), rather than on a circle
+CIRCULAR_MAX_QUBITS = 20
+LAYOUTS = ('circular', 'rows', 'spring')
+
+# the nodes of a board which is not circular are fitted into this box (x min, x max, y min, y max), clear of the buttons
+BOARD_BOX = (-0.95, 0.95, -0.7, 0.78)
+
+# with more pairs of qubits in the circuit than this, both directions of a pair are drawn as one thinner edge
+DETAILED_CIRCUIT_EDGES = 200
+
+# on boards with more qubits than this, only the nodes which are highlighted or in the current gate are labelled, as
+# drawing hundreds of labels after every click would make the board too slow
+LABELLED_MAX_QUBITS = 100
+
+# the limits of both axes of a board which is not circular, which are those of a circular board
+BOARD_LIMITS = (-1.21, 1.21)
+
+
+def resolve_layout(num_qubits, architecture=None, layout=None):
+    """
+    Returns the layout of a board (see `board_layout`) which `layout=None` stands for: 'circular' up to
+    `CIRCULAR_MAX_QUBITS` qubits, otherwise 'rows' if the architecture is a grid or heavy hex, otherwise 'spring'.
+    """
+    if layout is not None:
+        if isinstance(layout, str) and layout not in LAYOUTS:
+            raise ValueError('Unknown layout {!r}, the layouts are {}.'.format(layout, ', '.join(LAYOUTS)))
+        return layout
+    if num_qubits <= CIRCULAR_MAX_QUBITS or architecture is None:
+        return 'circular'
+    return 'rows' if row_layout(architecture) is not None else 'spring'
+
+
+@lru_cache(maxsize=None)
+def board_layout(num_qubits, architecture=None, layout=None):
+    """
+    Returns the positions of the nodes on the board, as a dictionary {node: array([x, y])}.
+    This is shared between all games on the same board, so it must not be modified.
+
+    :param num_qubits:      The number of qubits of the architecture.
+    :param architecture:    The architecture as a tuple of edges, which every layout but 'circular' needs.
+    :param layout:          'circular', 'rows' (for grid and heavy hex architectures, see `util.row_layout`),
+                            'spring', a tuple of the (x, y) coordinates of each node, or `None` (see `resolve_layout`).
+                            Every layout but 'circular' is fitted into `BOARD_BOX`.
+    """
+    import networkx as nx
+    import numpy as np
+
+    layout = resolve_layout(num_qubits, architecture, layout)
+    if layout == 'circular':
+        return nx.circular_layout(range(num_qubits))
+
+    if layout == 'rows':
+        positions = row_layout(architecture)
+        if positions is None:
+            raise ValueError('The architecture is not made of rows of qubits, see `util.row_layout`.')
+    elif layout == 'spring':
+        graph = nx.Graph()
+        graph.add_nodes_from(range(num_qubits))
+        graph.add_edges_from(architecture)
+        positions = nx.spring_layout(graph, seed=0)
+    else:
+        positions = dict(enumerate(layout))
+
+    coordinates = np.array([positions[q] for q in range(num_qubits)], dtype=float)
+    x_min, x_max, y_min, y_max = BOARD_BOX
+    for axis, (low, high) in enumerate([(x_min, x_max), (y_min, y_max)]):
+        values = coordinates[:, axis]
+        span = values.max() - values.min()
+        if span > 0:
+            coordinates[:, axis] = low + (values - values.min()) * (high - low) / span
+        else:
+            coordinates[:, axis] = (low + high) / 2
+    return {q: coordinates[q] for q in range(num_qubits)}
+
+
+@lru_cache(maxsize=None)
+def board_node_radius(num_qubits, architecture=None, layout=None):
+    """
+    Returns the radius of the nodes on the board (in data coordinates): `NODE_RADIUS` on a circular board, and on
+    other boards small enough that the nodes do not overlap.
+    """
+    import numpy as np
+
+    if resolve_layout(num_qubits, architecture, layout) == 'circular':
+        return NODE_RADIUS
+    coordinates = np.array(list(board_layout(num_qubits, architecture, layout).values()))
+    closest = np.inf
+    for i in range(len(coordinates) - 1):  # a row at a time, so only O(n) memory is needed
+        closest = min(closest, np.hypot(*(coordinates[i + 1:] - coordinates[i]).T).min())
+    return min(NODE_RADIUS, 0.45 * closest)
+
+
+@lru_cache(maxsize=None)
+def board_click_index(num_qubits, architecture=None, layout=None):
+    """
+    Returns a `GridIndex` of the clickable regions of the board: the buttons and the nodes.
+    """
+    radius = board_node_radius(num_qubits, architecture, layout)
+    index = GridIndex(cell_size=radius)
+
+    index.insert(NEXT_GATE_BUTTON, 0.9, -1, BUTTON_RADIUS)
+    if num_qubits == 3:
+        index.insert(RESET_BUTTON, -0.04, -0.9, BUTTON_RADIUS)
+    else:
+        index.insert(RESET_BUTTON, -1, -1, BUTTON_RADIUS)
+
+    for node, (x, y) in board_layout(num_qubits, architecture, layout).items():
+        index.insert(node, x, y, radius)
+
+    return index
+
 
 class Game:
     """
         The main class representing the game.
         The `plot` function renders the current game as a graph, via an interactive `matplotlib` plot, and the
         `onClick` function handles all of the events (from clicking).
+
+        The state of the game (and all of its rules) is held by an `Engine` (see `engine.py`), `Game` is just a view.
     """
-    
-    def __init__(self, circuit, architecture, title=None, output_filename=None, output_dir=None, best_score=None):
+
+    def __init__(self, circuit, architecture, title=None, output_filename=None, output_dir=None, best_score=None,
+                 incremental=True, profile=False, native=False, front_layer=False,
+                 optimize_output=False, layout=None):
         """
 
         :param circuit:             A `qiskit.QuantumCircuit` object.
@@ -47,206 +172,401 @@ class Game:
 
         :param best_score:          This is used when replaying the game or resetting,
                                     to keep track of the best previous score.
+        :param incremental:         If `True` the board is drawn once and only the parts which change are redrawn
+                                    (blitted) after each click, otherwise the whole figure is redrawn every time.
+        :param profile:             If `True` (or a `Profiler`, e.g. to share one between games), the hot paths and the
+                                    latency of each click are recorded in `self.profiler`. If `False` nothing is
+                                    wrapped, so there is no overhead.
+        :param native:              If `True` the circuit is already in native gate form, see `Engine`.
+        :param front_layer:         If `True` "Next Gate" does every gate which lies on the architecture, not only the
+                                    current one, see `Engine`.
+        :param optimize_output:     If `True` the saved final circuit is shortened by `peephole.optimize`, see
+                                    `Engine.save`.
+        :param layout:              Where the nodes are drawn: 'circular', 'rows' (grid and heavy hex architectures),
+                                    'spring', or a dictionary {node: (x, y)}. By default small boards are circular and
+                                    large ones are laid out like the architecture, see `board_layout`.
         """
 
+        import matplotlib.pyplot as plt
+        import networkx as nx
+
         self.title = title if title is not None else NAME
         self.output_filename = output_filename
         self.output_dir = output_dir
+        self.optimize_output = optimize_output
 
-        # put circuit in native gate form
-        pass_ = Unroller(['id', 'u1', 'u2', 'u3', 'cx'])
-        pm = PassManager(pass_)
-        self.initial_circ = pm.run(circuit)
-
-        self.arc = list(architecture)  # as a list of edges
-
-        self.num_circuit_qubits = self.initial_circ.num_qubits
-        self.num_arc_qubits = max([max(x) for x in self.arc])+1
-        self.num_qubits = self.num_arc_qubits
-
-        # final circuit will be on the number of architecture qubits (if different from input circuit number of qubits).
-        self.final_circ = QuantumCircuit(self.num_arc_qubits)
+        self.engine = Engine(circuit, architecture, native=native, front_layer=front_layer)
+        self.initial_state = self.engine.snapshot()  # the state of a new game, which `reset` goes back to
 
         self.reset_pressed = False
-        self.previous_gate_indices = None
         self.best_score = best_score
-        self.num_swaps = 0
         self.message = ""  # this gets displayed at the top left
-        self.cnot_gates_in_initial_circ = len([g for g in self.initial_circ.data if len(g[1]) > 1])
         self.nodes_highlighted = []
         self.node_colors = [BASE_NODE_COLOR]*self.num_arc_qubits
-        self.current_gate_index = 0  # this will loop over the gates
-
-        self.stage = 1  # stage 1 is initial stage, stage 2 is looping over the gates, stage 3 is game over
-
-        # these are the 'circuit qubits' --> 'architecture qubits' mapping
-        # initial mapping is the identity, this will specify the initial layout of qubits
-        self.initial_mapping = lambda t: t
-        # the current mapping determines how logical CNOTs should be applied onto the current qubits.
-        self.current_mapping = lambda z: z
-        
-        self.circuit_edges = {}  # this will be in the form {gate: [width, color]}, e.g. {(1,2) : [5, 'b']}
-        self.first_cnot_index = None
-        for i in range(len(self.initial_circ.data)):  # for each gate
-            g = self.initial_circ.data[i]
-
-            if len(g[1]) > 1:  # if 2 qubit gate
-                if self.first_cnot_index is None:
-                    self.first_cnot_index =i
-
-                k = tuple((g[1][0].index, g[1][1].index))  # get indices
-                if k in self.circuit_edges:
-                    # here we use the function y = 10 - 1/x to approach a line thickness of 15,
-                    # by increasing x by 0.1 for each gate on the same connection
-
-                    x = 1/(10 - self.circuit_edges[k][0])
-                    x += 0.1
-                    y = 10 - 1/x
-                    self.circuit_edges[k][0] = y  # if already present, make line thicker
-                else:
-                    self.circuit_edges[k] = [5, CIRCUIT_EDGE_COLOR]
 
-        first_gate = self.initial_circ.data[self.first_cnot_index]
-        gate_indices = (first_gate[1][0].index, first_gate[1][1].index)
-        self.circuit_edges[gate_indices] = (self.circuit_edges[gate_indices][0], HIGHLIGHTED_CIRCUIT_EDGE_COLOR)
-        if gate_indices[::-1] in self.circuit_edges:
-            self.circuit_edges[gate_indices[::-1]] = [self.circuit_edges[gate_indices[::-1]][0], HIGHLIGHTED_CIRCUIT_EDGE_COLOR]
+        # the architecture graph, which the nodes and the architecture edges are drawn from
+        self.graph = nx.Graph()
+        self.graph.add_nodes_from(range(self.num_arc_qubits))
+        self.graph.add_edges_from(self.arc)
+
+        # the board, which is shared by every game on the same architecture and layout
+        board = (self.num_arc_qubits, tuple(tuple(edge) for edge in self.arc),
+                 layout if layout is None or isinstance(layout, str) else
+                 tuple(tuple(float(x) for x in layout[q]) for q in range(self.num_arc_qubits)))
+        self.layout = resolve_layout(*board)
+        self.pos = board_layout(*board)
+        self.click_index = board_click_index(*board)
+        self.scale = board_node_radius(*board) / NODE_RADIUS  # of the nodes, labels and edges, 1 on circular boards
+
+        # with many pairs of qubits in the circuit, both directions of a pair are drawn as one thinner edge
+        self.aggregate_circuit_edges = len(self.engine.circuit_pairs) > DETAILED_CIRCUIT_EDGES
+        if self.aggregate_circuit_edges:
+            self.circuit_pairs = sorted(set((min(a, b), max(a, b)) for a, b in self.engine.circuit_pairs))
+        else:
+            self.circuit_pairs = list(self.engine.circuit_pairs)
 
-        self.graph = nx.complete_graph(self.num_arc_qubits)  # used as baseline graph for plots
+        self.incremental = incremental
+        self.artists = None  # the artists which get updated when drawing incrementally
+
+        self.profiler = None
+        if profile:
+            self.enable_profiling(profile if isinstance(profile, Profiler) else Profiler())
 
         self.fig, self.ax = plt.subplots(num=self.title,figsize=(11, 6))
         self.fig.canvas.mpl_connect('button_press_event', self.onClick)
+        self.fig.canvas.mpl_connect('key_press_event', self.onKey)
         self.plot()
 
+    def enable_profiling(self, profiler):
+        """
+        Wraps the methods in `PROFILED_METHODS` and `PROFILED_HANDLERS` (on this game only) so that they are timed by
+        `profiler`. This must be done before the handlers are connected to the figure, i.e. in `__init__`.
+        """
+        self.profiler = profiler
+        for name in PROFILED_METHODS:
+            setattr(self, name, profiler.timed(name, getattr(self, name)))
+        for name in PROFILED_HANDLERS:
+            setattr(self, name, profiler.handler(name, getattr(self, name)))
+
+    # the state of the game lives in the engine
+    @property
+    def initial_circ(self):
+        return self.engine.initial_circ
+
+    @property
+    def final_circ(self):
+        return self.engine.final_circ
+
+    @property
+    def arc(self):
+        return self.engine.arc
+
+    @property
+    def num_circuit_qubits(self):
+        return self.engine.num_circuit_qubits
+
+    @property
+    def num_arc_qubits(self):
+        return self.engine.num_arc_qubits
+
+    @property
+    def num_qubits(self):
+        return self.engine.num_qubits
+
+    @property
+    def stage(self):
+        return self.engine.stage
+
+    @property
+    def num_swaps(self):
+        return self.engine.num_swaps
+
+    @property
+    def initial_mapping(self):
+        return self.engine.initial_mapping
+
+    @property
+    def current_mapping(self):
+        return self.engine.current_mapping
+
+    @property
+    def circuit_edges(self):
+        """
+        The circuit gates as they are drawn, in the form {physical edge: [width, color]}, e.g. {(1,2) : [5, 'b']}
+        """
+        current_gate = self.engine.current_gate()
+        circuit_edges = {}
+        for k, n in self.engine.remaining_pairs.items():
+            if n == 0:  # finished edges have 0 thickness
+                width, col = 0, COMPLETED_CIRCUIT_EDGE_COLOR
+            else:
+                # here we use the function y = 10 - 1/x to approach a line thickness of 10,
+                # by increasing x by 0.1 for each gate on the same connection
+                width, col = 10 - 1/(0.1*(n+1)), CIRCUIT_EDGE_COLOR
+
+            if current_gate is not None and (k == current_gate or k[::-1] == current_gate):
+                col = HIGHLIGHTED_CIRCUIT_EDGE_COLOR
+
+            circuit_edges[self.engine.physical(k)] = [width, col]
+
+        return circuit_edges
+
+    def circuit_edge_styles(self):
+        """
+        The [width, color] of the edge of each pair in `circuit_pairs`, as in `circuit_edges` but scaled to the board.
+        When the edges are aggregated, the width of a pair is that of the CNOTs left in both directions, and thinner.
+        """
+        remaining, current_gate = self.engine.remaining_pairs, self.engine.current_gate()
+        scale = self.scale
+        if self.aggregate_circuit_edges:
+            scale *= DETAILED_CIRCUIT_EDGES / len(self.circuit_pairs)
+
+        styles = []
+        for a, b in self.circuit_pairs:
+            n = remaining.get((a, b), 0) + (remaining.get((b, a), 0) if self.aggregate_circuit_edges else 0)
+            if n == 0:  # finished edges have 0 thickness
+                width, col = 0, COMPLETED_CIRCUIT_EDGE_COLOR
+            else:
+                width, col = scale * (10 - 1/(0.1*(n+1))), CIRCUIT_EDGE_COLOR
+
+            if current_gate is not None and (current_gate == (a, b) or current_gate == (b, a)):
+                col = HIGHLIGHTED_CIRCUIT_EDGE_COLOR
+
+            styles.append([width, col])
+
+        return styles
+
+    def labelled_nodes(self):
+        """
+        Returns the nodes which are labelled on a board with more than `LABELLED_MAX_QUBITS` qubits (the nodes
+        highlighted and those of the current gate), or `None` if every node is labelled.
+        """
+        if self.num_arc_qubits <= LABELLED_MAX_QUBITS:
+            return None
+        nodes = set(self.nodes_highlighted)
+        gate = self.engine.current_gate()
+        if gate is not None:
+            nodes.update(self.engine.physical(gate))
+        return nodes
+
+    def draw_board(self, ax, labelled=None):
+        """
+        Draws the nodes, their labels and the architecture edges onto `ax`, sized for the board.
+
+        :param labelled:    The nodes to label, by default all of them.
+        :return: the nodes and the labels, as `networkx` returns them.
+        """
+        import networkx as nx
+
+        label_pos = {self.current_mapping.inverse(key): item for key, item in self.pos.items()
+                     if labelled is None or key in labelled}
+        nodes = nx.draw_networkx_nodes(self.graph, pos=self.pos, node_color=self.node_colors, ax=ax,
+                                       node_size=300 * self.scale**2)
+        labels = nx.draw_networkx_labels(self.graph, pos=label_pos, labels={k: k for k in label_pos}, ax=ax,
+                                         font_size=max(12 * self.scale, 4))
+        nx.draw_networkx_edges(self.graph, self.pos,
+                               edgelist=self.arc,
+                               width=11 * self.scale, alpha=0.5, edge_color=ARCHITECTURE_EDGE_COLOR, ax=ax)
+        if self.layout != 'circular':
+            ax.set_xlim(*BOARD_LIMITS)
+            ax.set_ylim(*BOARD_LIMITS)
+        return nodes, labels
+
     def plot(self):
+        if self.incremental:
+            if self.artists is None:
+                self.create_artists()
+            else:
+                self.update_artists()
+            return
+
+        import matplotlib.pyplot as plt
+        import networkx as nx
 
         # clear the canvas
         plt.clf()
 
-        self.pos = nx.circular_layout(self.graph)
-        curr_map = [self.current_mapping(i) for i in range(self.num_arc_qubits)]
-        label_pos = {curr_map.index(key): item for key, item in self.pos.items()}
-
-        # nodes
-        nx.draw_networkx_nodes(self.graph, pos=self.pos, node_color=self.node_colors)
-        nx.draw_networkx_labels(self.graph, pos=label_pos)
+        # nodes and architecture edges
+        self.draw_board(plt.gca(), self.labelled_nodes())
 
-        # edges
-        # architecture
-        nx.draw_networkx_edges(self.graph, self.pos,
-                            edgelist=self.arc,
-                            width=11, alpha=0.5, edge_color=ARCHITECTURE_EDGE_COLOR)
         # circuit
+        styles = self.circuit_edge_styles()
         nx.draw_networkx_edges(self.graph, self.pos,
-                            edgelist=list(self.circuit_edges.keys()),
-                            width=[x[0] for x in list(self.circuit_edges.values())], 
-                            edge_color=[x[1] for x in list(self.circuit_edges.values())],
+                            edgelist=[self.engine.physical(k) for k in self.circuit_pairs],
+                            width=[x[0] for x in styles],
+                            edge_color=[x[1] for x in styles],
                             alpha=0.5)
 
+        self.draw_text(plt.gca())
+
+        # update canvas as opposed to replotting
+        self.fig.canvas.draw()
+
+    def draw_text(self, ax):
+        """
+        Draws the buttons, the legend, the title and the status of the game onto `ax`.
+
+        :return: a dictionary of the `matplotlib.text.Text` objects which change during the game.
+        """
+        texts = {}
+
         # next gate button
-        plt.text(0.99, 0.02, 'Next Gate', fontsize=18,
-                 bbox=dict(facecolor=None, boxstyle='round'),
-                 transform = self.ax.transAxes,
-                 horizontalalignment='right',
-                 verticalalignment='bottom')
+        ax.text(0.99, 0.02, 'Next Gate', fontsize=18,
+                bbox=dict(facecolor=None, boxstyle='round'),
+                transform = ax.transAxes,
+                horizontalalignment='right',
+                verticalalignment='bottom')
 
         # reset button
-        plt.text(0.3 if self.num_arc_qubits ==3 else 0.01, 0.01, 'Reset', fontsize=12,
-                 bbox=dict(facecolor='yellow', boxstyle='round'),
-                 transform = self.ax.transAxes,
-                 horizontalalignment='left',
-                 verticalalignment='bottom')
+        ax.text(0.3 if self.num_arc_qubits ==3 else 0.01, 0.01, 'Reset', fontsize=12,
+                bbox=dict(facecolor='yellow', boxstyle='round'),
+                transform = ax.transAxes,
+                horizontalalignment='left',
+                verticalalignment='bottom')
 
 
         # stage
-        plt.text(0.98, 0.98, 'Stage: {}'.format(self.stage), fontsize=15,
-                 transform=self.ax.transAxes,
-                 horizontalalignment='right',
-                 verticalalignment='top')
+        texts['stage'] = ax.text(0.98, 0.98, 'Stage: {}'.format(self.stage), fontsize=15,
+                                 transform=ax.transAxes,
+                                 horizontalalignment='right',
+                                 verticalalignment='top')
 
         # swap number
-        plt.text(0.98, 0.92, 'Number of Swaps: {}'.format(self.num_swaps), fontsize=10, weight='bold',
-                 color='m' if self.stage == 3 else 'saddlebrown',
-                 transform=self.ax.transAxes,
-                 horizontalalignment='right',
-                 verticalalignment='top')
-
-        if self.best_score is not None:
-            plt.text(0.98, 0.86, 'Best Score: {}'.format(self.best_score), fontsize=9, weight='bold',
-                     color='midnightblue',
-                     transform=self.ax.transAxes,
-                     horizontalalignment='right',
-                     verticalalignment='top')
+        texts['num_swaps'] = ax.text(0.98, 0.92, 'Number of Swaps: {}'.format(self.num_swaps), fontsize=10, weight='bold',
+                                     color='m' if self.stage == 3 else 'saddlebrown',
+                                     transform=ax.transAxes,
+                                     horizontalalignment='right',
+                                     verticalalignment='top')
+
+        texts['best_score'] = ax.text(0.98, 0.86, 'Best Score: {}'.format(self.best_score), fontsize=9, weight='bold',
+                                      color='midnightblue',
+                                      visible=self.best_score is not None,
+                                      transform=ax.transAxes,
+                                      horizontalalignment='right',
+                                      verticalalignment='top')
 
         # gates remaining
-        plt.text(0.99, 0.11, 'Gates remaining: {}'.format(self.gates_remaining()), fontsize=10,
-                 color='midnightblue',
-                 transform=self.ax.transAxes,
-                 horizontalalignment='right',
-                 verticalalignment='bottom')
+        texts['gates_remaining'] = ax.text(0.99, 0.11, 'Gates remaining: {}'.format(self.gates_remaining()), fontsize=10,
+                                           color='midnightblue',
+                                           transform=ax.transAxes,
+                                           horizontalalignment='right',
+                                           verticalalignment='bottom')
 
         # message
-        plt.text(0.2 if self.num_arc_qubits ==3 else 0.02, 0.98, self.message, fontsize=14, color='m',
-                 transform=self.ax.transAxes,
-                 horizontalalignment='left',
-                 verticalalignment='top')
+        texts['message'] = ax.text(0.2 if self.num_arc_qubits ==3 else 0.02, 0.98, self.message, fontsize=14, color='m',
+                                   transform=ax.transAxes,
+                                   horizontalalignment='left',
+                                   verticalalignment='top')
 
         # legend
-        plt.text(0.3 if self.num_arc_qubits ==3 else 0.01, 0.12, "Circuit gate", fontsize=8, color='b',
-                 transform=self.ax.transAxes,
-                 horizontalalignment='left',
-                 verticalalignment='bottom')
-        plt.text(0.3 if self.num_arc_qubits ==3 else 0.01, 0.15, "Architecture connection", fontsize=8, color='r',
-                 transform=self.ax.transAxes,
-                 horizontalalignment='left',
-                 verticalalignment='bottom')
-        plt.text(0.3 if self.num_arc_qubits ==3 else 0.01, 0.09, "Next gate", fontsize=8, color=HIGHLIGHTED_CIRCUIT_EDGE_COLOR,
-                 transform=self.ax.transAxes,
-                 horizontalalignment='left',
-                 verticalalignment='bottom')
-
-        plt.title(self.title, fontsize=16, weight='bold')
+        ax.text(0.3 if self.num_arc_qubits ==3 else 0.01, 0.12, "Circuit gate", fontsize=8, color='b',
+                transform=ax.transAxes,
+                horizontalalignment='left',
+                verticalalignment='bottom')
+        ax.text(0.3 if self.num_arc_qubits ==3 else 0.01, 0.15, "Architecture connection", fontsize=8, color='r',
+                transform=ax.transAxes,
+                horizontalalignment='left',
+                verticalalignment='bottom')
+        ax.text(0.3 if self.num_arc_qubits ==3 else 0.01, 0.09, "Next gate", fontsize=8, color=HIGHLIGHTED_CIRCUIT_EDGE_COLOR,
+                transform=ax.transAxes,
+                horizontalalignment='left',
+                verticalalignment='bottom')
+
+        ax.set_title(self.title, fontsize=16, weight='bold')
+
+        return texts
+
+    def create_artists(self):
+        """
+        Draws the whole board once, keeping hold of every artist which changes during the game so that `update_artists`
+        only needs to modify them. These artists are animated, i.e. they are left out of full redraws of the figure and
+        are instead blitted on top of a saved background.
+        """
+        from matplotlib.collections import LineCollection
 
-        # update canvas as opposed to replotting
-        self.fig.canvas.draw()
+        self.fig.clf()
+        self.ax = self.fig.add_subplot(111)
 
-    def relabel_circuit(self, func):
-        # `func` can be any permutation of the qubits
+        # nodes and architecture edges
+        nodes, labels = self.draw_board(self.ax)
 
-        # the new mapping is the old mapping composed with the new swap
-        self.current_mapping = compose(func, self.current_mapping)  
+        # circuit, with one segment for each pair in `circuit_pairs` (which stays the same throughout the game)
+        circuit_edges = LineCollection(self.circuit_segments(), alpha=0.3 if self.aggregate_circuit_edges else 0.5,
+                                       zorder=1)
+        self.ax.add_collection(circuit_edges)
 
-        if self.stage == 1: # update initial mapping only if in initial stage
-            self.initial_mapping = self.current_mapping
+        texts = self.draw_text(self.ax)
 
-        new_edges = {}
+        self.artists = dict(texts, nodes=nodes, labels=labels, circuit_edges=circuit_edges)
+        self.animated_artists = [circuit_edges, nodes] + list(labels.values()) + list(texts.values())
+        for artist in self.animated_artists:
+            artist.set_animated(True)
 
-        # update the edges for graph representation
-        for k in self.circuit_edges:
-            new_edges[(func(k[0]), func(k[1]))] = self.circuit_edges[k]
-        self.circuit_edges = new_edges
+        self.background = None
+        self.fig.canvas.mpl_connect('draw_event', self.on_draw)
+        self.update_artists(blit=False)
+        self.fig.canvas.draw()
 
-        return
+    def circuit_segments(self):
+        return [(self.pos[self.current_mapping(a)], self.pos[self.current_mapping(b)]) for a, b in self.circuit_pairs]
 
-    def swap_nodes(self, x, y):
-        if (x, y) in self.arc or (y, x) in self.arc or self.stage==1:
-            def f(z): # define the swap permutation
-                if z == x:
-                    return y
-                elif z==y:
-                    return x
-                else:
-                    return z
+    def update_artists(self, blit=True):
+        """
+        Updates the artists made by `create_artists` to the current state of the game, and blits them onto the canvas
+        (if the backend supports it, otherwise the canvas is redrawn).
+        """
+        artists = self.artists
+
+        artists['nodes'].set_facecolor(self.node_colors)
+        labelled = self.labelled_nodes()
+        for logical, label in artists['labels'].items():
+            physical = self.current_mapping(logical)
+            label.set_position(self.pos[physical])
+            if labelled is not None:
+                label.set_visible(physical in labelled)
+
+        edges = self.circuit_edge_styles()
+        artists['circuit_edges'].set_segments(self.circuit_segments())
+        artists['circuit_edges'].set_linewidths([x[0] for x in edges])
+        artists['circuit_edges'].set_color([x[1] for x in edges])
+
+        artists['stage'].set_text('Stage: {}'.format(self.stage))
+        artists['num_swaps'].set_text('Number of Swaps: {}'.format(self.num_swaps))
+        artists['num_swaps'].set_color('m' if self.stage == 3 else 'saddlebrown')
+        artists['best_score'].set_text('Best Score: {}'.format(self.best_score))
+        artists['best_score'].set_visible(self.best_score is not None)
+        artists['gates_remaining'].set_text('Gates remaining: {}'.format(self.gates_remaining()))
+        artists['message'].set_text(self.message)
+
+        if not blit:
+            return
 
-            if self.stage != 1:  # add a swap gate to the new circuit
-                self.final_circ.cx(x, y)
-                self.final_circ.cx(y, x)
-                self.final_circ.cx(x, y)
+        canvas = self.fig.canvas
+        if self.background is None or not getattr(canvas, 'supports_blit', False):
+            canvas.draw()
+            return
 
-                self.num_swaps += 1
+        canvas.restore_region(self.background)
+        self.draw_animated_artists()
+        canvas.blit(self.fig.bbox)
 
-            self.relabel_circuit(func=f)
-        else:
+    def on_draw(self, event):
+        """
+        Called after every full redraw of the figure (e.g. when resized), to save the new background for blitting.
+        """
+        canvas = self.fig.canvas
+        if canvas.is_saving():  # animated artists are already included when saving the figure
+            return
+        if getattr(canvas, 'supports_blit', False):
+            self.background = canvas.copy_from_bbox(self.fig.bbox)
+        self.draw_animated_artists()
+
+    def draw_animated_artists(self):
+        for artist in self.animated_artists:
+            self.fig.draw_artist(artist)
+
+    def swap_nodes(self, x, y):
+        if not self.engine.apply_swap(x, y) and self.stage != 3:
             self.message = 'Qubits are not \n connected!'
             self.plot()
 
@@ -254,140 +574,22 @@ class Game:
         """
         This is called when the "Next Gate" button is pressed, and the current gate lies on the architecture.
         """
-        if self.stage == 1:
-            while self.current_gate_index < self.first_cnot_index:
-                gate = self.initial_circ.data[self.current_gate_index]
-
-                assert(len(gate[1]) == 1)
-                gate_params = gate[0].params
-                gate_class = type(gate[0])
-                gate_index = gate[1][0].index
-                new_gate_index = self.current_mapping(gate_index)
-
-                if gate_class == U1Gate:
-                    gate_object = U1Gate(theta=gate_params[0])
-                elif gate_class == U2Gate:
-                    gate_object = U2Gate(phi=gate_params[0], lam=gate_params[1])
-                elif gate_class == U3Gate:
-                    gate_object = U3Gate(theta=gate_params[0], phi=gate_params[1], lam=gate_params[2])
-                else:
-                    gate_object = gate_class()
-
-                self.final_circ.data.append(
-                    (gate_object, [Qubit(QuantumRegister(self.num_arc_qubits, 'q'), new_gate_index)],
-                     []))
-
-                self.current_gate_index += 1
-
-            self.stage = 2
-
-        if self.stage == 2:
-            gate = self.initial_circ.data[self.current_gate_index] # get gate
-            gate_class = type(gate[0])
-            gate_indices = (gate[1][0].index, gate[1][1].index)
-            self.previous_gate_indices = gate_indices
-            new_gate_indices = (self.current_mapping(gate_indices[0]), self.current_mapping(gate_indices[1]))
-
-            # here we use the function y = 10 - 1/x to approach a thickness of 15,
-            # by increasing x by 0.1 for each gate on the same connection
-
-            x = 1 / (10 - self.circuit_edges[new_gate_indices][0])
-
-            if x == 0.2:
-                col = COMPLETED_CIRCUIT_EDGE_COLOR
-                x -= 0.1  # this removes the edge, i.e. makes finished edges have 0 thickness
-            else:
-                x -= 0.1
-                col = CIRCUIT_EDGE_COLOR
-            y = 10 - 1 / x
-
-            self.circuit_edges[new_gate_indices] = [y, col]
-            if new_gate_indices[::-1] in self.circuit_edges:
-                self.circuit_edges[new_gate_indices[::-1]] = [self.circuit_edges[new_gate_indices[::-1]][0], col]
-
-            self.final_circ.data.append(
-                (gate_class(), [Qubit(QuantumRegister(self.num_arc_qubits, 'q'), new_gate_indices[0]),
-                                                     Qubit(QuantumRegister(self.num_arc_qubits, 'q'), new_gate_indices[1])],
-                 []))
-
-            self.current_gate_index += 1
-            self.message = ""
-
-        else: # self.stage = 3 (or anything else)
+        if not self.engine.advance():
             return
-        try:
-            # add gates to new circuit and get next 2 qubit gate
-            while len(self.initial_circ.data[self.current_gate_index][1]) < 2:  # is a 1 qubit gate
-                gate = self.initial_circ.data[self.current_gate_index]
-                gate_params = gate[0].params
-                gate_class = type(gate[0])
-                gate_index = gate[1][0].index
-                new_gate_index = self.current_mapping(gate_index)
-
-                if gate_class == U1Gate:
-                    gate_object = U1Gate(theta=gate_params[0])
-                elif gate_class == U2Gate:
-                    gate_object = U2Gate(phi=gate_params[0], lam=gate_params[1])
-                elif gate_class == U3Gate:
-                    gate_object = U3Gate(theta=gate_params[0], phi=gate_params[1], lam=gate_params[2])
-                else:
-                    gate_object = gate_class()
-
-                self.final_circ.data.append(
-                    (gate_object, [Qubit(QuantumRegister(self.num_arc_qubits, 'q'), new_gate_index)],
-                     []))
 
-                self.current_gate_index += 1
+        self.message = ""
 
-        except IndexError:  # no more gates left -- end of game
+        if self.stage == 3:  # no more gates left -- end of game
             self.message = "Game Over!"
 
-            for g in self.final_circ.data:
-                if len(g[1]) > 1:  # if 2 qubit gate
-                    k = tuple((g[1][0].index, g[1][1].index))  # get indices
-
             if self.output_filename is not None:
+                self.details = self.engine.save(self.output_filename, self.output_dir,
+                                                optimize=self.optimize_output)
 
-                if self.output_dir is not None:
-                    if not os.path.exists(self.output_dir):
-                        os.makedirs(self.output_dir)
-
-                self.initial_circ.qasm(filename=os.path.join(self.output_dir,'initial_circuit_{}.txt'.format(self.output_filename)))
-                self.final_circ.qasm(filename=os.path.join(self.output_dir,'final_circuit_{}.txt'.format(self.output_filename)))
-
-                self.details = {
-                                'num_circuit_qubits': self.num_circuit_qubits,
-                                'num_arc_qubits': self.num_arc_qubits,
-                                'architecture': self.arc,
-                                'initial_mapping': [self.initial_mapping(x) for x in range(self.num_arc_qubits)],
-                                'final_mapping': [self.current_mapping(x) for x in range(self.num_arc_qubits)],
-                                'num_swaps' : self.num_swaps
-                                }
-
-                with open(os.path.join(self.output_dir, 'details_' + self.output_filename + '.txt'), 'w') as f:
-                    f.write(str(self.details))
-
-            self.stage = 3
             self.plot()
             return
 
-        # update current gate colour
-        current_gate = self.initial_circ.data[self.current_gate_index]
-        gate_indices = (current_gate[1][0].index, current_gate[1][1].index)
-        new_gate_indices = (self.current_mapping(gate_indices[0]), self.current_mapping(gate_indices[1])) 
-        self.circuit_edges[new_gate_indices] = (self.circuit_edges[new_gate_indices][0], HIGHLIGHTED_CIRCUIT_EDGE_COLOR)
-        if new_gate_indices[::-1] in self.circuit_edges:
-            self.circuit_edges[new_gate_indices[::-1]] = [self.circuit_edges[new_gate_indices[::-1]][0], HIGHLIGHTED_CIRCUIT_EDGE_COLOR]
-
         self.reset_colors()
-
-        if self.previous_gate_indices is not None:
-            next_gate = self.initial_circ.data[self.current_gate_index]
-            new_gate_indices = (next_gate[1][0].index, next_gate[1][1].index)
-            if self.previous_gate_indices == new_gate_indices or self.previous_gate_indices[::-1] == new_gate_indices:
-                self.next_gate()
-                return
-
         self.plot()
         return
 
@@ -402,17 +604,13 @@ class Game:
             self.plot()
             return
 
-        if (abs(x-0.9)**2 + abs(y+1)**2) < 0.03:  # 'next gate' clicked
-            if self.stage == 1:
-                gate = self.initial_circ.data[self.first_cnot_index]
-            elif self.stage == 2:
-                gate = self.initial_circ.data[self.current_gate_index]
-            else:
+        clicked = self.click_index.query(x, y)  # a button, a node or `None`
+
+        if clicked == NEXT_GATE_BUTTON:
+            if self.stage == 3:
                 return
 
-            logicals = (gate[1][0].index, gate[1][1].index)
-            physicals = (self.current_mapping(logicals[0]), self.current_mapping(logicals[1]))
-            if physicals in self.arc or (physicals[1], physicals[0]) in self.arc:
+            if self.engine.is_legal():
                 self.next_gate()
             else:
                 self.message = 'Gate not on \narchitecture!'
@@ -421,9 +619,7 @@ class Game:
 
             return
 
-        reset_x =-0.04 if self.num_arc_qubits ==3 else -1
-        reset_y = -0.9 if self.num_arc_qubits==3 else -1
-        if (abs(x-reset_x)**2 + abs(y-reset_y)**2) < 0.03:  # 'reset clicked'
+        if clicked == RESET_BUTTON:
 
             if not self.reset_pressed:
                 self.reset_pressed = True
@@ -435,49 +631,91 @@ class Game:
                     new_best_score = min(self.num_swaps, self.best_score) if self.best_score is not None else self.num_swaps
                 else:
                     new_best_score = None
-                try:
-                    self.__init__(circuit=self.initial_circ,
-                                  architecture=self.arc,
-                                  title=self.title,
-                                  output_dir=self.output_dir,
-                                  output_filename=self.output_filename,
-                                  best_score=new_best_score)
-                    return
-                except TypeError:
-                    self.__init__(best_score=new_best_score)
-                    return
+                self.reset(best_score=new_best_score)
+                return
 
         else: # reset not pressed
             self.reset_pressed = False
 
 
-        # check if nodes clicked
-        for i in range(len(self.pos)):  # for each node
-                if (abs(x-self.pos[i][0])**2 + abs(y-self.pos[i][1])**2) < 0.003: # if node clicked
-
-                    self.node_colors[i] = HIGHLIGHTED_NODE_COLOR
-                    self.nodes_highlighted.append(i)
-
-                    if len(self.nodes_highlighted)==1:
-                        self.plot()
-                        return
-                    else: # already one node highlighted
-                        assert(len(self.nodes_highlighted)==2)
-
-                        self.plot()
-                        self.fig.canvas.draw()
-                        time.sleep(1)
-                        
-                        self.swap_nodes(*self.nodes_highlighted)
-                        self.nodes_highlighted = []
-                        self.node_colors = [BASE_NODE_COLOR]*self.num_arc_qubits
-                        self.plot()
-                        return
-        
+        # check if a node was clicked
+        if clicked is not None:
+            i = clicked
+
+            self.node_colors[i] = HIGHLIGHTED_NODE_COLOR
+            self.nodes_highlighted.append(i)
+
+            if len(self.nodes_highlighted)==1:
+                self.plot()
+                return
+            else: # already one node highlighted
+                assert(len(self.nodes_highlighted)==2)
+
+                self.plot()
+                self.fig.canvas.draw()
+                time.sleep(1)
+
+                self.swap_nodes(*self.nodes_highlighted)
+                self.nodes_highlighted = []
+                self.node_colors = [BASE_NODE_COLOR]*self.num_arc_qubits
+                self.plot()
+                return
+
         self.reset_colors() # clicked on nothing
         self.plot()
         return
 
+    def reset(self, best_score=None):
+        """
+        Starts the game again, keeping the unrolled circuit and the figure (only the parts which change are redrawn).
+
+        :param best_score:  The best previous score to show.
+        """
+        self.engine.restore(self.initial_state)
+        self.best_score = best_score
+        self.reset_pressed = False
+        self.message = ""
+        self.nodes_highlighted = []
+        self.node_colors = [BASE_NODE_COLOR]*self.num_arc_qubits
+        self.plot()
+
+    def onKey(self, event):
+        """
+        This is called when a key is pressed: 'z' undoes the last move and 'y' redoes it.
+        """
+        if event.key in UNDO_KEYS:
+            self.undo()
+        elif event.key in REDO_KEYS:
+            self.redo()
+
+    def undo(self):
+        """
+        Takes back the last move (a swap or a "Next Gate").
+        """
+        self.show_move(self.engine.undo(), 'Nothing to undo!')
+
+    def redo(self):
+        """
+        Makes the last move taken back again.
+        """
+        self.show_move(self.engine.redo(), 'Nothing to redo!')
+
+    def show_move(self, moved, message):
+        self.reset_pressed = False
+        self.nodes_highlighted = []
+        self.node_colors = [BASE_NODE_COLOR]*self.num_arc_qubits
+
+        if not moved:
+            self.message = message
+        elif self.stage == 3:
+            self.message = "Game Over!"
+            if self.output_filename is not None:
+                self.details = self.engine.save(self.output_filename, self.output_dir,
+                                                optimize=self.optimize_output)
+        else:
+            self.message = ""
+        self.plot()
+
     def reset_colors(self):
             self.node_colors = [BASE_NODE_COLOR]*self.num_arc_qubits
             self.nodes_highlighted = []
@@ -486,8 +724,5 @@ class Game:
             return
 
     def gates_remaining(self):
-
-        cnot_gates_in_current_circ = len([g for g in self.final_circ.data if len(g[1]) > 1])
-
-        return self.cnot_gates_in_initial_circ - cnot_gates_in_current_circ + 3*self.num_swaps
+        return self.engine.gates_remaining()
 
@@ -0,0 +1,226 @@
+"""
+This module generates new levels: random circuits on lattice architectures (like the levels in `levels`), graded by
+how hard they really are.
+
+Candidate levels are scored in parallel, over a pool of processes, by the exact `solver` (the fewest swaps needed,
+which is the difficulty of the level) and by the `Router` (the par score). Candidates which cannot be solved within
+`max_states` are skipped, so every level kept has a proven difficulty. The levels kept fill the difficulty buckets in
+the order the candidates were made, so the result only depends on `seed`, e.g.
+
+    graded = generate(per_bucket=20, time_budget=8*3600)
+    write_levels(graded, 'levels/generated')
+
+or `python generator.py --per-bucket 20 --time-budget 28800 levels/generated`. The written levels can be loaded with
+`catalog.levels('levels/generated')`.
+"""
+
+import json
+import multiprocessing
+import os
+import random
+import time
+
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# (name, fewest swaps, most swaps) of each difficulty bucket, `None` for no limit
+DIFFICULTY_BUCKETS = [('easy', 1, 2), ('medium', 3, 4), ('hard', 5, 6), ('expert', 7, None)]
+
+# the (rows, columns) of the lattice architectures, and the depths of the circuits: the solver rarely finishes on
+# more than 6 qubits, so larger lattices mostly waste time
+DEFAULT_SHAPES = [(2, 2), (1, 4), (2, 3), (1, 6)]
+DEFAULT_DEPTHS = [2, 3, 4, 5, 6]
+
+
+def candidates(seed=0, shapes=DEFAULT_SHAPES, depths=DEFAULT_DEPTHS):
+    """
+    Generates the specifications of candidate levels, as dictionaries with the keys 'index', 'rows', 'columns', 'depth'
+    and 'seed' (of `random_circuit`). The sequence only depends on `seed`.
+    """
+    rng = random.Random(seed)
+    index = 0
+    while True:
+        rows, columns = rng.choice(shapes)
+        yield {
+                'index': index,
+                'rows': rows,
+                'columns': columns,
+                'depth': rng.choice(depths),
+                'seed': rng.randrange(2**31),
+                }
+        index += 1
+
+
+def build(spec):
+    """
+    Returns the circuit and the architecture of a candidate level.
+    """
+    from qiskit.circuit.random import random_circuit
+    from util import lattice_architecture
+
+    circuit = random_circuit(num_qubits=spec['rows'] * spec['columns'], depth=spec['depth'], seed=spec['seed'])
+    return circuit, lattice_architecture(spec['rows'], spec['columns'])
+
+
+def score(spec, max_states=200000):
+    """
+    Scores a candidate level.
+
+    :return: `spec` with the extra keys 'num_cnots', 'optimal', 'num_swaps' (the fewest swaps, if optimal),
+             'lower_bound', 'par' (the swaps made by the `Router`), 'num_states' and 'seconds'.
+    """
+    from engine import Engine
+    from router import Router
+    from solver import solve
+
+    start = time.perf_counter()
+    circuit, architecture = build(spec)
+    engine = Engine(circuit, architecture)
+    result = dict(spec, num_cnots=engine.cnot_gates_in_initial_circ)
+
+    solution = solve(engine, max_states=max_states)
+    par = Router(architecture).play(engine.replay())  # a new engine on the same (unrolled) circuit
+    result.update(optimal=solution['optimal'], num_swaps=solution['num_swaps'], lower_bound=solution['lower_bound'],
+                  par=par.num_swaps, num_states=solution['num_states'], seconds=time.perf_counter() - start)
+    return result
+
+
+def bucket_of(num_swaps, buckets=DIFFICULTY_BUCKETS):
+    """
+    Returns the name of the bucket for a level needing `num_swaps` swaps, or `None` if it is in none of them.
+    """
+    for name, low, high in buckets:
+        if num_swaps >= low and (high is None or num_swaps <= high):
+            return name
+    return None
+
+
+def generate(per_bucket=10, buckets=DIFFICULTY_BUCKETS, seed=0, shapes=DEFAULT_SHAPES, depths=DEFAULT_DEPTHS,
+             max_states=200000, max_candidates=10000, time_budget=None, processes=None, verbose=False):
+    """
+    Scores candidate levels until every bucket has `per_bucket` levels.
+
+    :param per_bucket:      The number of levels wanted in each bucket.
+    :param buckets:         The difficulty buckets, see `DIFFICULTY_BUCKETS`.
+    :param seed:            The seed of the candidates, see `candidates`.
+    :param max_states:      The maximum number of states of the solver for each candidate.
+    :param max_candidates:  The maximum number of candidates to score.
+    :param time_budget:     The maximum time (in seconds) to score for, or `None` for no limit.
+    :param processes:       The number of processes to score with, by default the number of cores.
+    :param verbose:         If `True`, prints each level kept.
+    :return:    A dictionary with the keys
+                * 'buckets': {bucket name: [the scores (see `score`) of the levels kept]}.
+                * 'num_candidates', 'num_unsolved' and 'num_outside' (solved, but in no bucket or a full bucket).
+                * 'complete': `True` if every bucket was filled.
+    """
+    deadline = time.perf_counter() + time_budget if time_budget is not None else None
+    graded = {name: [] for name, _, _ in buckets}
+    counts = {'num_candidates': 0, 'num_unsolved': 0, 'num_outside': 0}
+
+    def full():
+        return all(len(levels) >= per_bucket for levels in graded.values())
+
+    specs = (spec for spec, _ in zip(candidates(seed, shapes, depths), range(max_candidates)))
+    with multiprocessing.Pool(processes) as pool:
+        # in order, so that which levels are kept does not depend on the timing of the processes
+        for result in pool.imap(_score, ((spec, max_states) for spec in specs)):
+            counts['num_candidates'] += 1
+            name = bucket_of(result['num_swaps'], buckets) if result['optimal'] else None
+            if not result['optimal']:
+                counts['num_unsolved'] += 1
+            elif name is None or len(graded[name]) >= per_bucket:
+                counts['num_outside'] += 1
+            else:
+                graded[name].append(result)
+                if verbose:
+                    print('{:<8} {:>2} swaps (par {:>2}) {}x{} lattice, depth {}, seed {}'.format(
+                        name, result['num_swaps'], result['par'], result['rows'], result['columns'], result['depth'],
+                        result['seed']))
+
+            if full() or (deadline is not None and time.perf_counter() > deadline):
+                break
+        # leaving the `with` block terminates the candidates still being scored
+
+    return dict(counts, buckets=graded, complete=full())
+
+
+def _score(args):
+    return score(*args)
+
+
+LEVEL_TEMPLATE = '''import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), {root!r}))
+import matplotlib.pyplot as plt
+from qiskit.circuit.random import random_circuit
+
+from game import Game, NAME
+from util import lattice_architecture
+
+# generated by `generator.py`: {bucket}, {num_swaps} swaps at best (par {par})
+
+circ = random_circuit(num_qubits={num_qubits},
+                      depth={depth},
+                      seed={seed})
+
+arc = lattice_architecture({rows}, {columns})
+
+
+class Level{number}(Game):
+
+    def __init__(self, **kwargs):
+        super().__init__(circ, arc, title=NAME + " Level {number}", **kwargs)
+
+
+if __name__ == '__main__':
+    lev = Level{number}()
+    plt.show()
+'''
+
+
+def write_levels(graded, directory, first_number=1):
+    """
+    Writes the levels kept by `generate` to `directory` as level modules (`level_<number>.py`, like the levels in
+    `levels`), numbered from the easiest, and an index `levels.json` of their scores.
+
+    :return: the list of the scores of the levels written, with their 'number' and 'bucket'.
+    """
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    root = os.path.relpath(ROOT, os.path.abspath(directory))
+
+    levels = []
+    for name, results in graded['buckets'].items():
+        for result in sorted(results, key=lambda r: (r['num_swaps'], r['index'])):
+            levels.append(dict(result, bucket=name, number=first_number + len(levels)))
+
+    for level in levels:
+        with open(os.path.join(directory, 'level_{}.py'.format(level['number'])), 'w') as file:
+            file.write(LEVEL_TEMPLATE.format(root=root, num_qubits=level['rows'] * level['columns'], **level))
+
+    with open(os.path.join(directory, 'levels.json'), 'w') as file:
+        json.dump(levels, file, indent=1)
+
+    return levels
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Generates levels graded by difficulty.')
+    parser.add_argument('directory', nargs='?', default=os.path.join('levels', 'generated'))
+    parser.add_argument('--per-bucket', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-states', type=int, default=200000)
+    parser.add_argument('--max-candidates', type=int, default=10000)
+    parser.add_argument('--time-budget', type=float, default=None, help='in seconds')
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    graded = generate(per_bucket=args.per_bucket, seed=args.seed, max_states=args.max_states,
+                      max_candidates=args.max_candidates, time_budget=args.time_budget, processes=args.processes,
+                      verbose=True)
+    levels = write_levels(graded, args.directory)
+    print('{} levels written to {} ({} candidates, {} unsolved, {} outside the buckets, {:.0f} s){}'.format(
+        len(levels), args.directory, graded['num_candidates'], graded['num_unsolved'], graded['num_outside'],
+        time.perf_counter() - start, '' if graded['complete'] else ' -- not every bucket was filled'))
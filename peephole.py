@@ -0,0 +1,91 @@
+"""
+This module shortens the output circuit of a game without changing what it does, nor which edges of the architecture it
+uses. Every swap is played as three CNOTs, so the output often has CNOTs which cancel:
+* two equal CNOTs in a row (on the same qubits, with nothing on those qubits in between) cancel, which also removes two
+  swaps in a row on the same edge, and a CNOT next to a swap written in the same direction,
+* four alternating CNOTs on an edge (a swap next to a CNOT in the other direction) are two CNOTs, i.e.
+  CX(a,b) CX(b,a) CX(a,b) CX(b,a) = CX(b,a) CX(a,b).
+
+The gates are read once, in order, keeping a stack of the gates kept on each qubit, so a rewrite can cascade into the
+gates before it. For example
+
+    optimized, report = optimize(engine.final_circ)
+    report['cx_before'], report['cx_after']
+"""
+
+
+def optimize(circuit):
+    """
+    Applies the rewrites to `circuit` (which is not changed).
+
+    :return: a tuple of the new circuit and a report, i.e. a dictionary with the keys 'cx_before', 'cx_after',
+             'depth_before', 'depth_after', 'cancelled' (the number of pairs of CNOTs cancelled) and 'merged' (the number
+             of swaps merged with a CNOT).
+    """
+    qubit_indices = {qubit: i for i, qubit in enumerate(circuit.qubits)}
+    kept = []  # (operation, qubits, clbits) of each gate, `None` once removed
+    stacks = [[] for _ in range(circuit.num_qubits)]  # the indices in `kept` of the gates kept on each qubit
+    counts = {'cancelled': 0, 'merged': 0}
+
+    def top(a, b, depth):
+        """
+        The `depth` gates at the top of the stacks of `a` and `b`, from the top down, if they are the same CNOTs on `a`
+        and `b` (so nothing else is between them on these qubits), otherwise `None`.
+        """
+        stack_a, stack_b = stacks[a], stacks[b]
+        if len(stack_a) < depth or len(stack_b) < depth:
+            return None
+        gates = []
+        for k in range(1, depth + 1):
+            j = stack_a[-k]
+            if j != stack_b[-k] or kept[j][0].name != 'cx':
+                return None
+            gates.append(j)
+        return gates
+
+    def pop(j):
+        for q in kept[j][1]:
+            stacks[q].pop()
+        kept[j] = None
+
+    def push(operation, qubits, clbits):
+        if operation.name == 'cx' and not clbits and getattr(operation, 'condition', None) is None:
+            a, b = qubits
+            below = top(a, b, 1)
+            if below is not None and kept[below[0]][1] == (a, b):  # CX(a,b) CX(a,b) = I
+                pop(below[0])
+                counts['cancelled'] += 1
+                return
+
+            below = top(a, b, 3)
+            if below is not None and [kept[j][1] for j in below] == [(b, a), (a, b), (b, a)]:
+                # CX(b,a) CX(a,b) CX(b,a) CX(a,b) = CX(a,b) CX(b,a), pushed again as they may cancel further
+                cx = kept[below[0]][0]
+                for j in below:
+                    pop(j)
+                counts['merged'] += 1
+                push(operation, (a, b), clbits)
+                push(cx, (b, a), clbits)
+                return
+
+        kept.append((operation, qubits, clbits))
+        for q in qubits:
+            stacks[q].append(len(kept) - 1)
+
+    for operation, qubits, clbits in circuit.data:
+        push(operation, tuple(qubit_indices[q] for q in qubits), clbits)
+
+    optimized = circuit.copy_empty_like()
+    for gate in kept:
+        if gate is not None:
+            operation, qubits, clbits = gate
+            optimized._append(operation, [optimized.qubits[q] for q in qubits], clbits)
+
+    report = {
+            'cx_before': circuit.count_ops().get('cx', 0),
+            'cx_after': optimized.count_ops().get('cx', 0),
+            'depth_before': circuit.depth(),
+            'depth_after': optimized.depth(),
+            }
+    report.update(counts)
+    return optimized, report
@@ -0,0 +1,198 @@
+"""
+This module finds good initial mappings, i.e. the relabelling of the qubits made in stage 1 of the game.
+
+Two searches are run in parallel, over a pool of processes, until a time budget runs out:
+* A search for a subgraph of the architecture with the same shape as the interaction graph of the circuit (the graph
+  with an edge for each pair of qubits sharing a CNOT). If there is one, the circuit can be run without any swaps.
+* Simulated annealing restarts, each minimising the distance (on the architecture) between the qubits of every CNOT.
+
+The best candidate mappings are then scored by the number of swaps made by the `Router` when starting from them, e.g.
+
+    engine = Engine(circuit, architecture)
+    engine.set_initial_mapping(find_initial_mapping(engine, time_budget=10))
+"""
+
+import math
+import multiprocessing
+import os
+import random
+import time
+
+import networkx as nx
+from networkx.algorithms.isomorphism import GraphMatcher
+
+from router import Router, cnot_pairs
+from util import Permutation
+
+
+# the most candidate mappings scored by routing them; once the time budget has run out only the best one is scored
+SCORED_CANDIDATES = 4
+
+# the data shared by the worker processes, set once per process by `_init_worker`
+_worker_data = {}
+
+
+def interaction_graph(circuit_pairs):
+    """
+    Returns the interaction graph of a circuit, with the number of CNOTs between each pair of logical qubits
+    (in either direction) as the 'weight' of the edge.
+
+    :param circuit_pairs:   The number of CNOTs on each pair of logical qubits, e.g. `Engine.circuit_pairs`.
+    """
+    graph = nx.Graph()
+    for (a, b), n in circuit_pairs.items():
+        if graph.has_edge(a, b):
+            graph[a][b]['weight'] += n
+        else:
+            graph.add_edge(a, b, weight=n)
+    return graph
+
+
+def find_initial_mapping(engine, time_budget=10.0, seed=0, processes=None, restarts=None, steps=20000):
+    """
+    Searches for the initial mapping of the game on `engine` which needs the fewest swaps.
+
+    The annealing restarts are seeded by `seed`, so the result is deterministic as long as every restart, and the
+    scoring of the best candidates, finishes within the time budget. Restarts which have not finished by then are
+    abandoned, and only the best candidate is scored after the deadline. If no restart has finished, the mapping is the
+    router's own choice (see `Router.initial_mapping`), which only depends on the circuit and the architecture.
+
+    :param engine:          An `Engine` (the circuit and architecture are taken from it).
+    :param time_budget:     The maximum time (in seconds) to search for.
+    :param seed:            The seed of the first annealing restart, restart `i` uses `seed + i`.
+    :param processes:       The number of processes to search with, by default the number of cores.
+    :param restarts:        The number of annealing restarts, by default four per process.
+    :param steps:           The number of steps of each annealing restart.
+    :return:                The best mapping found, as a `Permutation` from logical to physical qubits.
+    """
+    deadline = time.perf_counter() + time_budget
+    processes = processes if processes is not None else os.cpu_count()
+    restarts = restarts if restarts is not None else 4 * processes
+
+    graph = interaction_graph(engine.circuit_pairs)
+    arc_graph = nx.Graph(engine.arc)
+    router = Router(engine.arc)
+    lower_bound = graph.size(weight='weight')  # every CNOT at distance 1
+
+    with multiprocessing.Pool(processes, initializer=_init_worker,
+                              initargs=(router.distances, router.neighbours, graph, arc_graph)) as pool:
+        embedding = pool.apply_async(_embed)
+        anneals = [pool.apply_async(_anneal, (seed + i, steps)) for i in range(restarts)]
+
+        while time.perf_counter() < deadline:
+            if embedding.ready() and embedding.get() is not None:
+                break
+            done = [job.get() for job in anneals if job.ready()]
+            if any(cost == lower_bound for cost, _, _ in done):
+                break
+            if embedding.ready() and len(done) == len(anneals):
+                break
+            time.sleep(0.01)
+
+        # leaving the `with` block terminates any unfinished searches
+        embedding = embedding.get() if embedding.ready() else None
+        candidates = sorted(job.get() for job in anneals if job.ready())
+
+    if embedding is not None:
+        return Permutation(embedding)
+
+    # score the best few candidates by the number of swaps they really need, stopping at the deadline (after the best)
+    pairs = cnot_pairs(engine)
+    best_mapping = router.initial_mapping(pairs, engine.current_mapping)  # the router's own choice
+    best_swaps = router.simulate(pairs, best_mapping.copy())
+    for i, (_, _, forward) in enumerate(candidates[:SCORED_CANDIDATES]):
+        if i > 0 and time.perf_counter() >= deadline:
+            break
+        mapping = Permutation(forward)
+        num_swaps = router.simulate(pairs, mapping.copy())
+        if num_swaps < best_swaps:
+            best_mapping, best_swaps = mapping, num_swaps
+
+    return best_mapping
+
+
+def _init_worker(distances, neighbours, graph, arc_graph):
+    _worker_data['distances'] = distances
+    _worker_data['neighbours'] = neighbours
+    _worker_data['graph'] = graph
+    _worker_data['arc_graph'] = arc_graph
+
+
+def _embed():
+    """
+    Looks for a subgraph of the architecture with the same shape as the interaction graph.
+
+    :return: the mapping (as a list) which puts every CNOT on the architecture, or `None` if there is none.
+    """
+    graph, arc_graph = _worker_data['graph'], _worker_data['arc_graph']
+    num_qubits = len(_worker_data['distances'])
+
+    matcher = GraphMatcher(arc_graph, graph)
+    for match in matcher.subgraph_monomorphisms_iter():  # physical --> logical
+        forward = [None] * num_qubits
+        for physical, logical in match.items():
+            forward[logical] = physical
+
+        # the qubits without any CNOTs go anywhere that is left
+        free = iter(sorted(set(range(num_qubits)) - set(match)))
+        return [physical if physical is not None else next(free) for physical in forward]
+
+    return None
+
+
+def _anneal(seed, steps, initial_temperature=2.0, final_temperature=0.05):
+    """
+    Simulated annealing from a random mapping, where each step swaps a logical qubit with one of its neighbours
+    on the architecture.
+
+    :return: a tuple of the cost (the weighted sum of the distances between the qubits of each CNOT), the seed and
+             the best mapping found (as a list).
+    """
+    distances, neighbours, graph = _worker_data['distances'], _worker_data['neighbours'], _worker_data['graph']
+    num_qubits = len(distances)
+    rng = random.Random(seed)
+
+    forward = list(range(num_qubits))
+    rng.shuffle(forward)
+    inverse = [0] * num_qubits
+    for logical, physical in enumerate(forward):
+        inverse[physical] = logical
+
+    interactions = [[] for _ in range(num_qubits)]
+    for a, b, w in graph.edges(data='weight'):
+        interactions[a].append((b, w))
+        interactions[b].append((a, w))
+    active = [logical for logical in range(num_qubits) if interactions[logical]]
+    if not active:
+        return 0, seed, forward
+
+    cost = sum(w * distances[forward[a]][forward[b]] for a, b, w in graph.edges(data='weight'))
+    best_cost, best_forward = cost, list(forward)
+
+    temperature = initial_temperature
+    cooling = (final_temperature / initial_temperature) ** (1 / steps)
+    for _ in range(steps):
+        a = rng.choice(active)
+        p = forward[a]
+        q = rng.choice(neighbours[p])
+        b = inverse[q]
+
+        # the change in cost from swapping the physical qubits of `a` and `b`
+        delta = 0
+        for c, w in interactions[a]:
+            if c != b:
+                delta += w * (distances[q][forward[c]] - distances[p][forward[c]])
+        for c, w in interactions[b]:
+            if c != a:
+                delta += w * (distances[p][forward[c]] - distances[q][forward[c]])
+
+        if delta <= 0 or rng.random() < math.exp(-delta / temperature):
+            forward[a], forward[b] = q, p
+            inverse[p], inverse[q] = b, a
+            cost += delta
+            if cost < best_cost:
+                best_cost, best_forward = cost, list(forward)
+
+        temperature *= cooling
+
+    return best_cost, seed, best_forward
@@ -0,0 +1,194 @@
+"""
+This module defines the Profiler class, which times the hot paths of a `Game` (see the `profile` argument of `Game`).
+
+The profiler wraps the methods it times when the game is created, so a game without a profiler runs exactly the same
+code as before and pays nothing. Each timed method gets a counter and the total, smallest and largest time of its calls,
+and each event handler (a click or a key press) also gets a histogram of its end-to-end latency, e.g.
+
+    game = Game(circuit, architecture, profile=True)
+    ... play ...
+    game.profiler.report()
+    game.profiler.save('profile.json')
+
+With `cprofile=True` the handlers are also run under `cProfile`, and `dump_stats` writes the statistics in the format
+read by `pstats` (or tools such as `snakeviz`).
+"""
+
+import cProfile
+import json
+import time
+from array import array
+from functools import wraps
+
+
+# the upper edges (in milliseconds) of the buckets of the latency histograms, the last bucket is everything above
+LATENCY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class Profiler:
+    """
+        Counters and timers for named functions, and latency histograms for event handlers.
+        One profiler can be shared by several games, which then add to the same statistics.
+    """
+
+    def __init__(self, cprofile=False, clock=time.perf_counter):
+        """
+
+        :param cprofile:    If `True`, the event handlers are also profiled with `cProfile`, see `dump_stats`.
+        :param clock:       The clock to time with, in seconds.
+        """
+        self.clock = clock
+        self.cprofile = cprofile
+        self.timers = {}  # name --> [calls, total, smallest, largest] (in seconds)
+        self.latencies = {}  # handler name --> array of the latency (in seconds) of each event
+        self.profile = cProfile.Profile() if cprofile else None
+
+    def reset(self):
+        """
+        Forgets everything recorded so far (in place, since the wrapped functions hold on to their timers).
+        """
+        for timer in self.timers.values():
+            timer[:] = [0, 0.0, float('inf'), 0.0]
+        for latencies in self.latencies.values():
+            del latencies[:]
+        self.profile = cProfile.Profile() if self.cprofile else None
+
+    def timed(self, name, function):
+        """
+        Returns `function` wrapped so that the time of each call is recorded under `name`. Calls made from inside other
+        timed calls are counted too, so the time of a method includes the time of the timed methods it calls.
+        """
+        clock = self.clock
+        timer = self.timers.setdefault(name, [0, 0.0, float('inf'), 0.0])
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                timer[0] += 1
+                timer[1] += elapsed
+                if elapsed < timer[2]:
+                    timer[2] = elapsed
+                if elapsed > timer[3]:
+                    timer[3] = elapsed
+
+        return wrapper
+
+    def handler(self, name, function):
+        """
+        Returns the event handler `function` wrapped so that it is timed (like `timed`), the latency of each event is
+        recorded for the histograms, and it runs under `cProfile` (if enabled).
+        """
+        timed = self.timed(name, function)
+        latencies = self.latencies.setdefault(name, array('d'))
+        clock = self.clock
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            profile = self.profile
+            start = clock()
+            if profile is not None:
+                profile.enable()
+            try:
+                return timed(*args, **kwargs)
+            finally:
+                if profile is not None:
+                    profile.disable()
+                latencies.append(clock() - start)
+
+        return wrapper
+
+    def histogram(self, name):
+        """
+        Returns the latency histogram of the handler `name`, as a list of (upper edge in ms, count) with `None` as the
+        edge of the last bucket.
+        """
+        counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        for latency in self.latencies.get(name, ()):
+            milliseconds = 1000 * latency
+            bucket = 0
+            while bucket < len(LATENCY_BUCKETS) and milliseconds > LATENCY_BUCKETS[bucket]:
+                bucket += 1
+            counts[bucket] += 1
+        return list(zip(LATENCY_BUCKETS + (None,), counts))
+
+    def percentile(self, name, q):
+        """
+        Returns the `q`-th percentile (0 to 100) of the latency (in seconds) of the handler `name`, or `None` if it has
+        not been called.
+        """
+        latencies = sorted(self.latencies.get(name, ()))
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q / 100 * len(latencies)))]
+
+    def stats(self):
+        """
+        Returns everything recorded, as a dictionary which can be saved as JSON, with the keys
+        * 'timers': {name: {'calls', 'total_ms', 'mean_ms', 'min_ms', 'max_ms'}}.
+        * 'latency': {handler name: {'events', 'p50_ms', 'p90_ms', 'p99_ms', 'max_ms', 'histogram'}}, where the
+          histogram is a list of [upper edge in ms (or `None`), count].
+        """
+        timers = {}
+        for name, (calls, total, smallest, largest) in self.timers.items():
+            timers[name] = {
+                    'calls': calls,
+                    'total_ms': 1000 * total,
+                    'mean_ms': 1000 * total / calls if calls else None,
+                    'min_ms': 1000 * smallest if calls else None,
+                    'max_ms': 1000 * largest if calls else None,
+                    }
+
+        latency = {}
+        for name, latencies in self.latencies.items():
+            latency[name] = {
+                    'events': len(latencies),
+                    'p50_ms': _milliseconds(self.percentile(name, 50)),
+                    'p90_ms': _milliseconds(self.percentile(name, 90)),
+                    'p99_ms': _milliseconds(self.percentile(name, 99)),
+                    'max_ms': _milliseconds(max(latencies) if latencies else None),
+                    'histogram': [list(bucket) for bucket in self.histogram(name)],
+                    }
+
+        return {'timers': timers, 'latency': latency}
+
+    def save(self, filename):
+        """
+        Saves `stats` as a JSON file.
+        """
+        with open(filename, 'w') as file:
+            json.dump(self.stats(), file, indent=1)
+
+    def dump_stats(self, filename):
+        """
+        Saves the `cProfile` statistics of the event handlers, which can be read with `pstats.Stats(filename)`.
+        """
+        if self.profile is None:
+            raise ValueError('The profiler was not created with cprofile=True.')
+        self.profile.dump_stats(filename)
+
+    def report(self):
+        """
+        Prints a table of the timers and the latency of the handlers.
+        """
+        stats = self.stats()
+        print('{:<20} {:>8} {:>12} {:>10} {:>10}'.format('function', 'calls', 'total (ms)', 'mean (ms)', 'max (ms)'))
+        for name, timer in sorted(stats['timers'].items(), key=lambda item: -item[1]['total_ms']):
+            if timer['calls']:
+                print('{:<20} {:>8} {:>12.1f} {:>10.2f} {:>10.2f}'.format(name, timer['calls'], timer['total_ms'],
+                                                                          timer['mean_ms'], timer['max_ms']))
+
+        for name, latency in stats['latency'].items():
+            if latency['events']:
+                print('\n{} latency: p50 {:.1f} ms, p90 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms'.format(
+                    name, latency['p50_ms'], latency['p90_ms'], latency['p99_ms'], latency['max_ms']))
+                for edge, count in latency['histogram']:
+                    label = '<= {} ms'.format(edge) if edge is not None else '> {} ms'.format(LATENCY_BUCKETS[-1])
+                    print('  {:>12} {:>6}'.format(label, count))
+
+
+def _milliseconds(seconds):
+    return 1000 * seconds if seconds is not None else None
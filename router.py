@@ -0,0 +1,165 @@
+"""
+This module defines the Router class, which plays the game automatically.
+
+The router uses a SABRE-style heuristic (see https://arxiv.org/abs/1809.02573): whenever the current CNOT does not lie
+on the architecture, it makes the swap which brings the qubits of the CNOT closer together and, among those, the one
+which also brings the upcoming CNOTs closest together. The initial mapping (stage 1) is chosen by routing the circuit
+forwards and then backwards, and starting from where the backwards pass ends.
+
+The router plays on an `Engine`, so it produces exactly the same outputs as the game, e.g.
+
+    router = Router(architecture)
+    engine = router.route(circuit)
+    engine.result()
+"""
+
+from engine import Engine
+from util import distance_lists
+
+
+class Router:
+    """
+        Routes circuits onto a fixed architecture. The distances between qubits are computed once, so the same router
+        can be used for a batch of circuits.
+    """
+
+    def __init__(self, architecture, lookahead=20, lookahead_weight=0.8, initial_passes=1):
+        """
+
+        :param architecture:        A list of edges as tuples,  e.g. [(1,2), (2,3), (1,3)].
+        :param lookahead:           The number of upcoming CNOTs taken into account when choosing a swap.
+        :param lookahead_weight:    The weight of the upcoming CNOTs decays geometrically by this factor.
+        :param initial_passes:      The number of forwards and backwards passes used to choose the initial mapping,
+                                    if 0 the identity is used.
+        """
+        self.arc = list(architecture)
+        self.num_arc_qubits = max([max(x) for x in self.arc]) + 1
+        self.distances = distance_lists(self.arc)
+        if min(min(row) for row in self.distances) < 0:
+            raise ValueError('The architecture must be connected.')
+
+        self.neighbours = [[] for _ in range(self.num_arc_qubits)]
+        for a, b in self.arc:
+            self.neighbours[a].append(b)
+            self.neighbours[b].append(a)
+
+        self.lookahead = lookahead
+        self.weights = [lookahead_weight**j for j in range(lookahead + 1)]
+        self.initial_passes = initial_passes
+
+    def route(self, circuit):
+        """
+        Plays a whole game on the circuit.
+
+        :param circuit:     A `qiskit.QuantumCircuit` object.
+        :return:            The `Engine` of the finished game, see `Engine.result` and `Engine.save` for its outputs.
+        """
+        engine = Engine(circuit, self.arc)
+        self.play(engine)
+        return engine
+
+    def route_all(self, circuits):
+        """
+        Routes each circuit in `circuits` and returns a list of their results (see `Engine.result`).
+        """
+        return [self.route(circuit).result() for circuit in circuits]
+
+    def play(self, engine):
+        """
+        Plays the rest of the game on `engine`, which must be on the same architecture as the router.
+        """
+        pairs = cnot_pairs(engine)
+
+        if engine.stage == 1:
+            engine.set_initial_mapping(self.initial_mapping(pairs, engine.current_mapping))
+
+        while engine.stage != 3:
+            if engine.is_legal():
+                engine.advance()
+            else:
+                engine.apply_swap(*self.best_swap(pairs, engine.current_cnot(), engine.current_mapping))
+
+        return engine
+
+    def initial_mapping(self, pairs, mapping):
+        """
+        Chooses an initial mapping by routing `pairs` forwards and backwards (starting from `mapping`).
+        """
+        mapping = mapping.copy()
+        reversed_pairs = pairs[::-1]
+        for _ in range(self.initial_passes):
+            self.simulate(pairs, mapping)
+            self.simulate(reversed_pairs, mapping)
+
+        return mapping
+
+    def simulate(self, pairs, mapping, swaps=None):
+        """
+        Routes the CNOTs on the logical qubits `pairs`, only updating `mapping` (in place).
+
+        :param swaps:   If a list is given, the swaps made are appended to it.
+        :return: the number of swaps made.
+        """
+        distances = self.distances
+        num_swaps = 0
+        for i, (a, b) in enumerate(pairs):
+            while distances[mapping(a)][mapping(b)] > 1:
+                swap = self.best_swap(pairs, i, mapping)
+                mapping.transpose(*swap)
+                num_swaps += 1
+                if swaps is not None:
+                    swaps.append(swap)
+
+        return num_swaps
+
+    def best_swap(self, pairs, i, mapping):
+        """
+        Chooses the swap to make when the CNOT `pairs[i]` does not lie on the architecture: only swaps which bring its
+        qubits closer together are considered, so routing always finishes.
+
+        :return: the swap as a pair of physical qubits.
+        """
+        distances = self.distances
+        window = pairs[i:i + self.lookahead + 1]
+        weights = self.weights
+
+        physical = [(mapping(a), mapping(b)) for a, b in window]
+        x, y = physical[0]
+        d = distances[x][y]
+
+        best, best_cost = None, None
+        for p, q in [(x, y), (y, x)]:
+            for r in self.neighbours[p]:
+                if distances[r][q] >= d:  # must move p closer to q
+                    continue
+
+                cost = 0
+                for weight, (u, v) in zip(weights, physical):
+                    # the physical qubits after swapping p and r
+                    u = r if u == p else p if u == r else u
+                    v = r if v == p else p if v == r else v
+                    cost += weight * distances[u][v]
+
+                if best_cost is None or cost < best_cost:
+                    best, best_cost = (p, r), cost
+
+        return best
+
+
+def cnot_pairs(engine):
+    """
+    Returns the logical qubits of each CNOT in the (native gate) circuit of `engine`, in order.
+    """
+    return [(a, b) for a, b in zip(engine.gate_q0, engine.gate_q1) if b >= 0]
+
+
+if __name__ == '__main__':
+    import time
+    from catalog import levels
+
+    # par scores for the levels
+    for level in levels():
+        engine = level.engine()
+        start = time.perf_counter()
+        Router(engine.arc).play(engine)
+        print('Level {:>2}: {:>3} swaps ({:.3f} s)'.format(level.number, engine.num_swaps, time.perf_counter() - start))
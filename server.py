@@ -0,0 +1,463 @@
+"""
+This module hosts many games of Swaperation at once, in a single process, for players over the network.
+
+Each session is a headless game, i.e. an `Engine` with no plotting. The levels are loaded once from the catalog (see
+`catalog.py`) and every session of a level shares the tables of its circuit and architecture (see
+`Engine.new_game`), so a session only holds its own mappings and moves. Sessions which are idle for longer than
+`idle_timeout` are closed. A session with `max_pending` requests already waiting for it refuses more (with status 429)
+rather than queueing them, and no more than `max_sessions` are open at once (503).
+
+The protocol is HTTP/1.1 with JSON bodies, on connections which are kept alive:
+
+    POST   /sessions                {"level": 5, "front_layer": false}  -->  the state of the new session
+    GET    /sessions/<id>           -->  the state of the session
+    POST   /sessions/<id>/moves     {"moves": [["swap", 0, 1], ["advance"], ["undo"], ["redo"]]}  -->  its state
+    GET    /sessions/<id>/result    -->  the details of the game (see `Engine.details`) and the final circuit as QASM
+    DELETE /sessions/<id>
+    GET    /stats
+
+Moves which are not allowed stop the batch and return status 409 with the state. Run as `python server.py --port 8000`;
+`Client` is a small client for the same protocol.
+"""
+
+import asyncio
+import itertools
+import json
+import time
+
+from catalog import levels, LEVELS_DIR
+
+
+MOVE_KINDS = ('swap', 'advance', 'undo', 'redo')
+MOVES_PER_YIELD = 64  # a long batch of moves lets other sessions run after this many moves
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 409: 'Conflict',
+           413: 'Payload Too Large', 429: 'Too Many Requests', 503: 'Service Unavailable'}
+
+
+class RequestError(Exception):
+    """
+        An error which is returned to the client with an HTTP status.
+    """
+
+    def __init__(self, status, message, body=None):
+        super().__init__(message)
+        self.status = status
+        self.body = body if body is not None else {'error': message}
+
+
+class LevelStore:
+    """
+        The levels which sessions can play, shared (read-only) by every session: each level is loaded once, as an
+        engine whose tables are shared by the engines of its sessions.
+    """
+
+    def __init__(self, directory=LEVELS_DIR):
+        self.levels = {level.number: level for level in levels(directory)}
+        self._engines = {}  # {(level number, front_layer): engine at the start of the level}
+        self._loading = {}  # {(level number, front_layer): future of the engine being built by `load`}
+
+    def preload(self, front_layer=(False,)):
+        """
+        Loads every level, so that no session has to wait for a level to be built.
+        """
+        for number in self.levels:
+            for front in front_layer:
+                self.new_engine(number, front)
+
+    async def load(self, number, front_layer=False):
+        """
+        Loads level `number` (if it is not loaded yet) in a thread, so that the sessions already open keep being served
+        while it is built. Requests for a level which is being loaded wait for the same build.
+        """
+        key = (number, bool(front_layer))
+        if key in self._engines:
+            return
+        if number not in self.levels:
+            raise RequestError(404, 'There is no level {}.'.format(number))
+        future = self._loading.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(None, self._build, number, bool(front_layer))
+            self._loading[key] = future
+        try:
+            engine = await future
+        finally:
+            self._loading.pop(key, None)
+        self._engines.setdefault(key, engine)
+
+    def new_engine(self, number, front_layer=False):
+        """
+        Returns a new engine at the start of level `number`, building the level here if it is not loaded (see `load`).
+        """
+        key = (number, bool(front_layer))
+        if key not in self._engines:
+            if number not in self.levels:
+                raise RequestError(404, 'There is no level {}.'.format(number))
+            self._engines[key] = self._build(number, bool(front_layer))
+        return self._engines[key].new_game()
+
+    def _build(self, number, front_layer):
+        from engine import Engine
+        loaded = self.levels[number].load()
+        return Engine.from_tables(loaded['tables'], loaded['architecture'], front_layer=front_layer)
+
+
+class Session:
+    """
+        A game played by a single player.
+    """
+
+    __slots__ = ('id', 'level', 'engine', 'last_active', 'pending', 'lock')
+
+    def __init__(self, session_id, level, engine, now):
+        self.id = session_id
+        self.level = level
+        self.engine = engine
+        self.last_active = now
+        self.pending = 0  # the requests waiting for (or holding) the lock
+        self.lock = asyncio.Lock()
+
+    def state(self):
+        engine = self.engine
+        gate = engine.current_gate()
+        return {
+                'session': self.id,
+                'level': self.level,
+                'stage': engine.stage,
+                'num_swaps': engine.num_swaps,
+                'gates_remaining': engine.gates_remaining(),
+                'current_gate': list(engine.physical(gate)) if gate is not None else None,
+                'legal': engine.is_legal(),
+                'mapping': engine.current_mapping.to_list(),
+                'num_moves': len(engine.moves),
+                }
+
+
+class Server:
+    """
+        Hosts the sessions, see the description of the module.
+    """
+
+    def __init__(self, store=None, max_sessions=10000, max_pending=4, idle_timeout=600., request_timeout=30.,
+                 max_moves=1000, max_body=1 << 16, clock=time.monotonic):
+        """
+
+        :param store:           The `LevelStore` of the levels, by default every level in `levels`.
+        :param max_sessions:    The most sessions open at once.
+        :param max_pending:     The most requests which can wait for a single session.
+        :param idle_timeout:    The time (in seconds) after which a session with no requests is closed.
+        :param request_timeout: The time (in seconds) a connection has to send a whole request, after which it is
+                                closed, so slow or stuck clients do not hold on to the server.
+        :param max_moves:       The most moves in a single request.
+        :param max_body:        The largest body of a request (in bytes).
+        :param clock:           The clock of the timeouts.
+        """
+        self.store = store if store is not None else LevelStore()
+        self.max_sessions = max_sessions
+        self.max_pending = max_pending
+        self.idle_timeout = idle_timeout
+        self.request_timeout = request_timeout
+        self.max_moves = max_moves
+        self.max_body = max_body
+        self.clock = clock
+
+        self.sessions = {}
+        self._ids = itertools.count(1)
+        self.counts = {'sessions_opened': 0, 'sessions_expired': 0, 'requests': 0, 'moves': 0, 'rejected': 0}
+        self._server = None
+        self._reaper = None
+
+    async def start(self, host='127.0.0.1', port=0):
+        """
+        Starts serving on `host` and `port` (any free port for 0), returning the port.
+        """
+        self._server = await asyncio.start_server(self._serve_connection, host, port)
+        self._reaper = asyncio.ensure_future(self._reap())
+        return self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    # sessions
+
+    def open_session(self, level, front_layer=False):
+        if len(self.sessions) >= self.max_sessions:
+            raise RequestError(503, 'Too many sessions.')
+        engine = self.store.new_engine(level, front_layer)
+        session = Session(next(self._ids), level, engine, self.clock())
+        self.sessions[session.id] = session
+        self.counts['sessions_opened'] += 1
+        return session
+
+    def get_session(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise RequestError(404, 'There is no session {}.'.format(session_id))
+        session.last_active = self.clock()
+        return session
+
+    def close_session(self, session_id):
+        self.sessions.pop(self.get_session(session_id).id)
+
+    def expire(self):
+        """
+        Closes the sessions which have been idle for longer than `idle_timeout`, returning how many were closed.
+        """
+        oldest = self.clock() - self.idle_timeout
+        expired = [s.id for s in self.sessions.values() if s.last_active < oldest and not s.pending]
+        for session_id in expired:
+            del self.sessions[session_id]
+        self.counts['sessions_expired'] += len(expired)
+        return len(expired)
+
+    async def _reap(self):
+        while True:
+            await asyncio.sleep(min(self.idle_timeout / 4, 60.))
+            self.expire()
+
+    async def play(self, session_id, moves):
+        """
+        Makes `moves` in a session, in order, stopping at the first move which is not allowed.
+
+        :return: the state of the session.
+        """
+        session = self.get_session(session_id)
+        if not isinstance(moves, list) or len(moves) > self.max_moves:
+            raise RequestError(400, 'The moves must be a list of at most {} moves.'.format(self.max_moves))
+        if session.pending >= self.max_pending:
+            self.counts['rejected'] += 1
+            raise RequestError(429, 'Too many requests for session {}.'.format(session_id))
+
+        session.pending += 1
+        try:
+            async with session.lock:
+                engine = session.engine
+                for k, move in enumerate(moves):
+                    if k and k % MOVES_PER_YIELD == 0:
+                        await asyncio.sleep(0)
+                    if not _make_move(engine, move):
+                        raise RequestError(409, 'The move {} is not allowed.'.format(move),
+                                           dict(session.state(), error='The move {} is not allowed.'.format(move)))
+                    self.counts['moves'] += 1
+                return session.state()
+        finally:
+            session.pending -= 1
+            session.last_active = self.clock()
+
+    def stats(self):
+        return dict(self.counts, sessions=len(self.sessions), levels=sorted(self.store.levels))
+
+    # HTTP
+
+    async def dispatch(self, method, path, body):
+        """
+        Answers a single request, returning the JSON body of the response.
+        """
+        self.counts['requests'] += 1
+        parts = [part for part in path.split('?')[0].split('/') if part]
+        if parts == ['stats'] and method == 'GET':
+            return self.stats()
+        if not parts or parts[0] != 'sessions' or len(parts) > 3:
+            raise RequestError(404, 'Unknown path {}.'.format(path))
+
+        if len(parts) == 1:
+            if method != 'POST':
+                raise RequestError(405, 'Use POST to open a session.')
+            try:
+                level = int(body.get('level', 1))
+            except (TypeError, ValueError):
+                raise RequestError(400, 'The level must be a number.')
+            front_layer = bool(body.get('front_layer', False))
+            await self.store.load(level, front_layer)  # not on the event loop, as building a level takes a while
+            return self.open_session(level, front_layer).state()
+
+        try:
+            session_id = int(parts[1])
+        except ValueError:
+            raise RequestError(404, 'There is no session {}.'.format(parts[1]))
+        action = parts[2] if len(parts) == 3 else None
+
+        if action is None and method == 'GET':
+            return self.get_session(session_id).state()
+        if action is None and method == 'DELETE':
+            self.close_session(session_id)
+            return {'session': session_id, 'closed': True}
+        if action == 'moves' and method == 'POST':
+            return await self.play(session_id, body.get('moves'))
+        if action == 'result' and method == 'GET':
+            session = self.get_session(session_id)
+            if session.engine.stage != 3:
+                raise RequestError(409, 'The game is not over.', dict(session.state(), error='The game is not over.'))
+            return {'details': session.engine.details(), 'final_circuit': session.engine.final_circ.qasm()}
+        raise RequestError(405 if action in (None, 'moves', 'result') else 404,
+                           'Cannot {} {}.'.format(method, path))
+
+    async def _serve_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(_read_request(reader, self.max_body), self.request_timeout)
+                except asyncio.TimeoutError:
+                    break
+                except RequestError as error:
+                    await _write_response(writer, error.status, error.body, keep_alive=False)
+                    break
+                if request is None:  # the client closed the connection
+                    break
+
+                method, path, headers, body = request
+                try:
+                    status, response = 200, await self.dispatch(method, path, body)
+                except RequestError as error:
+                    status, response = error.status, error.body
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await _write_response(writer, status, response, keep_alive)  # waits while the client is slow to read
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:  # the client has already gone
+                pass
+
+
+def _make_move(engine, move):
+    if not isinstance(move, (list, tuple)) or not move or move[0] not in MOVE_KINDS:
+        raise RequestError(400, 'Unknown move {}; the moves are {}.'.format(move, ', '.join(MOVE_KINDS)))
+    kind = move[0]
+    if kind == 'swap':
+        if len(move) != 3 or not all(isinstance(x, int) and not isinstance(x, bool) and 0 <= x < engine.num_arc_qubits
+                                     for x in move[1:]):
+            raise RequestError(400, 'A swap is ["swap", x, y] with x and y qubits of the architecture.')
+        return engine.apply_swap(move[1], move[2])
+    elif kind == 'advance':
+        return engine.advance()
+    elif kind == 'undo':
+        return engine.undo()
+    return engine.redo()
+
+
+async def _read_request(reader, max_body):
+    """
+    Reads a request, returning its method, path, headers and JSON body, or `None` if the connection was closed.
+    """
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, path, _ = line.decode('latin-1').split()
+    except ValueError:
+        raise RequestError(400, 'Bad request line.')
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    try:
+        length = int(headers.get('content-length', 0) or 0)
+    except ValueError:
+        raise RequestError(400, 'Bad Content-Length.')
+    if length < 0:
+        raise RequestError(400, 'Bad Content-Length.')
+    if length > max_body:
+        raise RequestError(413, 'The body is larger than {} bytes.'.format(max_body))
+    body = {}
+    if length:
+        try:
+            body = json.loads(await reader.readexactly(length))
+        except ValueError:
+            raise RequestError(400, 'The body is not JSON.')
+        if not isinstance(body, dict):
+            raise RequestError(400, 'The body must be a JSON object.')
+    return method.upper(), path, headers, body
+
+
+async def _write_response(writer, status, body, keep_alive=True):
+    data = json.dumps(body).encode()
+    writer.write('HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\nConnection: {}\r\n\r\n'
+                 .format(status, REASONS.get(status, ''), len(data), 'keep-alive' if keep_alive else 'close')
+                 .encode() + data)
+    await writer.drain()
+
+
+class Client:
+    """
+        A client of the server, over a single connection which is kept alive, e.g.
+
+            client = await Client.connect('127.0.0.1', port)
+            status, state = await client.request('POST', '/sessions', {'level': 5})
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host, port):
+        return cls(*await asyncio.open_connection(host, port))
+
+    async def request(self, method, path, body=None):
+        """
+        Sends a request, returning the status and the JSON body of the response.
+        """
+        data = json.dumps(body).encode() if body is not None else b''
+        self.writer.write('{} {} HTTP/1.1\r\nHost: swaperation\r\nContent-Type: application/json\r\n'
+                          'Content-Length: {}\r\n\r\n'.format(method, path, len(data)).encode() + data)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            if name.strip().lower() == 'content-length':
+                length = int(value)
+        return status, json.loads(await self.reader.readexactly(length))
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def serve(host='127.0.0.1', port=8000, preload=True, **kwargs):
+    """
+    Runs a server until it is cancelled. The keyword arguments are passed on to `Server`.
+    """
+    server = Server(**kwargs)
+    if preload:
+        server.store.preload()
+    port = await server.start(host, port)
+    print('Serving {} levels on http://{}:{}'.format(len(server.store.levels), host, port))
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Hosts many games at once.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-sessions', type=int, default=10000)
+    parser.add_argument('--idle-timeout', type=float, default=600., help='in seconds')
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, max_sessions=args.max_sessions, idle_timeout=args.idle_timeout))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,285 @@
+"""
+This module finds the fewest swaps needed to finish a game, i.e. the true best score of a level.
+
+The search is A* over states (index of the next CNOT, positions of the logical qubits), where each move is a swap on
+the architecture followed by doing every CNOT which then lies on the architecture. Positions are encoded as integers,
+with the qubits which are not in any CNOT treated as identical. The heuristic is admissible since a swap moves each of
+two logical qubits one step, so it brings the qubits of a CNOT at most one step closer, and the qubits of CNOTs on
+distinct qubits at most two steps closer in total.
+
+In stage 1 the initial mapping is free, so the search starts from every mapping which puts the first CNOT on the
+architecture (any other mapping is no better than the mapping reached by its first few swaps). If the search needs more
+than `max_states` states, it stops and reports the best bounds it has instead, e.g.
+
+    engine = Level5().engine
+    solution = solve(engine)
+    solution['num_swaps'], solution['optimal']
+    replay(engine, solution)
+"""
+
+import heapq
+from itertools import permutations
+
+from router import Router, cnot_pairs
+
+
+def solve(engine, max_states=1000000):
+    """
+    Finds the fewest swaps needed to finish the game on `engine` from its current state (which is not changed).
+
+    :param engine:          An `Engine` in stage 1 (the initial mapping is then free) or 2.
+    :param max_states:      The maximum number of states to store, after which the search stops.
+    :return:    A dictionary with the keys
+                * 'optimal': `True` if the search finished, and so 'num_swaps' is optimal.
+                * 'num_swaps': the number of swaps of the solution, which is an upper bound if not optimal.
+                * 'lower_bound': the proven lower bound on the number of swaps (equal to 'num_swaps' if optimal).
+                * 'initial_mapping': the mapping to start from (only different from the current mapping in stage 1).
+                * 'swaps': the swaps (as pairs of physical qubits) of the solution, see `replay`.
+                * 'num_states': the number of states stored.
+    """
+    if engine.front_layer:
+        raise ValueError('The solver only plays the gates in the order of the circuit, not with front_layer.')
+    if engine.stage == 3:
+        return _solution(True, 0, engine.current_mapping.to_list(), [], 0)
+
+    search = _Search(engine)
+    pairs = cnot_pairs(engine)
+    start = engine.num_cnots_done
+
+    if engine.stage == 1:
+        starts = search.free_starts(pairs[0])
+    else:
+        starts = [search.encode([search.local.get(engine.current_mapping.inverse(p), search.blank)
+                                 for p in range(search.num_qubits)])]
+
+    parents = {}  # state --> (previous state, swap), also used as the table of visited states
+    costs = {}  # state --> fewest swaps found to reach it
+    queue = []
+    for code in starts:
+        if len(costs) >= max_states:
+            # too many starting states to search: the starts not yet queued are bounded by `partner_bound` (enumerating
+            # them all to take their heuristics could take far longer than the search itself)
+            lower_bound = min([f for f, _, _, _ in queue] + [search.partner_bound()])
+            return _fallback(engine, lower_bound, len(costs))
+
+        positions = search.decode(code)
+        index = search.advance(start, positions)
+        state = (index, code)
+        if state not in costs:
+            costs[state] = 0
+            parents[state] = None
+            heapq.heappush(queue, (search.heuristic(index, positions), 0, index, code))
+
+    while queue:
+        f, g, index, code = heapq.heappop(queue)
+        if g > costs[(index, code)]:
+            continue  # already reached with fewer swaps
+
+        if index == search.num_cnots:
+            swaps = []
+            state = (index, code)
+            while parents[state] is not None:
+                state, swap = parents[state]
+                swaps.append(swap)
+            if engine.stage == 1:
+                initial_mapping = search.mapping(state[1])
+            else:
+                initial_mapping = engine.current_mapping.to_list()
+            return _solution(True, g, initial_mapping, swaps[::-1], len(costs))
+
+        if len(costs) > max_states:
+            return _fallback(engine, f, len(costs))
+
+        positions = search.decode(code)
+        for p, q in search.arc:
+            if positions[p] == positions[q]:  # both qubits are unused
+                continue
+            positions[p], positions[q] = positions[q], positions[p]
+            new_index = search.advance(index, positions)
+            new_state = (new_index, search.encode(positions))
+            if g + 1 < costs.get(new_state, g + 2):
+                costs[new_state] = g + 1
+                parents[new_state] = ((index, code), (p, q))
+                heapq.heappush(queue, (g + 1 + search.heuristic(new_index, positions), g + 1) + new_state)
+            positions[p], positions[q] = positions[q], positions[p]
+
+    raise ValueError('The game cannot be finished on this architecture.')
+
+
+def replay(engine, solution):
+    """
+    Plays the solution found by `solve` on `engine`, which must be in the same state as when it was solved.
+    """
+    engine.set_initial_mapping(solution['initial_mapping'])
+    for swap in solution['swaps']:
+        while engine.is_legal():
+            engine.advance()
+        engine.apply_swap(*swap)
+
+    while engine.stage != 3:
+        assert(engine.advance())
+
+    return engine
+
+
+class _Search:
+    """
+    The encoding of the states and the heuristic. Only the logical qubits in CNOTs still to be done are tracked, by
+    their 'local' index, and `positions[p]` is the local index of the qubit on the physical qubit `p` (or `blank`).
+    """
+
+    def __init__(self, engine):
+        self.arc = [tuple(e) for e in engine.arc]
+        self.num_qubits = engine.num_arc_qubits
+        self.distances = Router(engine.arc, initial_passes=0).distances
+
+        pairs = cnot_pairs(engine)[engine.num_cnots_done:]
+        logicals = sorted(set(q for pair in pairs for q in pair))
+        self.logicals = logicals
+        self.local = {logical: i for i, logical in enumerate(logicals)}
+        self.blank = len(logicals)
+        self.bits = self.blank.bit_length()
+        self.mask = (1 << self.bits) - 1
+
+        self.offset = engine.num_cnots_done
+        self.pairs = [(self.local[a], self.local[b]) for a, b in pairs]
+        self.num_cnots = engine.num_cnots_done + len(pairs)
+
+    def encode(self, positions):
+        code = 0
+        for p in reversed(range(self.num_qubits)):
+            code = (code << self.bits) | positions[p]
+        return code
+
+    def decode(self, code):
+        positions = []
+        for _ in range(self.num_qubits):
+            positions.append(code & self.mask)
+            code >>= self.bits
+        return positions
+
+    def locations(self, positions):
+        where = [0] * (self.blank + 1)
+        for p, i in enumerate(positions):
+            where[i] = p
+        return where
+
+    def mapping(self, code):
+        """
+        Returns the full 'logical qubit' --> 'physical qubit' mapping, putting the unused qubits anywhere free.
+        """
+        positions = self.decode(code)
+        mapping = [None] * self.num_qubits
+        for p, i in enumerate(positions):
+            if i != self.blank:
+                mapping[self.logicals[i]] = p
+        free = iter([p for p, i in enumerate(positions) if i == self.blank])
+        return [p if p is not None else next(free) for p in mapping]
+
+    def advance(self, index, positions):
+        """
+        Returns the index of the first CNOT (from `index`) which does not lie on the architecture.
+        """
+        where = self.locations(positions)
+        distances = self.distances
+        while index < self.num_cnots:
+            a, b = self.pairs[index - self.offset]
+            if distances[where[a]][where[b]] != 1:
+                break
+            index += 1
+        return index
+
+    def heuristic(self, index, positions):
+        where = self.locations(positions)
+        distances = self.distances
+        largest, total = 0, 0
+        used = set()
+        for a, b in self.pairs[index - self.offset:]:
+            d = distances[where[a]][where[b]] - 1
+            if d > largest:
+                largest = d
+            if a not in used and b not in used:
+                total += d
+            used.add(a)
+            used.add(b)
+        return max(largest, (total + 1) // 2)
+
+    def partner_bound(self):
+        """
+        Returns a lower bound on the swaps needed from any mapping. A qubit on a physical qubit of degree at most `D`
+        has at most `D` neighbours, and each swap brings it at most `D` new ones (if it is swapped) or one (otherwise),
+        so a qubit in CNOTs with `k` other qubits needs at least (k - D) / D swaps.
+        """
+        degrees = [0] * self.num_qubits
+        for p, q in set((min(e), max(e)) for e in self.arc):
+            degrees[p] += 1
+            degrees[q] += 1
+        degree = max(degrees)
+
+        partners = [set() for _ in range(self.blank)]
+        for a, b in self.pairs:
+            partners[a].add(b)
+            partners[b].add(a)
+        return max([0] + [-(-(len(others) - degree) // degree) for others in partners])
+
+    def free_starts(self, first_pair):
+        """
+        Generates the encodings of every mapping which puts the first CNOT on the architecture.
+        """
+        a, b = self.local[first_pair[0]], self.local[first_pair[1]]
+        others = [i for i in range(self.blank) if i != a and i != b]
+        for p, q in self.arc + [e[::-1] for e in self.arc]:
+            rest = [x for x in range(self.num_qubits) if x != p and x != q]
+            for chosen in permutations(rest, len(others)):
+                positions = [self.blank] * self.num_qubits
+                positions[p], positions[q] = a, b
+                for i, x in zip(others, chosen):
+                    positions[x] = i
+                yield self.encode(positions)
+
+
+def _solution(optimal, num_swaps, initial_mapping, swaps, num_states, lower_bound=None):
+    return {
+            'optimal': optimal,
+            'num_swaps': num_swaps,
+            'lower_bound': num_swaps if lower_bound is None else lower_bound,
+            'initial_mapping': initial_mapping,
+            'swaps': swaps,
+            'num_states': num_states,
+            }
+
+
+def _fallback(engine, lower_bound, num_states):
+    """
+    The solution when the search runs out of space, where the router gives the upper bound (and the moves).
+    """
+    router = Router(engine.arc)
+    pairs = cnot_pairs(engine)[engine.num_cnots_done:]
+
+    if engine.stage == 1:
+        mapping = router.initial_mapping(pairs, engine.current_mapping)
+        router.simulate(pairs[:1], mapping)  # swaps before the first CNOT are free
+    else:
+        mapping = engine.current_mapping.copy()
+    initial_mapping = mapping.to_list()
+
+    swaps = []
+    router.simulate(pairs, mapping, swaps=swaps)
+    return _solution(False, len(swaps), initial_mapping, swaps, num_states, lower_bound=lower_bound)
+
+
+if __name__ == '__main__':
+    import time
+    from catalog import levels
+
+    # the true best scores of the levels
+    for level in levels():
+        engine = level.engine()
+        start = time.perf_counter()
+        solution = solve(engine)
+        if solution['optimal']:
+            score = '{}'.format(solution['num_swaps'])
+        else:
+            score = 'between {} and {}'.format(solution['lower_bound'], solution['num_swaps'])
+        print('Level {:>2}: {} swaps ({:.2f} s, {} states)'.format(level.number, score, time.perf_counter() - start,
+                                                                   solution['num_states']))
@@ -1,61 +1,57 @@
 """
 This module contains functions necessary to check the correctness of the output of the game. They are:
-* Checking if the output circuit and the input circuit are equivalent (`check_equiv_under_perms`).
+* Checking if the output circuit and the input circuit are equivalent, either gate by gate (`check_equiv_structural`,
+  or `check_equiv_cnot_frame` for optimized outputs), which is fast for any number of qubits, by simulating both
+  circuits on random states (`check_equiv_statevector`), which is feasible for up to about 25 qubits, or by simulating
+  both unitaries (`check_equiv_under_perms`), which is only feasible for small numbers of qubits.
 * Checking if the output circuit only contains gates native to the architecture (`check_circuit_compatible_with_arc`).
 """
 
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 from qiskit import Aer, execute
 import numpy as np
 
+from util import Permutation
+
 
 def order_rev_perm(n):
     p = [i for i in reversed(range(n))]
     return permutation(n, p)
 
 
-def bin_to_int(b):
-    n = 0
-    i = 0
-    for a in reversed(b):
-        if a == 1:
-            n += 2**i
-        i += 1
-    return n
+def permutation_index(n=2, new_ordering=(0, 1)):
+    """
+    Returns the index array `out` of the permutation of the qubit basis vectors given by a new ordering of the qubits,
+    i.e. basis vector `i` is mapped to basis vector `out[i]`. Qubit `j` is bit `n - 1 - j` of the index of a basis vector.
+    """
+    indices = np.arange(2**n, dtype=np.int64)
+    out = np.zeros(2**n, dtype=np.int64)
+    for j in range(n):
+        out |= ((indices >> (n - 1 - new_ordering[j])) & 1) << (n - 1 - j)
+    return out
+
+
+def swap_index(n=2, qubits=(0, 1)):
+    ordering = list(range(n))
+    ordering[qubits[0]], ordering[qubits[1]] = qubits[1], qubits[0]
+    return permutation_index(n, ordering)
 
 
-def int_to_bin(x, n):
-    b = [int(y) for y in list("{0:b}".format(x))]
-    for j in range(len(b), n):
-        b.insert(0, 0)
-    return b
+def cnot_index(control, target, n):
+    indices = np.arange(2**n, dtype=np.int64)
+    return indices ^ (((indices >> (n - 1 - control)) & 1) << (n - 1 - target))
 
 
 def swap(n=2, qubits=(0, 1)):
     mat = np.zeros((2**n, 2**n))
-    for i in range(2**n):
-        binary = int_to_bin(i, n)
-        binary_out = []
-        for j in range(n):
-            if j == qubits[0]:
-                binary_out.append(binary[qubits[1]])
-            elif j == qubits[1]:
-                binary_out.append(binary[qubits[0]])
-            else:
-                binary_out.append(binary[j])
-        out = bin_to_int(binary_out)
-        mat[i, out] = 1
+    mat[np.arange(2**n), swap_index(n, qubits)] = 1
     return mat
 
 
 def cnot(control, target, n):
     mat = np.zeros((2**n, 2**n), dtype='complex')
-    for i in range(2**n):
-        binary = int_to_bin(i, n)
-        binary_out = binary
-        if binary[control] == 1:
-            binary_out[target] = (binary_out[target] + 1)%2
-        out = bin_to_int(binary_out)
-        mat[i, out] = 1
+    mat[np.arange(2**n), cnot_index(control, target, n)] = 1
     return mat
 
 
@@ -64,13 +60,7 @@ def permutation(n=2, new_ordering=(0, 1)):
     Find permutation matrix on the qubit basis vectors given a new ordering (permutation) of qubits
     """
     mat = np.zeros((2**n, 2**n))
-    for i in range(2**n):
-        binary = int_to_bin(i, n)
-        binary_out = []
-        for j in range(n):
-            binary_out.append(binary[new_ordering[j]])
-        out = bin_to_int(binary_out)
-        mat[out, i] = 1
+    mat[permutation_index(n, new_ordering), np.arange(2**n)] = 1
     return mat
 
 
@@ -85,22 +75,347 @@ def check_equiv_under_perms(circ_1, circ_2, initial_placement, final_mapping, n)
     """
     """
     backend = Aer.get_backend('unitary_simulator')
+    rev = permutation_index(n, list(reversed(range(n))))
+    rev = np.ix_(rev, rev)  # rewrites a unitary in the qubit order (0, 1, 2, 3, ...)
 
     job = execute(circ_1, backend)
-    u_1 = job.result().get_unitary(circ_1, decimals=5)
-    u1 = order_rev_perm(n) @ u_1 @ order_rev_perm(n)  # rewrite the unitary in the qubit order (0, 1, 2, 3, ...)
+    u1 = np.asarray(job.result().get_unitary(circ_1, decimals=5))[rev]
 
     job = execute(circ_2, backend)
-    u_2 = job.result().get_unitary(circ_2, decimals=5)
-    u2 = order_rev_perm(n) @ u_2 @ order_rev_perm(n)
+    u2 = np.asarray(job.result().get_unitary(circ_2, decimals=5))[rev]
 
     return check_unitaries(u1, u2, initial_placement, final_mapping, n)
 
 
+def check_equiv_statevector(circ_1, circ_2, initial_mapping, final_mapping, num_states=2, seed=None):
+    """
+    Checks if `circ_2` does the same as `circ_1` (with the qubits relabelled by the mappings) to `num_states` random
+    states. Only a few states are stored, rather than the unitaries, so this needs O(2^n) memory instead of O(4^n) and
+    is feasible for up to about 25 qubits. Circuits which are not equivalent agree on a random state with probability 0.
+    The global phases of the circuits are ignored, as they are not stored in QASM.
+
+    :param circ_1:          The initial circuit (in terms of the circuit qubits).
+    :param circ_2:          The final circuit (in terms of the architecture qubits).
+    :param initial_mapping: The 'circuit qubit' --> 'architecture qubit' mapping at the start, as a list.
+    :param final_mapping:   The same mapping at the end, as a list.
+    :param num_states:      The number of random states to try.
+    :param seed:            The seed of the random states.
+    :return:
+    """
+    n = len(final_mapping)
+    placement = Permutation(list(initial_mapping))
+    placement = [placement.inverse(p) for p in range(n)]  # 'architecture qubit' --> 'circuit qubit'
+
+    rng = np.random.default_rng(seed)
+    for _ in range(num_states):
+        state = rng.normal(size=2**n) + 1j*rng.normal(size=2**n)
+        state /= np.linalg.norm(state)
+
+        expected = simulate_statevector(circ_1, state, n)
+        out = simulate_statevector(circ_2, relabel_statevector(state, n, placement), n)
+        if not np.allclose(expected, relabel_statevector(out, n, final_mapping)):
+            return False
+
+    return True
+
+
+def simulate_statevector(circuit, state, n):
+    """
+    Returns the state (in qiskit's qubit order) after applying the gates of `circuit` to `state`. Each gate is applied
+    in place to views of the state reshaped to one axis per qubit, so no matrix larger than a gate is ever built.
+    """
+    state = np.array(state, dtype=complex).reshape([2]*n)  # axis `n - 1 - q` is qubit `q`
+    for g in circuit.data:
+        name = g[0].name
+        qubits = [q.index for q in g[1]]
+        if name in ('barrier', 'id'):
+            continue
+        elif name == 'cx':
+            _apply_cnot(state, n - 1 - qubits[0], n - 1 - qubits[1])
+        elif len(qubits) == 1:
+            _apply_single_qubit_gate(state, np.asarray(g[0].to_matrix()), n - 1 - qubits[0])
+        else:
+            k = len(qubits)
+            gate = np.asarray(g[0].to_matrix()).reshape([2]*(2*k))  # axis `k - 1 - i` (+ k) is qubit `qubits[i]`
+            axes = [n - 1 - q for q in reversed(qubits)]
+            state = np.moveaxis(np.tensordot(gate, state, axes=(list(range(k, 2*k)), axes)), list(range(k)), axes)
+    return state.reshape(-1)
+
+
+def _apply_single_qubit_gate(state, gate, axis):
+    index = [slice(None)] * state.ndim + [Ellipsis]  # views, even when every axis is indexed
+    index[axis] = 0
+    a0 = state[tuple(index)]
+    index[axis] = 1
+    a1 = state[tuple(index)]
+
+    if gate[0, 1] == 0 and gate[1, 0] == 0:
+        a0 *= gate[0, 0]
+        a1 *= gate[1, 1]
+    else:
+        new_a0 = gate[0, 0]*a0 + gate[0, 1]*a1
+        a1 *= gate[1, 1]
+        a1 += gate[1, 0]*a0
+        a0[...] = new_a0
+
+
+def _apply_cnot(state, control_axis, target_axis):
+    index = [slice(None)] * state.ndim + [Ellipsis]  # views, even when every axis is indexed
+    index[control_axis] = 1
+    index[target_axis] = 0
+    a0 = state[tuple(index)]
+    index[target_axis] = 1
+    a1 = state[tuple(index)]
+
+    a0_copy = a0.copy()
+    a0[...] = a1
+    a1[...] = a0_copy
+
+
+def relabel_statevector(state, n, new_ordering):
+    """
+    Returns the state (in qiskit's qubit order) with the qubits reordered, so that qubit `j` is qubit `new_ordering[j]`
+    of `state`.
+    """
+    axes = [n - 1 - new_ordering[n - 1 - k] for k in range(n)]
+    return np.asarray(state).reshape([2]*n).transpose(axes).reshape(-1)
+
+
+def check_equiv_structural(circ_1, circ_2, initial_mapping, final_mapping):
+    """
+    Checks if `circ_2` is `circ_1` with its qubits relabelled and swaps (as three CNOTs) inserted, which is how the game
+    writes its output. Gates on different qubits may be in a different order (e.g. after reading the circuits from QASM),
+    so both circuits are compared qubit by qubit: each gate of `circ_2` must be the next gate of `circ_1` on all of its
+    qubits, or start a swap (three CNOTs which are consecutive on both of their qubits). This walks over both lists of
+    gates once, keeping track of the mapping through the swaps, so it takes time linear in the number of gates.
+
+    If three CNOTs could be either a swap or gates of `circ_1`, both are tried, so the check is exact.
+
+    :param circ_1:          The initial circuit (in terms of the circuit qubits).
+    :param circ_2:          The final circuit (in terms of the architecture qubits).
+    :param initial_mapping: The 'circuit qubit' --> 'architecture qubit' mapping at the start, as a list.
+    :param final_mapping:   The same mapping at the end, as a list.
+    :return:
+    """
+    gates_1 = [_gate_key(g) for g in circ_1.data]
+    gates_2 = [_gate_key(g) for g in circ_2.data]
+    final_mapping = list(final_mapping)
+    num_qubits = len(final_mapping)
+
+    wires = [[] for _ in range(num_qubits)]  # the indices of the gates of `circ_1` on each circuit qubit, in order
+    for k, (_, _, qubits) in enumerate(gates_1):
+        for q in qubits:
+            wires[q].append(k)
+    following = _following_gates(gates_2, num_qubits)
+
+    # `done[q]` is the number of gates of `circ_1` done on circuit qubit `q`, and `skip` holds the indices of the last
+    # two CNOTs of the swaps which have been started
+    branches = [(0, [0] * num_qubits, Permutation(list(initial_mapping)), set())]
+    tried = set()
+    while branches:
+        j, done, mapping, skip = branches.pop()
+
+        while True:
+            if j == len(gates_2):
+                if all(d == len(w) for d, w in zip(done, wires)) and mapping.to_list() == final_mapping:
+                    return True
+                break
+
+            if j in skip:
+                skip.discard(j)
+                j += 1
+                continue
+
+            k = _next_gate(gates_1, wires, done, gates_2[j], mapping)
+            swap = _swap_from(gates_2, following, j)
+
+            if k is not None and swap:  # keep the other option for later
+                key = (j, tuple(done), tuple(mapping.to_list()), frozenset(skip))
+                if key not in tried:
+                    tried.add(key)
+                    branch = mapping.copy()
+                    branch.transpose(*gates_2[j][2])
+                    branches.append((j + 1, list(done), branch, skip | set(swap)))
+
+            if k is not None:
+                for q in gates_1[k][2]:
+                    done[q] += 1
+            elif swap:
+                mapping.transpose(*gates_2[j][2])
+                skip.update(swap)
+            else:
+                break
+            j += 1
+
+    return False
+
+
+def _gate_key(g):
+    return g[0].name, tuple(float(p) for p in g[0].params), tuple(q.index for q in g[1])
+
+
+def _gates_match(gate_1, gate_2, mapping):
+    name_1, params_1, qubits_1 = gate_1
+    name_2, params_2, qubits_2 = gate_2
+    return (name_1 == name_2 and len(qubits_1) == len(qubits_2)
+            and all(mapping(a) == b for a, b in zip(qubits_1, qubits_2))
+            and all(abs(x - y) < 1e-8 for x, y in zip(params_1, params_2)))
+
+
+def _next_gate(gates_1, wires, done, gate_2, mapping):
+    """
+    Returns the index of the gate of `circ_1` which `gate_2` does under `mapping`, or `None` if there is none (the gate
+    must be the next one not done on each of its qubits).
+    """
+    qubits = [mapping.inverse(q) for q in gate_2[2]]
+    if not qubits or done[qubits[0]] == len(wires[qubits[0]]):
+        return None
+    k = wires[qubits[0]][done[qubits[0]]]
+    if not _gates_match(gates_1[k], gate_2, mapping):
+        return None
+    if any(done[q] == len(wires[q]) or wires[q][done[q]] != k for q in qubits[1:]):
+        return None
+    return k
+
+
+def _following_gates(gates, num_qubits):
+    """
+    Returns, for each gate, a dictionary of the index of the next gate on each of its qubits (or `None`).
+    """
+    following = [None] * len(gates)
+    upcoming = [None] * num_qubits
+    for j in reversed(range(len(gates))):
+        qubits = gates[j][2]
+        following[j] = {q: upcoming[q] for q in qubits}
+        for q in qubits:
+            upcoming[q] = j
+    return following
+
+
+def _swap_from(gates, following, j):
+    """
+    Returns the indices of the last two CNOTs of the swap started by the CNOT at index `j`, or `None` if it does not
+    start a swap.
+    """
+    name, _, qubits = gates[j]
+    if name != 'cx':
+        return None
+    a, b = qubits
+    indices = []
+    for expected in ((b, a), (a, b)):
+        k = following[j][a]
+        if k is None or k != following[j][b] or gates[k][0] != 'cx' or gates[k][2] != expected:
+            return None
+        indices.append(k)
+        j = k
+    return indices
+
+
+def check_equiv_cnot_frame(circ_1, circ_2, initial_mapping, final_mapping):
+    """
+    Checks if `circ_2` is `circ_1` relabelled, with any CNOTs added or rewritten, as long as every other gate is still
+    on the same qubits as in `circ_1` when it is done. This is the case for the output of the game after `peephole`
+    (which cancels and merges the CNOTs of the swaps), where `check_equiv_structural` does not apply.
+
+    The CNOTs not yet matched are kept as a 'frame': the invertible linear map P (over the bits of the basis states)
+    such that the gates of `circ_2` so far are P times the gates of `circ_1` done so far. A CNOT of `circ_2` multiplies P
+    on the left, and a CNOT of `circ_1` (as soon as it is the next gate on both of its qubits) on the right. Any other
+    gate of `circ_2`, on physical qubits p, is the next gate of `circ_1` on circuit qubits q when P maps each q to p
+    alone, as then the gate commutes with P. At the end P must be the final mapping. P is stored as bit masks of both
+    its rows and its columns, so each CNOT takes time proportional to the qubits it touches in P.
+
+    :param circ_1:          The initial circuit (in terms of the circuit qubits).
+    :param circ_2:          The final circuit (in terms of the architecture qubits).
+    :param initial_mapping: The 'circuit qubit' --> 'architecture qubit' mapping at the start, as a list.
+    :param final_mapping:   The same mapping at the end, as a list.
+    :return:
+    """
+    gates_1 = [_gate_key(g) for g in circ_1.data if g[0].name != 'barrier']
+    num_qubits = len(final_mapping)
+
+    rows = [0] * num_qubits  # rows[p]: the circuit qubits whose bits are added up on physical qubit p
+    cols = [0] * num_qubits  # cols[q]: the physical qubits which circuit qubit q is added to
+    for q, p in enumerate(initial_mapping):
+        rows[p] = 1 << q
+        cols[q] = 1 << p
+
+    def bits(mask):
+        while mask:
+            low = mask & -mask
+            yield low.bit_length() - 1
+            mask ^= low
+
+    def left_cx(c, t):  # P <- CX(c, t) P
+        rows[t] ^= rows[c]
+        for q in bits(rows[c]):
+            cols[q] ^= 1 << t
+
+    def right_cx(c, t):  # P <- P CX(c, t)
+        cols[c] ^= cols[t]
+        for p in bits(cols[t]):
+            rows[p] ^= 1 << c
+
+    wires = [[] for _ in range(num_qubits)]
+    for k, (_, _, qubits) in enumerate(gates_1):
+        for q in qubits:
+            wires[q].append(k)
+    done = [0] * num_qubits
+
+    def front(k):
+        return all(done[q] < len(wires[q]) and wires[q][done[q]] == k for q in gates_1[k][2])
+
+    def consume_cnots(qubits):
+        """
+        Moves every CNOT of `circ_1` which is next on both of its qubits into P, starting from `qubits`.
+        """
+        pending = list(qubits)
+        while pending:
+            q = pending.pop()
+            if done[q] == len(wires[q]):
+                continue
+            k = wires[q][done[q]]
+            name, _, cx_qubits = gates_1[k]
+            if name == 'cx' and front(k):
+                right_cx(*cx_qubits)
+                for r in cx_qubits:
+                    done[r] += 1
+                pending.extend(cx_qubits)
+
+    consume_cnots(range(num_qubits))
+    for g in circ_2.data:
+        name, params, qubits = _gate_key(g)
+        if name == 'barrier':
+            continue
+        if name == 'cx':
+            left_cx(*qubits)
+            continue
+
+        logical = []
+        for p in qubits:
+            q = rows[p].bit_length() - 1
+            if rows[p] != 1 << q or cols[q] != 1 << p:
+                return False  # the gate does not commute with the CNOTs around it
+            logical.append(q)
+        if done[logical[0]] == len(wires[logical[0]]):
+            return False
+        k = wires[logical[0]][done[logical[0]]]
+        name_1, params_1, qubits_1 = gates_1[k]
+        if (name_1 != name or list(qubits_1) != logical or not front(k)
+                or any(abs(x - y) >= 1e-8 for x, y in zip(params_1, params))):
+            return False
+        for q in logical:
+            done[q] += 1
+        consume_cnots(logical)
+
+    return (all(d == len(w) for d, w in zip(done, wires))
+            and all(rows[p] == 1 << q and cols[q] == 1 << p for q, p in enumerate(final_mapping)))
+
+
 def check_unitaries(u1, u2, initial, final, n, r_to_l=False):
-    p1 = permutation(n, initial)
-    p2 = permutation(n, perm_diff(initial, final))
-    return np.allclose(u1, np.linalg.inv(p1) @ np.linalg.inv(p2) @ u2 @ p1)
+    p1 = permutation_index(n, initial)
+    p2 = permutation_index(n, perm_diff(initial, final))
+    # inv(P1) @ inv(P2) @ u2 @ P1, where multiplying by a permutation matrix only reorders the rows or columns
+    return np.allclose(u1, u2[np.ix_(p2[p1], p1)])
 
 
 def check_circuit_compatible_with_arc(circuit, arc):
@@ -0,0 +1,76 @@
+"""
+Tests for the archive of game runs in `archive.py`.
+"""
+
+import os
+
+from qiskit.circuit.random import random_circuit
+
+from archive import RunArchive, save_archive, run_from_engine, swaps_from_qasm, convert, level_of
+from router import Router
+from util import lattice_architecture
+
+
+def gates(circuit):
+    return [(g[0].name, [round(float(p), 10) for p in g[0].params], [q.index for q in g[1]]) for g in circuit.data]
+
+
+def test_save_and_load(tmp_path):
+    router = Router(lattice_architecture(2, 3))
+    engines = [router.route(random_circuit(num_qubits=5, depth=4, max_operands=2, seed=seed)) for seed in range(4)]
+    runs = [run_from_engine(engine, 'level_{}_#{}'.format(seed % 2, seed), optimize=seed == 3)
+            for seed, engine in enumerate(engines)]
+    filename = str(tmp_path / 'runs.npz')
+    save_archive(filename, runs)
+
+    archive = RunArchive(filename)
+    assert(len(archive) == 4)
+    assert(list(archive.select(level='level_1')) == [1, 3])
+    assert(list(archive.select(run_id='level_0_#2')) == [2])
+    assert(sorted(archive.by_level()) == ['level_0', 'level_1'])
+    assert(list(archive.num_swaps) == [engine.num_swaps for engine in engines])
+    assert(list(archive.num_circuit_qubits) == [5] * 4 and list(archive.num_arc_qubits) == [6] * 4)
+    assert([len(swaps) for swaps in archive.split('swaps')] == [engine.num_swaps for engine in engines])
+
+    assert(list(archive.optimized) == [False, False, False, True])
+
+    for i, engine in enumerate(engines):
+        run = archive.run(i)
+        result = engine.result(optimize=i == 3)
+        assert(run['details'] == result['details'])
+        assert(gates(run['initial_circuit']) == gates(engine.initial_circ))
+        assert(gates(run['final_circuit']) == gates(result['final_circuit']))
+    assert(archive.details(3)['optimized'] and 'optimized' not in archive.details(0))
+
+
+def test_swaps_from_qasm():
+    arc = lattice_architecture(3, 3)
+    for seed in range(3):
+        engine = Router(arc).route(random_circuit(num_qubits=9, depth=5, max_operands=2, seed=seed))
+        swaps = swaps_from_qasm(engine.initial_circ.qasm(), engine.final_circ.qasm(), engine.initial_mapping.to_list())
+        assert(swaps == engine.swaps)
+
+
+def test_convert(tmp_path):
+    directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'game_outputs')
+    filename = str(tmp_path / 'game_outputs.npz')
+    num_runs = convert(filename, [directory])
+
+    archive = RunArchive(filename)
+    assert(len(archive) == num_runs == len([f for f in os.listdir(directory) if f.startswith('initial_circuit')]))
+    for i in range(len(archive)):
+        assert(len(archive.swaps(i)) == archive.num_swaps[i])
+    assert(level_of('test_level_5_#2') == 'test_level_5' and level_of('test_level_1 #1') == 'test_level_1')
+
+
+def test_convert_optimized_run(tmp_path):
+    engine = Router(lattice_architecture(2, 3)).route(random_circuit(num_qubits=6, depth=4, max_operands=2, seed=0))
+    directory = tmp_path / 'runs'
+    directory.mkdir()
+    details = engine.save('level_1_#1', output_dir=str(directory), optimize=True)
+    filename = str(tmp_path / 'runs.npz')
+    convert(filename, [str(directory)])
+
+    archive = RunArchive(filename)
+    assert(archive.optimized[0] and archive.details(0)['peephole'] == details['peephole'])
+    assert(archive.details(0) == details)
@@ -0,0 +1,75 @@
+"""
+Tests for the level catalog in `catalog.py`.
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+
+from catalog import levels, level_by_number, LEVELS_DIR
+from engine import Engine
+
+
+def test_levels_are_listed_in_order():
+    numbers = [level.number for level in levels()]
+    assert(numbers == sorted(numbers) and numbers[:3] == [1, 2, 3])
+
+
+def test_cached_level_matches_module(tmpdir):
+    sys.path.append(LEVELS_DIR)
+    import level_5
+    engine = Engine(level_5.circ, level_5.arc)
+
+    cache_dir = str(tmpdir.join('cache'))
+    built = level_by_number(5, cache_dir=cache_dir).engine()
+    cached = level_by_number(5, cache_dir=cache_dir).engine()  # a new `Level`, so read from the disk
+    assert(len(os.listdir(cache_dir)) == 2)
+
+    for other in (built, cached):
+        assert(other.gate_ops == engine.gate_ops and other.gate_q0 == engine.gate_q0 and other.gate_q1 == engine.gate_q1)
+        assert(other.arc == engine.arc and other.initial_circ == engine.initial_circ)
+    assert(level_by_number(5, cache_dir=cache_dir).info()['num_cnots'] == engine.cnot_gates_in_initial_circ)
+
+
+def test_changed_level_is_built_again(tmpdir):
+    directory, cache_dir = str(tmpdir.join('levels')), str(tmpdir.join('cache'))
+    os.makedirs(directory)
+    shutil.copy(os.path.join(LEVELS_DIR, 'level_1.py'), directory)
+
+    level = levels(directory, cache_dir=cache_dir)[0]
+    assert(level.info()['num_cnots'] == 2)
+
+    with open(level.path, 'a') as file:
+        file.write('\ncirc.cx(0, 2)\n')
+    level = level_by_number(1, directory, cache_dir=cache_dir)
+    assert(level.info()['num_cnots'] == 3)
+    assert(len(os.listdir(cache_dir)) == 2)  # the old files are removed
+
+
+def test_cache_key_depends_on_modules(monkeypatch):
+    import catalog
+
+    level = level_by_number(1)
+    key = level.key()
+    assert(level.key() == key)
+
+    # the key is of the source of the modules the circuit is built with, as well as of the level
+    monkeypatch.setattr(catalog, 'DEPENDENCIES', ('engine.py', 'util.py'))
+    catalog._dependencies_hash.cache_clear()
+    try:
+        assert(level.key() != key)
+    finally:
+        catalog._dependencies_hash.cache_clear()
+
+
+def test_cached_level_is_played_without_qiskit(tmpdir):
+    cache_dir = str(tmpdir.join('cache'))
+    level_by_number(5, cache_dir=cache_dir).load()  # fills the cache
+
+    code = ('import sys; sys.path.insert(0, {!r}); from catalog import level_by_number; from router import Router; '
+            'engine = level_by_number(5, cache_dir={!r}).engine(); Router(engine.arc).play(engine); engine.details(); '
+            'print(engine.stage, "qiskit" in sys.modules)')
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    output = subprocess.check_output([sys.executable, '-c', code.format(root, cache_dir)]).decode().strip()
+    assert(output == '3 False')
@@ -2,8 +2,17 @@
 These are handwritten tests to check the functions in `check_outputs.py`.
 """
 
+import random
 
-from tests.check_outputs import cnot, swap, check_unitaries
+from qiskit import QuantumCircuit
+from qiskit.circuit.random import random_circuit
+
+from engine import Engine
+from peephole import optimize
+from router import Router
+from util import lattice_architecture
+from tests.check_outputs import cnot, swap, permutation, permutation_index, check_unitaries, check_equiv_under_perms, \
+    check_equiv_statevector, check_equiv_structural, check_equiv_cnot_frame, simulate_statevector
 
 
 def test_check_unitaries():
@@ -32,5 +41,161 @@ def test_check_unitaries():
     assert(check_unitaries(ua, uf, pf, ff, 4))
 
 
+def test_permutation_index():
+    for ordering in [(0, 1, 2), (2, 0, 1), (1, 2, 0)]:
+        out = permutation_index(3, ordering)
+        assert(sorted(out) == list(range(8)))
+        assert((permutation(3, ordering)[out, range(8)] == 1).all())
+    assert(list(permutation_index(3, (2, 1, 0))) == [0, 4, 2, 6, 1, 5, 3, 7])  # reverses the bits
+    assert((swap(3, (0, 2)) == permutation(3, (2, 1, 0))).all())
+    assert((cnot(0, 1, 2) == [[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 0, 1], [0, 0, 1, 0]]).all())
+
+
+def test_check_equiv_statevector():
+    arc = lattice_architecture(2, 3)
+    for seed in range(3):
+        circ = random_circuit(num_qubits=6, depth=5, max_operands=2, seed=seed)
+        engine = Router(arc).route(circ)
+        details = engine.details()
+        initial, final = details['initial_mapping'], details['final_mapping']
+        assert(check_equiv_statevector(engine.initial_circ, engine.final_circ, initial, final, seed=seed))
+
+        # agrees with the check of the unitaries, which (unlike QASM) keep the global phase of the unrolled circuit
+        initial_circ = QuantumCircuit.from_qasm_str(engine.initial_circ.qasm())
+        final_circ = QuantumCircuit.from_qasm_str(engine.final_circ.qasm())
+        initial_placement = [initial.index(i) for i in range(6)]
+        final_placement = [final.index(i) for i in range(6)]
+        assert(check_equiv_under_perms(initial_circ, final_circ, initial_placement, final_placement, 6))
+
+        tampered = engine.final_circ.copy()
+        tampered.data.pop(len(tampered.data) // 2)
+        assert(not check_equiv_statevector(engine.initial_circ, tampered, initial, final, seed=seed))
+        if initial != final:
+            assert(not check_equiv_statevector(engine.initial_circ, engine.final_circ, initial, initial, seed=seed))
+
+
+def test_simulate_statevector_matches_qiskit():
+    import numpy as np
+    from qiskit.quantum_info import Statevector
+
+    # the smallest circuits are the edge cases: every axis of the state is indexed by the gate
+    circ_1 = QuantumCircuit(1)
+    circ_1.h(0)
+    circ_1.t(0)
+    bell = QuantumCircuit(2)
+    bell.h(0)
+    bell.cx(0, 1)
+    bell.cx(1, 0)
+    circuits = [circ_1, bell] + [random_circuit(num_qubits=n, depth=4, max_operands=2, seed=n) for n in (3, 5)]
+
+    for circ in circuits:
+        n = circ.num_qubits
+        state = np.zeros(2**n, dtype=complex)
+        state[0] = 1
+        assert(np.allclose(simulate_statevector(circ, state, n), Statevector.from_instruction(circ).data))
+
+
+def test_check_equiv_structural():
+    circ = QuantumCircuit(3)
+    circ.h(0)
+    circ.cx(0, 2)
+    circ.cx(2, 1)
+
+    routed = QuantumCircuit(3)  # identity initial mapping on the line 0-1-2
+    routed.h(0)
+    routed.cx(0, 1)  # swap 0 and 1
+    routed.cx(1, 0)
+    routed.cx(0, 1)
+    routed.cx(1, 2)
+    routed.cx(2, 0)
+    assert(check_equiv_structural(circ, routed, [0, 1, 2], [1, 0, 2]))
+    assert(not check_equiv_structural(circ, routed, [0, 1, 2], [0, 1, 2]))  # wrong final mapping
+    assert(not check_equiv_structural(circ, routed, [1, 0, 2], [0, 1, 2]))  # wrong initial mapping
+
+    routed.data.pop()
+    routed.cx(2, 1)  # the wrong qubit
+    assert(not check_equiv_structural(circ, routed, [0, 1, 2], [1, 0, 2]))
+
+    # three CNOTs which are both a swap and gates of the circuit
+    circ = QuantumCircuit(2)
+    circ.cx(0, 1)
+    circ.cx(1, 0)
+    circ.cx(0, 1)
+    assert(check_equiv_structural(circ, circ, [0, 1], [0, 1]))
+
+    circ.cx(0, 1)
+    routed = circ.copy()
+    routed.data.pop()
+    routed.cx(1, 0)  # a swap
+    routed.cx(0, 1)
+    routed.cx(1, 0)
+    routed.cx(1, 0)
+    assert(check_equiv_structural(circ, routed, [0, 1], [1, 0]))
+    assert(not check_equiv_structural(circ, routed, [0, 1], [0, 1]))
+
+
+def test_check_equiv_structural_routed():
+    arc = lattice_architecture(4, 5)
+    for seed in range(3):
+        circ = random_circuit(num_qubits=20, depth=5, max_operands=2, seed=seed)
+        engine = Router(arc).route(circ)
+        details = engine.details()
+        initial, final = details['initial_mapping'], details['final_mapping']
+        assert(check_equiv_structural(engine.initial_circ, engine.final_circ, initial, final))
+
+        # the order of gates on different qubits is not kept by QASM (which also rounds the parameters)
+        initial_circ = QuantumCircuit.from_qasm_str(engine.initial_circ.qasm())
+        final_circ = QuantumCircuit.from_qasm_str(engine.final_circ.qasm())
+        assert(check_equiv_structural(initial_circ, final_circ, initial, final))
+
+        tampered = engine.final_circ.copy()
+        tampered.data.pop(len(tampered.data) // 2)
+        assert(not check_equiv_structural(engine.initial_circ, tampered, initial, final))
+
+
+def test_check_equiv_cnot_frame_optimized():
+    arc = lattice_architecture(3, 3)
+    for seed in range(6):
+        # random swaps, some of them undone straight away, so that the optimizer cancels and merges CNOTs
+        rng = random.Random(seed)
+        engine = Engine(random_circuit(num_qubits=9, depth=5, max_operands=2, seed=seed), arc)
+        engine.advance()
+        while engine.stage != 3:
+            if engine.is_legal() and rng.random() < 0.5:
+                engine.advance()
+                continue
+            a, b = rng.choice(engine.arc)
+            engine.apply_swap(a, b)
+            if rng.random() < 0.3:
+                engine.apply_swap(a, b)
+        details = engine.details()
+        initial, final = details['initial_mapping'], details['final_mapping']
+        optimized, report = optimize(engine.final_circ)
+
+        assert(check_equiv_cnot_frame(engine.initial_circ, engine.final_circ, initial, final))
+        assert(check_equiv_cnot_frame(engine.initial_circ, optimized, initial, final))
+        assert(not check_equiv_cnot_frame(engine.initial_circ, optimized, initial, initial[::-1]))
+        for j in rng.sample(range(len(optimized.data)), 5):  # without any one of its gates, it is not equivalent
+            broken = optimized.copy()
+            del broken.data[j]
+            assert(not check_equiv_cnot_frame(engine.initial_circ, broken, initial, final))
+
+    # a gate which does not commute with the CNOTs around it
+    circ = QuantumCircuit(2)
+    circ.h(0)
+    circ.cx(0, 1)
+    moved = QuantumCircuit(2)
+    moved.cx(0, 1)
+    moved.h(0)
+    assert(check_equiv_cnot_frame(circ, circ, [0, 1], [0, 1]))
+    assert(not check_equiv_cnot_frame(circ, moved, [0, 1], [0, 1]))
+
+
 if __name__ == '__main__':
     test_check_unitaries()
+    test_permutation_index()
+    test_check_equiv_statevector()
+    test_simulate_statevector_matches_qiskit()
+    test_check_equiv_structural()
+    test_check_equiv_structural_routed()
+    test_check_equiv_cnot_frame_optimized()
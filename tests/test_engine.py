@@ -0,0 +1,297 @@
+"""
+Tests for the headless `Engine`, playing games without any plotting.
+"""
+
+import os
+import subprocess
+import sys
+
+import networkx as nx
+from qiskit import QuantumCircuit
+from qiskit.circuit.random import random_circuit
+
+from engine import Engine, NATIVE_GATES, unroll, circuit_fingerprint
+from router import Router
+from util import lattice_architecture
+from tests.check_outputs import check_circuit_compatible_with_arc, check_equiv_structural
+
+
+def play(engine):
+    """
+    Plays a game by swapping the qubits of each gate along a shortest path until they are adjacent.
+    """
+    graph = nx.Graph(engine.arc)
+    while engine.stage != 3:
+        if not engine.is_legal():
+            x, y = engine.physical(engine.current_gate())
+            path = nx.shortest_path(graph, x, y)
+            for a, b in zip(path[:-2], path[1:-1]):
+                assert(engine.apply_swap(a, b))
+        assert(engine.advance())
+    return engine.result()
+
+
+def test_engine_stage_1_swaps_are_free():
+    circ = QuantumCircuit(3)
+    circ.cx(0, 1)
+    circ.cx(1, 2)
+    engine = Engine(circ, [(0, 1), (0, 2)])
+
+    assert(not engine.is_legal((1, 2)))
+    assert(engine.apply_swap(1, 2))  # not connected, but allowed in stage 1
+    assert(engine.apply_swap(1, 2))
+    assert(engine.apply_swap(0, 1))
+    assert(engine.num_swaps == 0)
+    assert(engine.is_legal((0, 1)) and engine.is_legal((1, 2)))
+
+    assert(engine.advance())
+    assert(engine.stage == 2 and engine.gates_remaining() == 1)
+    assert(engine.advance())
+    assert(engine.stage == 3)
+    details = engine.result()['details']
+    assert(details['initial_mapping'] == [1, 0, 2])
+    assert(details['initial_mapping'] == details['final_mapping'])
+    assert(details['num_swaps'] == 0)
+
+
+def test_engine_rejects_illegal_moves():
+    circ = QuantumCircuit(3)
+    circ.h(0)
+    circ.cx(0, 2)
+    engine = Engine(circ, [(0, 1), (1, 2)])
+
+    assert(not engine.advance())
+    assert(engine.stage == 1)
+    assert(engine.apply_swap(1, 2))
+    assert(engine.advance())
+    assert(engine.stage == 3)
+    assert(not engine.apply_swap(0, 1))  # game over
+
+
+def test_engine_plays_lattice():
+    circ = QuantumCircuit(6)
+    for a, b in [(0, 5), (1, 4), (2, 3), (0, 3), (5, 1), (4, 2), (0, 5)]:
+        circ.h(a)
+        circ.cx(a, b)
+    arc = lattice_architecture(2, 3)
+    engine = Engine(circ, arc)
+    result = play(engine)
+
+    assert(engine.gates_remaining() == 0)
+    assert(check_circuit_compatible_with_arc(result['final_circuit'], arc))
+    num_cnots = len([g for g in result['final_circuit'].data if len(g[1]) > 1])
+    assert(num_cnots == engine.cnot_gates_in_initial_circ + 3*result['details']['num_swaps'])
+    assert(len(result['final_circuit'].data) == len(engine.initial_circ.data) + 3*result['details']['num_swaps'])
+
+
+def state(engine):
+    return (engine.stage, engine.num_swaps, engine.num_cnots_done, engine.current_gate_index, list(engine.swaps),
+            engine.initial_mapping.to_list(), engine.current_mapping.to_list(), dict(engine.remaining_pairs),
+            [(g[0].name, [q.index for q in g[1]]) for g in engine.final_circ.data])
+
+
+def test_engine_undo_redo():
+    circ = QuantumCircuit(6)
+    for a, b in [(0, 5), (1, 4), (2, 3), (0, 3), (5, 1), (4, 2), (0, 5)]:
+        circ.h(a)
+        circ.cx(a, b)
+    engine = Engine(circ, lattice_architecture(2, 3))
+    assert(not engine.undo() and not engine.redo())
+
+    states = [state(engine)]
+    engine.apply_swap(0, 4)  # stage 1
+    states.append(state(engine))
+    while engine.stage != 3:
+        play_one_move(engine)
+        states.append(state(engine))
+    assert(len(engine.moves) == len(states) - 1)
+
+    for expected in reversed(states[:-1]):  # undo everything
+        assert(engine.undo())
+        assert(state(engine) == expected)
+    assert(not engine.undo())
+
+    for expected in states[1:]:  # and redo everything
+        assert(engine.redo())
+        assert(state(engine) == expected)
+    assert(not engine.redo())
+
+    engine.undo()
+    engine.undo()
+    play_one_move(engine)  # a new move forgets the moves undone
+    assert(not engine.redo())
+
+
+def play_one_move(engine):
+    if engine.is_legal():
+        assert(engine.advance())
+    else:
+        x, y = engine.physical(engine.current_gate())
+        path = nx.shortest_path(nx.Graph(engine.arc), x, y)
+        assert(engine.apply_swap(path[0], path[1]))
+
+
+def test_engine_replay():
+    circ = QuantumCircuit(6)
+    for a, b in [(0, 5), (1, 4), (2, 3), (0, 3), (5, 1), (4, 2), (0, 5)]:
+        circ.cx(a, b)
+        circ.h(b)
+    engine = Engine(circ, lattice_architecture(2, 3))
+    engine.apply_swap(1, 3)
+    states = [state(engine)]
+    while engine.stage != 3:
+        play_one_move(engine)
+        states.append(state(engine))
+
+    assert(state(engine.replay()) == state(engine))
+    for num_moves in range(1, len(engine.moves) + 1):
+        assert(state(engine.replay(num_moves=num_moves)) == states[num_moves - 1])
+
+    try:
+        engine.replay(moves=[('swap', 0, 5), ('advance',), ('swap', 0, 5)])  # not connected in stage 2
+        assert(False)
+    except ValueError:
+        pass
+
+
+def test_engine_snapshot_restore():
+    circ = QuantumCircuit(6)
+    for a, b in [(0, 5), (1, 4), (2, 3), (0, 3), (5, 1), (4, 2), (0, 5)]:
+        circ.h(a)
+        circ.cx(a, b)
+    engine = Engine(circ, lattice_architecture(2, 3))
+    start = engine.snapshot()
+    new_game = state(engine)
+
+    for _ in range(6):
+        play_one_move(engine)
+    middle = engine.snapshot()
+    middle_state = state(engine)
+    play(engine)
+    final_state = state(engine)
+
+    engine.restore(start)
+    assert(state(engine) == new_game and engine.moves == [])
+    play(engine)
+    assert(state(engine) == final_state)
+
+    for _ in range(2):  # a snapshot can be restored more than once
+        engine.restore(middle)
+        assert(state(engine) == middle_state and len(engine.moves) == 6)
+        assert(engine.undo())
+    engine.redo()
+    assert(state(engine) == middle_state)
+
+
+def test_engine_gate_table():
+    circ = QuantumCircuit(3)
+    circ.h(0)
+    circ.cx(0, 2)
+    circ.rz(0.5, 1)
+    circ.cx(2, 1)
+    engine = Engine(circ, [(0, 1), (1, 2)])
+
+    gates = [(g[0].name, [q.index for q in g[1]]) for g in engine.initial_circ.data]
+    table = [(engine.gate_names[op], [a] if b < 0 else [a, b])
+             for op, a, b in zip(engine.gate_ops, engine.gate_q0, engine.gate_q1)]
+    assert(gates == table)
+
+    engine.apply_swap(1, 2)
+    final_circ = engine.final_circ  # built lazily, and then only extended
+    assert(len(final_circ.data) == 0)
+    engine.advance()
+    assert(engine.final_circ is final_circ and len(final_circ.data) == 3)
+    engine.undo()
+    assert(len(engine.final_circ.data) == 0)
+
+
+def test_unroll_skips_native_and_memoizes():
+    native = QuantumCircuit(2)
+    native.u3(0.1, 0.2, 0.3, 0)
+    native.cx(0, 1)
+    assert(unroll(native) is native)
+
+    def circuit(angle):
+        circ = QuantumCircuit(2)
+        circ.h(0)
+        circ.rz(angle, 1)
+        circ.cx(0, 1)
+        return circ
+
+    unrolled = unroll(circuit(0.5))
+    assert(set(unrolled.count_ops()) <= set(NATIVE_GATES))
+    assert(unroll(circuit(0.5)) is unrolled)  # an equal circuit is not unrolled again
+    assert(unroll(circuit(0.25)) is not unrolled)
+    assert(Engine(circuit(0.5), [(0, 1)]).initial_circ is unrolled)
+
+
+def test_fingerprint_includes_custom_definitions():
+    def circuit(gate):
+        sub = QuantumCircuit(2, name='custom')
+        getattr(sub, gate)(0, 1)
+        circ = QuantumCircuit(2)
+        circ.append(sub.to_gate(), [0, 1])
+        return circ
+
+    assert(circuit_fingerprint(circuit('cx')) == circuit_fingerprint(circuit('cx')))
+    assert(circuit_fingerprint(circuit('cx')) != circuit_fingerprint(circuit('cz')))
+
+
+def test_imports_are_deferred():
+    code = ('import sys; sys.path.insert(0, {!r}); import engine, router, catalog, game; '
+            'print([name for name in ("qiskit", "matplotlib", "networkx") if name in sys.modules])')
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    output = subprocess.check_output([sys.executable, '-c', code.format(root)]).decode().strip()
+    assert(output == '[]')
+
+
+def test_front_layer_does_every_possible_gate():
+    circ = QuantumCircuit(4)
+    circ.cx(0, 3)  # blocked on the line
+    circ.u2(0.1, 0.2, 1)  # native, so the gates stay in this order
+    circ.cx(1, 2)  # on other qubits, so done straight away with `front_layer`
+    circ.cx(2, 3)  # after the blocked CNOT on qubit 3
+    arc = [(0, 1), (1, 2), (2, 3)]
+
+    engine = Engine(circ, arc)
+    assert(not engine.advance())  # in order, the first CNOT blocks everything
+
+    engine = Engine(circ, arc, front_layer=True)
+    assert(engine.is_legal() and engine.current_gate() == (0, 3))
+    assert(engine.advance())
+    assert(engine.stage == 2 and engine.num_cnots_done == 1 and engine.current_gate() == (0, 3))
+    assert(not engine.is_legal() and not engine.advance())
+
+    engine.apply_swap(0, 1)
+    engine.apply_swap(1, 2)
+    assert(engine.advance() and engine.num_cnots_done == 2)  # only the CNOT which was blocked lies on the line
+    assert(engine.current_gate() == (2, 3) and not engine.is_legal())
+    engine.apply_swap(2, 3)
+    assert(engine.advance() and engine.stage == 3)
+    assert(engine.num_swaps == 3 and engine.gates_remaining() == 0)
+    details = engine.details()
+    assert(check_equiv_structural(engine.initial_circ, engine.final_circ, details['initial_mapping'],
+                                  details['final_mapping']))
+    assert(check_circuit_compatible_with_arc(engine.final_circ, arc))
+
+
+def test_front_layer_undo_replay_and_router():
+    arc = lattice_architecture(3, 4)
+    circ = random_circuit(num_qubits=12, depth=6, max_operands=2, seed=3)
+    engine = Engine(circ, arc, front_layer=True)
+    states = [state(engine)]
+    while engine.stage != 3:
+        play_one_move(engine)
+        states.append(state(engine))
+
+    assert(state(engine.replay()) == state(engine))
+    for expected in reversed(states[:-1]):
+        assert(engine.undo())
+        assert(state(engine) == expected)
+
+    in_order = Router(arc).route(circ)
+    engine = Router(arc).play(Engine(circ, arc, front_layer=True))
+    details = engine.details()
+    assert(check_equiv_structural(engine.initial_circ, engine.final_circ, details['initial_mapping'],
+                                  details['final_mapping']))
+    assert(len(engine.moves) < len(in_order.moves))  # fewer clicks
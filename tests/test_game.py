@@ -0,0 +1,116 @@
+"""
+Tests for the board and the interactive `Game` in `game.py`, played through the callbacks of its figure.
+"""
+
+import random
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib.backend_bases import KeyEvent, MouseEvent
+from qiskit import QuantumCircuit
+from qiskit.circuit.random import random_circuit
+
+import game as game_module
+from game import (Game, board_click_index, board_layout, DETAILED_CIRCUIT_EDGES, NODE_RADIUS, BUTTON_RADIUS,
+                  NEXT_GATE_BUTTON, RESET_BUTTON)
+from util import device_architecture, lattice_architecture
+
+
+def click(game, x, y):
+    event = MouseEvent('button_press_event', game.fig.canvas, *game.ax.transData.transform((x, y)))
+    game.fig.canvas.callbacks.process(event.name, event)
+
+
+def press(game, key):
+    event = KeyEvent('key_press_event', game.fig.canvas, key)
+    game.fig.canvas.callbacks.process(event.name, event)
+
+
+def swap(game, a, b):
+    click(game, *game.pos[a])
+    click(game, *game.pos[b])
+
+
+def test_grid_index_matches_brute_force():
+    for n in [3, 10, 127]:
+        index = board_click_index(n)
+        regions = [(NEXT_GATE_BUTTON, (0.9, -1), BUTTON_RADIUS),
+                   (RESET_BUTTON, (-0.04, -0.9) if n == 3 else (-1, -1), BUTTON_RADIUS)]
+        regions += [(i, p, NODE_RADIUS) for i, p in board_layout(n).items()]
+
+        rng = random.Random(n)
+        for _ in range(5000):
+            x, y = rng.uniform(-1.2, 1.2), rng.uniform(-1.2, 1.2)
+            expected = [k for k, p, r in regions if (x - p[0])**2 + (y - p[1])**2 < r**2]
+            assert(index.query(x, y) == (expected[0] if expected else None))
+
+
+def test_game_clicks_undo_and_reset(monkeypatch):
+    monkeypatch.setattr(game_module.time, 'sleep', lambda seconds: None)  # the pause after a swap is clicked
+    circ = QuantumCircuit(3)
+    circ.cx(0, 2)
+    circ.cx(0, 1)
+    game = Game(circ, [(0, 1), (1, 2)])
+    next_gate = (0.9, -1)
+    reset = (-0.04, -0.9)
+    try:
+        click(game, *next_gate)  # the first gate is not on the architecture
+        assert(game.stage == 1 and game.message == 'Gate not on \narchitecture!')
+
+        # stage 1: a free relabelling, which can be undone and redone with the keys
+        swap(game, 1, 2)
+        assert(game.num_swaps == 0 and game.current_mapping.to_list() == [0, 2, 1] and game.nodes_highlighted == [])
+        press(game, 'z')
+        assert(game.current_mapping.to_list() == [0, 1, 2])
+        press(game, 'z')
+        assert(game.message == 'Nothing to undo!')
+        press(game, 'y')
+        assert(game.current_mapping.to_list() == [0, 2, 1])
+
+        click(game, *next_gate)
+        assert(game.stage == 2 and game.gates_remaining() == 1 and not game.engine.is_legal())
+
+        # stage 2: a swap costs a point
+        swap(game, 1, 0)
+        assert(game.num_swaps == 1 and game.engine.is_legal())
+        click(game, *next_gate)
+        assert(game.stage == 3 and game.message == 'Game Over!')
+        press(game, 'z')
+        assert(game.stage == 2 and game.num_swaps == 1)
+        press(game, 'y')
+        assert(game.stage == 3)
+
+        # reset needs two clicks, and goes back to the snapshot of the new game
+        click(game, *reset)
+        assert(game.stage == 3 and game.reset_pressed)
+        click(game, *reset)
+        assert(game.stage == 1 and game.best_score == 1 and game.num_swaps == 0)
+        assert(game.current_mapping.to_list() == [0, 1, 2] and game.engine.moves == [] and game.message == '')
+        assert(game.engine.snapshot() == game.initial_state)
+    finally:
+        plt.close(game.fig)
+
+
+def test_large_board():
+    arc = device_architecture('ibm_washington')
+    circ = random_circuit(num_qubits=127, depth=12, max_operands=2, seed=0)
+    game = Game(circ, arc, title='large board')
+    try:
+        assert(game.layout == 'rows' and game.graph.number_of_edges() == len(arc))  # not a complete graph
+        assert(game.aggregate_circuit_edges and len(game.circuit_pairs) > DETAILED_CIRCUIT_EDGES)
+        assert(all(a < b for a, b in game.circuit_pairs))
+
+        node, (x, y) = 64, game.pos[64]
+        assert(game.click_index.query(x, y) == node)
+        game.nodes_highlighted = [node]
+        assert(node in game.labelled_nodes() and len(game.labelled_nodes()) <= 3)
+        game.plot()
+        visible = [text.get_text() for text in game.artists['labels'].values() if text.get_visible()]
+        assert(str(game.current_mapping.inverse(node)) in visible and len(visible) <= 3)
+    finally:
+        plt.close(game.fig)
+
+    small = Game(random_circuit(num_qubits=4, depth=3, max_operands=2, seed=0), lattice_architecture(2, 2))
+    assert(small.layout == 'circular' and small.scale == 1 and small.labelled_nodes() is None)
+    plt.close(small.fig)
@@ -1,48 +1,28 @@
 import os
-import ast
-from qiskit import QuantumCircuit
 
-from check_outputs import check_equiv_under_perms, check_circuit_compatible_with_arc
+from tests.verify_outputs import verify_outputs
 
 
-def test_game_outputs(verbose=False):
+def test_game_outputs(verbose=False, simulate_max_qubits=20):
     """
-    This function loops over all the files in the `game_outputs` directory, and tests to see if the initial and final circuit
-    of a run of the game are equivalent (using `check_equiv_under_perms` from `check_outputs.py`), and tests if the final
-    circuit can be directly ran on the specified hardware (using `check_circuit_compatible_with_arc` from `check_outputs.py`).
+    This function verifies all the runs in the `game_outputs` directory (using `verify_outputs` from `verify_outputs.py`),
+    which tests to see if the initial and final circuit of a run of the game are equivalent (using
+    `check_equiv_structural` from `check_outputs.py`, and also `check_equiv_statevector` for runs on at most
+    `simulate_max_qubits` qubits), and tests if the final circuit can be directly ran on the specified hardware (using
+    `check_circuit_compatible_with_arc` from `check_outputs.py`). The cache of `verify_outputs` is not used here, so every
+    run is verified.
 
     Output game data for testing can be generated from `generate_game_outputs.py`.
     """
 
-    filenames = os.listdir('game_outputs')
-    for filename in filenames:
-
-        filepath = os.path.join('game_outputs', filename)
-        if filename.startswith('initial_circuit'):
-            if verbose:
-                print(filename)
-            initial_circ = QuantumCircuit.from_qasm_file(filepath)
-            final_circ = QuantumCircuit.from_qasm_file(filepath.replace('initial_circuit', 'final_circuit'))
-            with open(filepath.replace('initial_circuit', 'details'), 'r') as file:
-                details = ast.literal_eval(file.read().replace('\n', '')) # converts to dictionary
-
-            try:
-                num_qubits = details['num_arc_qubits']
-            except KeyError:
-                num_qubits = details['num_qubits']
-
-
-            initial_lp_map = details['initial_mapping']
-            initial_pl_map = [initial_lp_map.index(i) for i in range(num_qubits)]
-            final_lp_map = details['final_mapping']
-            final_pl_map = [final_lp_map.index(i) for i in range(num_qubits)]
-            assert(check_equiv_under_perms(initial_circ, final_circ, initial_pl_map, final_pl_map,num_qubits))
-
-            arc = details['architecture']
-            assert(check_circuit_compatible_with_arc(circuit=final_circ, arc=arc))
+    directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'game_outputs')
+    summary = verify_outputs(directory, cache_file=None, simulate_max_qubits=simulate_max_qubits, verbose=verbose)
+    assert(summary['num_runs'] > 0)
+    assert(summary['num_failed'] == 0), summary['failed']
+    assert(summary['num_unverified'] == 0), summary['unverified']
 
 
 if __name__ == '__main__':
     test_game_outputs(verbose=True)
     print('---------------------------')
-    print('All tests passed!')
\ No newline at end of file
+    print('All tests passed!')
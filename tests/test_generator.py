@@ -0,0 +1,42 @@
+"""
+Tests for the level generator in `generator.py`.
+"""
+
+import json
+import os
+
+from catalog import levels
+from generator import generate, write_levels, bucket_of, candidates
+from solver import solve
+
+
+BUCKETS = [('easy', 1, 2), ('medium', 3, 4)]
+
+
+def test_bucket_of():
+    assert(bucket_of(0) is None and bucket_of(1) == 'easy' and bucket_of(4) == 'medium' and bucket_of(100) == 'expert')
+    assert(bucket_of(5, BUCKETS) is None)
+
+
+def test_candidates_are_deterministic():
+    first = [spec for spec, _ in zip(candidates(seed=3), range(5))]
+    assert(first == [spec for spec, _ in zip(candidates(seed=3), range(5))])
+    assert(first != [spec for spec, _ in zip(candidates(seed=4), range(5))])
+
+
+def test_generate_and_write_levels(tmpdir):
+    graded = generate(per_bucket=2, buckets=BUCKETS, processes=2, max_states=20000)
+    assert(graded['complete'])
+    assert(all(len(graded['buckets'][name]) == 2 for name, _, _ in BUCKETS))
+
+    directory = str(tmpdir.join('generated'))
+    written = write_levels(graded, directory)
+    assert([level['number'] for level in written] == [1, 2, 3, 4])
+    with open(os.path.join(directory, 'levels.json')) as file:
+        assert(json.load(file) == written)
+
+    # the written levels are graded correctly
+    for level, expected in zip(levels(directory), written):
+        solution = solve(level.engine())
+        assert(solution['optimal'] and solution['num_swaps'] == expected['num_swaps'])
+        assert(bucket_of(solution['num_swaps'], BUCKETS) == expected['bucket'])
@@ -0,0 +1,97 @@
+"""
+Tests for the peephole optimizer of the output circuit.
+"""
+
+import os
+import tempfile
+
+from qiskit import QuantumCircuit
+from qiskit.circuit.random import random_circuit
+
+from engine import Engine
+from peephole import optimize
+from router import Router
+from util import lattice_architecture
+from tests.check_outputs import check_circuit_compatible_with_arc, check_equiv_statevector
+from tests.verify_outputs import verify_run
+
+
+def equivalent(circ_1, circ_2):
+    identity = list(range(circ_1.num_qubits))
+    return check_equiv_statevector(circ_1, circ_2, identity, identity, num_states=4, seed=0)
+
+
+def test_peephole_alternating_cnots():
+    # CX(b,a) CX(a,b) CX(b,a) CX(a,b) = CX(a,b) CX(b,a)
+    circ = QuantumCircuit(2)
+    circ.cx(1, 0)
+    circ.cx(0, 1)
+    circ.cx(1, 0)
+    circ.cx(0, 1)
+    optimized, report = optimize(circ)
+    assert(equivalent(circ, optimized))
+    assert(report['cx_before'] == 4 and report['cx_after'] == 2 and report['merged'] == 1)
+
+
+def test_peephole_cascades():
+    circ = QuantumCircuit(3)
+    circ.h(2)
+    circ.cx(0, 1)
+    circ.cx(1, 0)
+    circ.cx(0, 1)  # a swap
+    circ.cx(2, 1)  # blocks the swap on qubit 1 from the one after
+    circ.cx(0, 1)
+    circ.cx(1, 0)
+    circ.cx(0, 1)  # another swap
+    circ.cx(0, 1)
+    circ.cx(1, 0)
+    circ.cx(0, 1)  # cancels the one before
+    optimized, report = optimize(circ)
+    assert(equivalent(circ, optimized))
+    assert(report['cx_after'] == 4 and report['cancelled'] == 3)
+
+    circ = QuantumCircuit(2)
+    for _ in range(2):
+        circ.cx(0, 1)
+        circ.cx(1, 0)
+        circ.cx(0, 1)
+    circ.cx(0, 1)
+    optimized, report = optimize(circ)
+    assert(report['cx_after'] == 1 and optimized.data[0][1] == [circ.qubits[0], circ.qubits[1]])
+
+
+def test_peephole_keeps_other_gates():
+    circ = QuantumCircuit(2)
+    circ.cx(0, 1)
+    circ.u1(0.3, 1)
+    circ.cx(0, 1)
+    circ.u2(0.1, 0.2, 0)
+    optimized, report = optimize(circ)
+    assert(optimized == circ and report['cancelled'] == 0 and report['merged'] == 0)
+
+
+def test_peephole_routed_circuits():
+    for seed in range(4):
+        circ = random_circuit(num_qubits=6, depth=6, max_operands=2, seed=seed)
+        arc = lattice_architecture(2, 3)
+        engine = Router(arc).play(Engine(circ, arc))
+        result = engine.result(optimize=True)
+        details = result['details']
+
+        assert(details['optimized'] and details['peephole']['cx_after'] <= details['peephole']['cx_before'])
+        assert(len(engine.final_circ.data) == len(engine.final_gates) // 3)  # the engine's own circuit is unchanged
+        assert(check_circuit_compatible_with_arc(result['final_circuit'], arc))
+        assert(check_equiv_statevector(engine.initial_circ, result['final_circuit'], details['initial_mapping'],
+                                       details['final_mapping'], seed=0))
+
+
+def test_peephole_saved_outputs_verify():
+    arc = lattice_architecture(2, 2)
+    circ = random_circuit(num_qubits=4, depth=5, max_operands=2, seed=3)
+    engine = Router(arc).play(Engine(circ, arc))
+    directory = tempfile.mkdtemp()
+    details = engine.save('optimized', directory, optimize=True)
+    paths = [os.path.join(directory, prefix + 'optimized.txt')
+             for prefix in ('initial_circuit_', 'final_circuit_', 'details_')]
+    result = verify_run(paths)
+    assert(details['optimized'] and result['passed'] and result['structural'] is True)
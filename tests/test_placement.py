@@ -0,0 +1,53 @@
+"""
+Tests for the initial mapping search in `placement.py`.
+"""
+
+import time
+
+from qiskit import QuantumCircuit
+from qiskit.circuit.random import random_circuit
+
+from engine import Engine
+from placement import find_initial_mapping
+from router import Router, cnot_pairs
+from util import lattice_architecture
+
+
+def test_finds_embedding():
+    circ = QuantumCircuit(6)
+    for a, b in [(0, 3), (3, 5), (5, 1), (1, 4), (4, 2), (2, 0)]:  # a ring
+        circ.cx(a, b)
+    engine = Engine(circ, lattice_architecture(2, 3))
+
+    mapping = find_initial_mapping(engine, time_budget=10, processes=2)
+    assert(engine.set_initial_mapping(mapping))
+    assert(all(engine.is_legal(pair) for pair in engine.circuit_pairs))
+
+
+def test_annealing_is_deterministic():
+    arc = lattice_architecture(3, 4)
+    circ = random_circuit(num_qubits=12, depth=4, max_operands=2, seed=5)
+    engine = Engine(circ, arc)
+
+    mapping = find_initial_mapping(engine, time_budget=30, processes=2, restarts=4, steps=2000, seed=1)
+    assert(sorted(mapping.to_list()) == list(range(12)))
+    assert(mapping == find_initial_mapping(engine, time_budget=30, processes=2, restarts=4, steps=2000, seed=1))
+
+    engine.set_initial_mapping(mapping)
+    Router(arc, initial_passes=0).play(engine)
+    assert(engine.stage == 3)
+
+
+def test_time_budget_is_kept():
+    arc = lattice_architecture(3, 4)
+    circ = random_circuit(num_qubits=12, depth=8, max_operands=2, seed=2)  # no embedding on the lattice
+    engine = Engine(circ, arc)
+    router = Router(arc)
+    expected = router.initial_mapping(cnot_pairs(engine), engine.current_mapping)
+
+    # no restart can finish in time, so the mapping is the router's own choice, whatever the timing
+    for _ in range(2):
+        start = time.perf_counter()
+        mapping = find_initial_mapping(engine, time_budget=0.5, processes=2, restarts=4, steps=10**8)
+        assert(time.perf_counter() - start < 3)
+        assert(mapping == expected)
@@ -0,0 +1,80 @@
+"""
+Tests for the `Profiler` in `profiling.py`, and the profiling of a `Game`.
+"""
+
+import json
+import pstats
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from matplotlib.backend_bases import MouseEvent
+from qiskit import QuantumCircuit
+
+from game import Game, NEXT_GATE_BUTTON
+from profiling import Profiler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_profiler_timers_and_histogram():
+    clock = FakeClock()
+    profiler = Profiler(clock=clock)
+
+    def work(seconds):
+        clock.now += seconds
+        return seconds
+
+    timed = profiler.handler('work', work)
+    for seconds in [0.0005, 0.003, 0.003, 0.15, 10]:
+        assert(timed(seconds) == seconds)
+
+    stats = profiler.stats()
+    assert(stats['timers']['work']['calls'] == 5)
+    assert(abs(stats['timers']['work']['max_ms'] - 10000) < 1e-6)
+    histogram = dict((edge, count) for edge, count in stats['latency']['work']['histogram'])
+    assert(histogram[1] == 1 and histogram[5] == 2 and histogram[200] == 1 and histogram[None] == 1)
+    assert(abs(stats['latency']['work']['p50_ms'] - 3) < 1e-6)
+
+    profiler.reset()
+    timed(0.001)
+    assert(profiler.stats()['timers']['work']['calls'] == 1)
+
+
+def test_game_profiling(tmpdir):
+    circ = QuantumCircuit(3)
+    circ.cx(0, 1)
+    circ.cx(1, 2)
+
+    plain = Game(circ, [(0, 1), (1, 2)], title='not profiled')
+    assert(plain.profiler is None and 'onClick' not in vars(plain))  # nothing is wrapped
+
+    game = Game(circ, [(0, 1), (1, 2)], profile=Profiler(cprofile=True))
+    x, y = 0.9, -1  # the "Next Gate" button
+    assert(game.click_index.query(x, y) == NEXT_GATE_BUTTON)
+    clicks = 0
+    while game.stage != 3:  # through the figure, so the connected handler is the profiled one
+        event = MouseEvent('button_press_event', game.fig.canvas, *game.ax.transData.transform((x, y)))
+        game.fig.canvas.callbacks.process(event.name, event)
+        clicks += 1
+
+    stats = game.profiler.stats()
+    assert(stats['timers']['onClick']['calls'] == clicks)
+    assert(stats['timers']['next_gate']['calls'] == clicks)
+    assert(stats['timers']['plot']['calls'] == clicks + 1)
+    assert(stats['latency']['onClick']['events'] == clicks)
+
+    game.profiler.save(str(tmpdir.join('profile.json')))
+    with open(str(tmpdir.join('profile.json'))) as file:
+        assert(json.load(file)['latency']['onClick']['events'] == clicks)
+
+    game.profiler.dump_stats(str(tmpdir.join('profile.prof')))
+    functions = pstats.Stats(str(tmpdir.join('profile.prof'))).stats
+    assert(any(name == 'advance' for _, _, name in functions))
+    plt.close('all')
@@ -0,0 +1,55 @@
+"""
+Tests for the automatic `Router`.
+"""
+
+from qiskit import QuantumCircuit
+from qiskit.circuit.random import random_circuit
+
+from engine import Engine
+from router import Router
+from util import lattice_architecture, distance_matrix
+from tests.check_outputs import check_circuit_compatible_with_arc
+
+
+def test_distance_matrix():
+    d = distance_matrix(lattice_architecture(3, 3))
+    assert(d[0, 8] == 4 and d[4, 1] == 1 and d[2, 6] == 4)
+    assert((d == d.T).all())
+
+
+def test_route_line():
+    circ = QuantumCircuit(4)
+    circ.cx(1, 2)  # first, so that the identity mapping is kept (native circuits are played in the order given)
+    circ.cx(0, 3)
+    circ.cx(0, 3)
+    arc = [(0, 1), (1, 2), (2, 3)]
+
+    engine = Router(arc, initial_passes=0).route(circ)
+    assert(engine.stage == 3)
+    assert(engine.initial_mapping.to_list() == [0, 1, 2, 3])
+    assert(engine.num_swaps == 2)
+    assert(check_circuit_compatible_with_arc(engine.final_circ, arc))
+
+    engine = Router(arc).route(circ)  # a good initial mapping needs no swaps
+    assert(engine.num_swaps == 0)
+
+
+def test_route_batch_on_lattice():
+    arc = lattice_architecture(4, 5)
+    router = Router(arc)
+    circuits = [random_circuit(num_qubits=20, depth=4, max_operands=2, seed=seed) for seed in range(3)]
+
+    for result in router.route_all(circuits):
+        details = result['details']
+        assert(check_circuit_compatible_with_arc(result['final_circuit'], arc))
+        assert(sorted(details['initial_mapping']) == list(range(20)))
+        assert(sorted(details['final_mapping']) == list(range(20)))
+
+
+def test_play_continues_a_game():
+    circ = random_circuit(num_qubits=6, depth=5, max_operands=2, seed=3)
+    arc = lattice_architecture(2, 3)
+    engine = Engine(circ, arc)
+    engine.apply_swap(0, 5)
+    Router(arc).play(engine)
+    assert(engine.stage == 3 and engine.gates_remaining() == 0)
@@ -0,0 +1,156 @@
+"""
+Tests for the multi-session server, played over a local connection.
+"""
+
+import asyncio
+
+from qiskit import QuantumCircuit
+
+from router import Router
+from server import Server, LevelStore, Client, RequestError
+from tests.check_outputs import check_equiv_statevector
+
+
+def routed_moves(store, level):
+    engine = Router(store.new_engine(level).arc).play(store.new_engine(level))
+    return [list(move) for move in engine.moves]
+
+
+def test_server_plays_sessions():
+    store = LevelStore()
+
+    async def run():
+        server = Server(store)
+        port = await server.start()
+        try:
+            clients = [await Client.connect('127.0.0.1', port) for _ in range(3)]
+            states = [await client.request('POST', '/sessions', {'level': 4}) for client in clients]
+            assert(all(status == 200 for status, _ in states))
+            ids = [state['session'] for _, state in states]
+            assert(len(set(ids)) == 3 and server.stats()['sessions'] == 3)
+
+            # every session of a level shares its tables, but not its state
+            engines = [server.sessions[i].engine for i in ids]
+            assert(engines[0].gate_ops is engines[1].gate_ops and engines[0].moves is not engines[1].moves)
+
+            moves = routed_moves(store, 4)
+            responses = await asyncio.gather(*(client.request('POST', '/sessions/{}/moves'.format(i), {'moves': moves})
+                                               for client, i in zip(clients, ids)))
+            assert(all(status == 200 and state['stage'] == 3 for status, state in responses))
+
+            status, result = await clients[0].request('GET', '/sessions/{}/result'.format(ids[0]))
+            details = result['details']
+            final_circ = QuantumCircuit.from_qasm_str(result['final_circuit'])
+            assert(status == 200 and details['num_swaps'] == responses[0][1]['num_swaps'])
+            assert(check_equiv_statevector(engines[0].initial_circ, final_circ, details['initial_mapping'],
+                                           details['final_mapping'], seed=0))
+
+            status, state = await clients[1].request('POST', '/sessions/{}/moves'.format(ids[1]), {'moves': [['undo']]})
+            assert(status == 200 and state['stage'] == 2 and state['num_moves'] == len(moves) - 1)
+
+            status, _ = await clients[2].request('DELETE', '/sessions/{}'.format(ids[2]))
+            assert(status == 200)
+            status, _ = await clients[2].request('GET', '/sessions/{}'.format(ids[2]))
+            assert(status == 404)
+            for client in clients:
+                await client.close()
+        finally:
+            await server.close()
+
+    asyncio.run(run())
+
+
+def test_server_errors():
+    store = LevelStore()
+
+    async def run():
+        server = Server(store, max_sessions=1)
+        port = await server.start()
+        client = await Client.connect('127.0.0.1', port)
+        try:
+            assert((await client.request('POST', '/sessions', {'level': 999}))[0] == 404)
+            status, state = await client.request('POST', '/sessions', {'level': 2})
+            assert(status == 200)
+            assert((await client.request('POST', '/sessions', {'level': 2}))[0] == 503)
+
+            path = '/sessions/{}/moves'.format(state['session'])
+            assert((await client.request('POST', path, {'moves': [['jump']]}))[0] == 400)
+            assert((await client.request('POST', path, {'moves': [['swap', 0, 99]]}))[0] == 400)
+            assert((await client.request('POST', path, {'moves': [['swap', False, True]]}))[0] == 400)
+            assert((await client.request('GET', '/sessions/{}/result'.format(state['session'])))[0] == 409)
+
+            # stage 2, where a swap must be on an edge of the architecture
+            status, state = await client.request('POST', path, {'moves': [['advance']]})
+            x, y = next((x, y) for x in range(len(state['mapping'])) for y in range(x)
+                        if (x, y) not in server.sessions[state['session']].engine.arc_edges)
+            status, state = await client.request('POST', path, {'moves': [['swap', x, y], ['advance']]})
+            assert(status == 409 and state['num_moves'] == 1 and 'error' in state)
+            assert((await client.request('PUT', path, {}))[0] == 405)
+
+            # a bad header gets a response, rather than dropping the connection
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'POST /sessions HTTP/1.1\r\nContent-Length: ten\r\n\r\n')
+            response = await reader.read()
+            writer.close()
+            await writer.wait_closed()
+            assert(response.startswith(b'HTTP/1.1 400') and b'Content-Length' in response)
+        finally:
+            await client.close()
+            await server.close()
+
+    asyncio.run(run())
+
+
+def test_server_timeouts_and_backpressure():
+    now = [0.]
+    server = Server(LevelStore(), max_pending=1, idle_timeout=10., clock=lambda: now[0])
+    idle = server.open_session(4)
+    busy = server.open_session(4)
+
+    now[0] = 8.
+    server.get_session(busy.id)
+    now[0] = 12.
+    assert(server.expire() == 1 and idle.id not in server.sessions and busy.id in server.sessions)
+
+    async def run():
+        # a long batch of moves yields to other requests, which must not queue up behind it
+        moves = [['swap', 0, 1]] * 200
+        return await asyncio.gather(server.play(busy.id, moves), server.play(busy.id, moves), return_exceptions=True)
+
+    first, second = asyncio.run(run())
+    assert(first['num_moves'] == 200)
+    assert(isinstance(second, RequestError) and second.status == 429 and server.counts['rejected'] == 1)
+
+
+def test_server_loads_levels_off_the_event_loop():
+    import threading
+    import time
+
+    store = LevelStore()
+    store.new_engine(2)  # built on the spot, as it is not loaded
+    build = store._build
+    started, release, builds = threading.Event(), threading.Event(), []
+
+    def slow_build(number, front_layer):
+        builds.append(number)
+        started.set()
+        release.wait(5)
+        return build(number, front_layer)
+
+    store._build = slow_build
+
+    async def run():
+        server = Server(store)
+        playing = server.open_session(2)
+        opening = [asyncio.ensure_future(server.dispatch('POST', '/sessions', {'level': 4})) for _ in range(2)]
+        while not started.is_set():
+            await asyncio.sleep(0.01)
+
+        # while level 4 is built, the other sessions are still served
+        state = await asyncio.wait_for(server.play(playing.id, [['advance']]), 1)
+        assert(state['stage'] == 2 and not any(future.done() for future in opening))
+        release.set()
+        states = await asyncio.gather(*opening)
+        assert(all(state['level'] == 4 for state in states) and builds == [4])  # built once
+
+    asyncio.run(run())
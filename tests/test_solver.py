@@ -0,0 +1,98 @@
+"""
+Tests for the exact solver in `solver.py`.
+"""
+
+from itertools import permutations
+
+from qiskit.circuit.random import random_circuit
+
+from engine import Engine
+from router import Router, cnot_pairs
+from solver import solve, replay
+from util import Permutation, lattice_architecture
+
+
+def brute_force(engine):
+    """
+    The fewest swaps, by a breadth first search from every initial mapping.
+    """
+    pairs = cnot_pairs(engine)
+    arc = set(engine.arc) | set((b, a) for a, b in engine.arc)
+
+    def advance(i, mapping):
+        while i < len(pairs) and (mapping[pairs[i][0]], mapping[pairs[i][1]]) in arc:
+            i += 1
+        return i
+
+    layer = set((advance(0, m), m) for m in permutations(range(engine.num_arc_qubits)))
+    seen = set(layer)
+    num_swaps = 0
+    while not any(i == len(pairs) for i, _ in layer):
+        new_layer = set()
+        for i, mapping in layer:
+            for p, q in engine.arc:
+                new_mapping = tuple(q if x == p else p if x == q else x for x in mapping)
+                state = (advance(i, new_mapping), new_mapping)
+                if state not in seen:
+                    seen.add(state)
+                    new_layer.add(state)
+        layer = new_layer
+        num_swaps += 1
+    return num_swaps
+
+
+def test_solver_is_optimal():
+    arc = [(0, 1), (1, 2), (2, 3), (3, 4)]
+    for seed in range(4):
+        circ = random_circuit(num_qubits=5, depth=5, max_operands=2, seed=seed)
+        solution = solve(Engine(circ, arc))
+        assert(solution['optimal'])
+        assert(solution['num_swaps'] == brute_force(Engine(circ, arc)))
+
+        engine = replay(Engine(circ, arc), solution)
+        assert(engine.num_swaps == solution['num_swaps'])
+        assert(engine.num_swaps <= Router(arc).route(circ).num_swaps)
+
+
+def test_solver_from_stage_2():
+    circ = random_circuit(num_qubits=6, depth=4, max_operands=2, seed=2)
+    arc = lattice_architecture(2, 3)
+    engine = Engine(circ, arc)
+    for mapping in permutations(range(6)):  # get into stage 2 with a poor mapping
+        engine.set_initial_mapping(Permutation(mapping[::-1]))
+        if engine.is_legal():
+            break
+    while engine.is_legal():
+        engine.advance()
+    assert(engine.stage == 2)
+    engine.apply_swap(*engine.arc[0])  # the swap so far is not counted by the solver
+
+    solution = solve(engine)
+    assert(solution['optimal'] and solution['initial_mapping'] == engine.current_mapping.to_list())
+    replay(engine, solution)
+    assert(engine.num_swaps == solution['num_swaps'] + 1)
+
+
+def test_solver_falls_back_to_bounds():
+    circ = random_circuit(num_qubits=6, depth=5, max_operands=2, seed=1)
+    arc = lattice_architecture(2, 3)
+    exact = solve(Engine(circ, arc))
+
+    solution = solve(Engine(circ, arc), max_states=50)
+    assert(not solution['optimal'])
+    assert(solution['lower_bound'] <= exact['num_swaps'] <= solution['num_swaps'])
+    assert(replay(Engine(circ, arc), solution).num_swaps == solution['num_swaps'])
+
+
+def test_solver_fallback_is_bounded_by_max_states():
+    import time
+
+    # stage 1 on a 3x4 lattice has about 1e8 starting mappings, which must not all be looked at
+    circ = random_circuit(num_qubits=12, depth=6, max_operands=2, seed=0)
+    arc = lattice_architecture(3, 4)
+    start = time.perf_counter()
+    solution = solve(Engine(circ, arc), max_states=1000)
+    assert(time.perf_counter() - start < 10)
+    assert(not solution['optimal'] and solution['num_states'] <= 1001)
+    assert(0 <= solution['lower_bound'] <= solution['num_swaps'])
+    assert(replay(Engine(circ, arc), solution).num_swaps == solution['num_swaps'])
@@ -0,0 +1,82 @@
+"""
+Tests for the functions in `util.py`.
+"""
+
+from util import Permutation, lattice_architecture
+
+
+def test_permutation():
+    p = Permutation(4)
+    assert(p.to_list() == [0, 1, 2, 3])
+
+    p.transpose(1, 3)  # the logical qubits on 1 and 3 swap
+    p.transpose(0, 1)
+    assert(p.to_list() == [1, 3, 2, 0])
+    assert([p.inverse(p(x)) for x in range(4)] == [0, 1, 2, 3])
+
+    q = p.copy()
+    q.transpose(2, 3)
+    assert(p.to_list() == [1, 3, 2, 0])
+    assert(q.to_list() == [1, 2, 3, 0])
+    assert(q != p and q == Permutation([1, 2, 3, 0]))
+
+    for images in ([0, 0, 1], [0, 1, 3], [-1, 0, 1]):  # not a permutation
+        try:
+            Permutation(images)
+            assert(False)
+        except ValueError:
+            pass
+
+
+def test_long_sequence_of_transpositions():
+    p = Permutation(3)
+    for i in range(100000):
+        p.transpose(i % 3, (i + 1) % 3)
+    assert(sorted(p.to_list()) == [0, 1, 2])
+
+
+def test_lattice_architecture():
+    assert(lattice_architecture(2, 2) == [(0, 1), (0, 2), (1, 3), (2, 3)])
+
+
+def test_device_snapshots_offline():
+    import tempfile
+    from util import (SnapshotProvider, device_snapshots, device_architecture, distance_lists, get_backend_graphs,
+                      refresh_device_snapshots)
+
+    snapshots = device_snapshots()
+    assert({'ibmq_16_melbourne', 'ibm_washington'} <= set(snapshots))
+    washington = snapshots['ibm_washington']
+    arc = device_architecture('ibm_washington')
+    assert(washington['num_qubits'] == 127 and len(arc) == 142)
+    assert(washington['distances'] == distance_lists(arc))
+    assert(all(b in washington['neighbours'][a] and a in washington['neighbours'][b] for a, b in arc))
+    assert(device_snapshots() is not snapshots and device_snapshots()['ibm_washington'] is washington)  # read once
+
+    provider = SnapshotProvider()
+    backend = provider.backends.ibmq_16_melbourne
+    assert(backend.name() == 'ibmq_16_melbourne' and provider.get_backend('ibm_washington').name() == 'ibm_washington')
+    assert(len(backend.properties().to_dict()['qubits']) == 15 and len(backend.configuration().coupling_map) == 40)
+    graphs = get_backend_graphs(provider, plot=False)
+    assert(sorted(graphs['ibmq_16_melbourne'].edges) == sorted(device_architecture('ibmq_16_melbourne')))
+
+    # a refresh asks the provider again, here the snapshots themselves
+    directory = tempfile.mkdtemp()
+    filenames = refresh_device_snapshots(provider, directory, names=['ibmq_16_melbourne'])
+    assert(len(filenames) == 1)
+    refreshed = device_snapshots(directory)['ibmq_16_melbourne']
+    melbourne = snapshots['ibmq_16_melbourne']
+    assert(all(refreshed[key] == melbourne[key] for key in ('edges', 'distances', 'properties', 'num_qubits')))
+
+
+def test_row_layout():
+    from util import device_architecture, row_layout
+
+    for arc in [device_architecture('ibm_washington'), device_architecture('ibmq_rochester'),
+                lattice_architecture(4, 5)]:
+        positions = row_layout(arc)
+        assert(positions is not None)
+        assert(len(set(positions.values())) == len(positions))  # no two qubits in the same place
+        assert(all(abs(positions[a][0] - positions[b][0]) + abs(positions[a][1] - positions[b][1]) == 1
+                   for a, b in arc))
+    assert(row_layout([(0, 1), (1, 2), (0, 2)]) is None)  # a triangle cannot be drawn with edges of length 1
@@ -0,0 +1,71 @@
+"""
+Tests for the batch verification of game outputs in `verify_outputs.py`.
+"""
+
+import os
+import json
+
+from router import Router
+from util import lattice_architecture
+from qiskit.circuit.random import random_circuit
+from tests.verify_outputs import find_runs, verify_outputs
+
+
+def save_runs(directory):
+    router = Router(lattice_architecture(2, 3))
+    for seed in range(3):
+        engine = router.route(random_circuit(num_qubits=6, depth=4, max_operands=2, seed=seed))
+        engine.save('run_{}'.format(seed), output_dir=str(directory))
+
+
+def test_verify_outputs(tmp_path):
+    directory = tmp_path / 'outputs'
+    directory.mkdir()
+    save_runs(directory)
+    cache_file = str(tmp_path / 'cache.json')
+    assert(sorted(find_runs(str(directory))) == ['run_0', 'run_1', 'run_2'])
+
+    summary = verify_outputs(str(directory), cache_file=cache_file, processes=2)
+    assert(summary['num_runs'] == 3 and summary['num_verified'] == 3 and summary['num_failed'] == 0)
+    assert(all(result['structural'] and result['statevector'] and result['compatible']
+               for result in summary['runs'].values()))
+    json.dumps(summary)  # the summary is machine-readable
+
+    summary = verify_outputs(str(directory), cache_file=cache_file, processes=2)
+    assert(summary['num_verified'] == 0 and summary['num_passed'] == 3)
+
+    # changing a run only verifies that run again
+    final_path = str(directory / 'final_circuit_run_1.txt')
+    with open(final_path, 'r') as file:
+        lines = file.readlines()
+    with open(final_path, 'w') as file:
+        file.writelines(lines[:-1])
+    with open(str(directory / 'details_run_2.txt'), 'w') as file:
+        file.write('not a dictionary')
+
+    summary = verify_outputs(str(directory), cache_file=cache_file, processes=2)
+    assert(summary['num_verified'] == 2 and summary['failed'] == ['run_1', 'run_2'])
+    assert(summary['runs']['run_1']['structural'] is False)
+    assert(summary['runs']['run_2']['error'] is not None)
+    with open(cache_file, 'r') as file:
+        assert(len(json.load(file)) == 3)  # the results of the old versions are dropped
+
+
+def no_check(initial_circ, final_circ, initial_mapping, final_mapping):
+    return None
+
+
+def test_verify_outputs_unverified(tmp_path):
+    router = Router(lattice_architecture(2, 3))
+    engine = router.route(random_circuit(num_qubits=6, depth=4, max_operands=2, seed=0))
+    engine.save('plain', output_dir=str(tmp_path))
+    engine.save('optimized', output_dir=str(tmp_path), optimize=True)
+
+    # without simulating, the optimized run is still checked (gate by gate, up to the CNOTs)
+    summary = verify_outputs(str(tmp_path), cache_file=None, processes=1, simulate_max_qubits=0)
+    assert(summary['num_passed'] == 2 and summary['runs']['optimized']['structural'] is True)
+
+    # but with no equivalence check at all, it must not count as passed
+    summary = verify_outputs(str(tmp_path), cache_file=None, processes=1, simulate_max_qubits=0, frame_check=no_check)
+    assert(summary['num_passed'] == 1 and summary['num_unverified'] == 1 and summary['num_failed'] == 0)
+    assert(summary['unverified'] == ['optimized'] and not summary['runs']['optimized']['passed'])
@@ -0,0 +1,204 @@
+"""
+Verifies a whole directory of recorded game outputs (as saved by `Engine.save`) as a batch job. Each run (its initial
+circuit, final circuit and details files) is checked with the functions in `check_outputs.py` on a pool of processes,
+and the result is stored in a cache keyed by a hash of the contents of the three files, so only new or changed runs are
+verified again. A machine-readable (JSON) summary of every run is returned, e.g. run
+
+    python verify_outputs.py game_outputs --summary summary.json
+
+which exits with a non-zero status if any run fails. A run on which no equivalence check could be made (e.g. too many
+qubits to simulate, and no structural check) is reported as unverified, not as passed.
+"""
+
+import sys, os
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import argparse
+import ast
+import contextlib
+import hashlib
+import io
+import json
+import multiprocessing
+import time
+from qiskit import QuantumCircuit
+
+from tests.check_outputs import check_equiv_structural, check_equiv_cnot_frame, check_equiv_statevector, \
+    check_circuit_compatible_with_arc
+
+
+DEFAULT_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'verification_cache.json')
+
+# changing the checks made by `verify_run` must change this, so that the cached results are not reused
+CHECKS_VERSION = 3
+
+
+def find_runs(directory):
+    """
+    Returns a dictionary of the runs in `directory`, from the name of each run to the paths of its initial circuit,
+    final circuit and details files.
+    """
+    runs = {}
+    for filename in sorted(os.listdir(directory)):
+        if filename.startswith('initial_circuit'):
+            name = os.path.splitext(filename[len('initial_circuit'):])[0].lstrip(' _')
+            initial_path = os.path.join(directory, filename)
+            paths = (initial_path,
+                     initial_path.replace('initial_circuit', 'final_circuit'),
+                     initial_path.replace('initial_circuit', 'details'))
+            if all(os.path.exists(path) for path in paths):
+                runs[name] = paths
+    return runs
+
+
+def run_hash(paths, simulate_max_qubits, frame_check=check_equiv_cnot_frame):
+    """
+    Returns the hash of the contents of the files of a run, together with the settings of the checks.
+    """
+    digest = hashlib.sha256('{} {} {}.{}'.format(CHECKS_VERSION, simulate_max_qubits, frame_check.__module__,
+                                                 frame_check.__qualname__).encode())
+    for path in paths:
+        with open(path, 'rb') as file:
+            contents = file.read()
+        digest.update(str(len(contents)).encode())
+        digest.update(contents)
+    return digest.hexdigest()
+
+
+def load_run(paths):
+    """
+    Reads a run, returning its initial circuit, final circuit and details (as a dictionary).
+    """
+    initial_path, final_path, details_path = paths
+    initial_circ = QuantumCircuit.from_qasm_file(initial_path)
+    final_circ = QuantumCircuit.from_qasm_file(final_path)
+    with open(details_path, 'r') as file:
+        details = ast.literal_eval(file.read().replace('\n', ''))  # converts to dictionary
+    return initial_circ, final_circ, details
+
+
+def verify_run(paths, simulate_max_qubits=20, frame_check=check_equiv_cnot_frame):
+    """
+    Checks a single run: that the final circuit is equivalent to the initial circuit (`check_equiv_structural`, and
+    `check_equiv_statevector` if there are at most `simulate_max_qubits` qubits), and that it only uses the edges of the
+    architecture (`check_circuit_compatible_with_arc`). On runs whose final circuit was optimized (see `peephole`), the
+    swaps are no longer three CNOTs each, so the structural check is `frame_check` instead, by default
+    `check_equiv_cnot_frame`.
+
+    :return: A dictionary of the results of the checks (`None` if a check was not made), whether they all passed, the
+             error if the run could not be read, and the time taken. A run only passes if at least one of the
+             equivalence checks (structural or statevector) was made; if none was made and no check failed, the run
+             is 'unverified'.
+    """
+    start = time.perf_counter()
+    result = {'structural': None, 'statevector': None, 'compatible': None, 'passed': False, 'unverified': False,
+              'error': None}
+    try:
+        initial_circ, final_circ, details = load_run(paths)
+        num_qubits = details.get('num_arc_qubits', details.get('num_qubits'))
+        initial_mapping, final_mapping = details['initial_mapping'], details['final_mapping']
+        result['num_qubits'] = num_qubits
+        result['num_swaps'] = details.get('num_swaps')
+
+        if details.get('optimized'):  # the peephole optimizer removes some of the gates of the swaps
+            result['structural'] = frame_check(initial_circ, final_circ, initial_mapping, final_mapping)
+        else:
+            result['structural'] = check_equiv_structural(initial_circ, final_circ, initial_mapping, final_mapping)
+        if num_qubits <= simulate_max_qubits:
+            result['statevector'] = bool(check_equiv_statevector(initial_circ, final_circ, initial_mapping,
+                                                                 final_mapping, seed=0))
+        with contextlib.redirect_stdout(io.StringIO()):  # keeps the summary on stdout machine-readable
+            result['compatible'] = check_circuit_compatible_with_arc(circuit=final_circ, arc=details['architecture'])
+        if all(result[check] is not False for check in ('structural', 'statevector', 'compatible')):
+            if result['structural'] or result['statevector']:
+                result['passed'] = True
+            else:
+                result['unverified'] = True
+    except Exception as error:  # a corrupt run fails, rather than stopping the batch
+        result['error'] = '{}: {}'.format(type(error).__name__, error)
+
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def verify_outputs(directory='game_outputs', cache_file=DEFAULT_CACHE_FILE, processes=None, simulate_max_qubits=20,
+                   verbose=False, frame_check=check_equiv_cnot_frame):
+    """
+    Verifies every run in `directory` which does not already have a result in the cache.
+
+    :param directory:           The directory of the runs, see `find_runs`.
+    :param cache_file:          The JSON file of the cached results, or `None` to verify every run without a cache.
+    :param processes:           The number of processes to verify with, by default the number of cores.
+    :param simulate_max_qubits: The largest number of qubits for which the circuits are also simulated.
+    :param verbose:             If `True`, prints the result of each run as it is verified.
+    :param frame_check:         The structural check of the optimized runs, see `verify_run`. It is sent to the worker
+                                processes, so it must be a function defined at the top level of a module.
+    :return:    A dictionary with the keys
+                * 'num_runs', 'num_verified' (not in the cache), 'num_passed', 'num_unverified' and 'num_failed': the
+                  numbers of runs.
+                * 'failed' and 'unverified': the names of the runs which failed, and of those which no equivalence
+                  check could be made on (see `verify_run`).
+                * 'runs': the result of each run (see `verify_run`), by name.
+    """
+    runs = find_runs(directory)
+    hashes = {name: run_hash(paths, simulate_max_qubits, frame_check) for name, paths in runs.items()}
+
+    cache = {}
+    if cache_file is not None and os.path.exists(cache_file):
+        with open(cache_file, 'r') as file:
+            cache = json.load(file)
+
+    stale = [name for name in runs if hashes[name] not in cache]
+    if stale:
+        jobs = [(runs[name], simulate_max_qubits, frame_check) for name in stale]
+        with multiprocessing.Pool(processes) as pool:
+            for name, result in zip(stale, pool.starmap(verify_run, jobs)):
+                cache[hashes[name]] = result
+                if verbose:
+                    print('{:<40} {}'.format(name, _status(result)))
+
+    if cache_file is not None:
+        current = set(hashes.values())
+        with open(cache_file, 'w') as file:
+            json.dump({h: result for h, result in cache.items() if h in current}, file, indent=1, sort_keys=True)
+
+    results = {name: cache[hashes[name]] for name in runs}
+    failed = [name for name, result in results.items() if _status(result) == 'FAILED']
+    unverified = [name for name, result in results.items() if _status(result) == 'unverified']
+    return {
+            'num_runs': len(runs),
+            'num_verified': len(stale),
+            'num_passed': len(runs) - len(failed) - len(unverified),
+            'num_unverified': len(unverified),
+            'num_failed': len(failed),
+            'failed': failed,
+            'unverified': unverified,
+            'runs': results,
+            }
+
+
+def _status(result):
+    if result['passed']:
+        return 'passed'
+    return 'unverified' if result.get('unverified') else 'FAILED'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Verifies the recorded game outputs in a directory.')
+    parser.add_argument('directory', nargs='?', default='game_outputs')
+    parser.add_argument('--cache', default=DEFAULT_CACHE_FILE, help='the cache file ("none" for no cache)')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--simulate-max-qubits', type=int, default=20)
+    parser.add_argument('--summary', default=None, help='the file to write the JSON summary to (default: stdout)')
+    args = parser.parse_args()
+
+    summary = verify_outputs(args.directory, cache_file=None if args.cache == 'none' else args.cache,
+                             processes=args.processes, simulate_max_qubits=args.simulate_max_qubits)
+    if args.summary is None:
+        print(json.dumps(summary, indent=1))
+    else:
+        with open(args.summary, 'w') as file:
+            json.dump(summary, file, indent=1)
+        print('{} runs ({} verified): {} passed, {} unverified, {} failed'.format(
+            summary['num_runs'], summary['num_verified'], summary['num_passed'], summary['num_unverified'],
+            summary['num_failed']))
+    sys.exit(1 if summary['num_failed'] else 0)
@@ -1,8 +1,22 @@
 """
     Some useful functions.
 """
-import matplotlib.pyplot as plt
-import networkx as nx
+import datetime
+import json
+import math
+import os
+from array import array
+from collections import defaultdict
+from types import SimpleNamespace
+
+
+# the stored snapshots of devices (their coupling maps and calibrations), see `device_snapshots`
+DEVICES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'devices')
+
+# changing what a snapshot holds must change this, so that old snapshots are refreshed
+SNAPSHOT_VERSION = 1
+
+_snapshots = {}  # {path: (modification time, snapshot)} of the snapshots already read
 
 
 def lattice_architecture(a, b):
@@ -27,6 +41,122 @@ def lattice_architecture(a, b):
     return res
 
 
+def distance_matrix(architecture):
+    """
+    Returns the matrix of shortest path distances between the qubits of an architecture (given as a list of edges),
+    found by a breadth first search from each qubit. Disconnected qubits are at distance -1.
+    """
+    import numpy as np
+    return np.array(distance_lists(architecture), dtype=np.int32)
+
+
+def distance_lists(architecture):
+    """
+    The same as `distance_matrix`, as nested lists (which are faster to index one at a time, and do not need `numpy`).
+    """
+    num_qubits = max([max(x) for x in architecture]) + 1
+    neighbours = [[] for _ in range(num_qubits)]
+    for a, b in architecture:
+        neighbours[a].append(b)
+        neighbours[b].append(a)
+
+    distances = []
+    for source in range(num_qubits):
+        row = [-1] * num_qubits
+        row[source] = 0
+        frontier = [source]
+        d = 0
+        while frontier:
+            d += 1
+            new_frontier = []
+            for x in frontier:
+                for y in neighbours[x]:
+                    if row[y] < 0:
+                        row[y] = d
+                        new_frontier.append(y)
+            frontier = new_frontier
+        distances.append(row)
+
+    return distances
+
+
+def row_layout(architecture):
+    """
+    Returns coordinates for the qubits of an architecture which is made of rows of consecutively numbered qubits, joined
+    either directly (a grid, e.g. `lattice_architecture`) or through single bridge qubits (heavy hex, e.g. the IBM
+    devices in `devices`), as a dictionary {qubit: (x, y)} with the first row at the top, or `None` if the architecture
+    is not like that. Every edge has length 1 and no two qubits are in the same place.
+    """
+    num_qubits = max([max(x) for x in architecture]) + 1
+    neighbours = [set() for _ in range(num_qubits)]
+    for a, b in architecture:
+        neighbours[a].add(b)
+        neighbours[b].add(a)
+
+    runs, run_of = [], []  # the runs of consecutive qubits joined by edges, and the run of each qubit
+    for q in range(num_qubits):
+        if q and q - 1 in neighbours[q]:
+            runs[-1].append(q)
+        else:
+            runs.append([q])
+        run_of.append(len(runs) - 1)
+    rows = [i for i, run in enumerate(runs) if len(run) > 1]
+    if not rows:
+        return None
+
+    positions = {}
+
+    def place(row, x, step, y):
+        for k, q in enumerate(runs[row]):
+            positions[q] = (x + step * k, y)
+
+    place(rows[0], 0, 1, 0)
+    placed, queue = {rows[0]}, [rows[0]]
+    while queue:  # a breadth first search over the rows
+        row = queue.pop(0)
+        joins = defaultdict(list)  # {other row: [(its qubit, qubit of this row, bridge or `None`)]}
+        for v in runs[row]:
+            for u in neighbours[v]:
+                if len(runs[run_of[u]]) > 1:
+                    if run_of[u] != row:
+                        joins[run_of[u]].append((u, v, None))
+                    continue
+                for w in neighbours[u] - {v}:  # `u` is a bridge
+                    if len(runs[run_of[w]]) > 1 and run_of[w] != row:
+                        joins[run_of[w]].append((w, v, u))
+
+        for other, links in joins.items():
+            if other in placed:
+                continue
+            gap = 1 if links[0][2] is None else 2
+            y = positions[links[0][1]][1] + (-gap if other > row else gap)  # later rows are below
+            for step in (1, -1):  # the row may be numbered either way
+                starts = set(positions[v][0] - step * (u - runs[other][0]) for u, v, _ in links)
+                if len(starts) == 1:
+                    place(other, starts.pop(), step, y)
+                    break
+            else:
+                return None
+            for u, v, bridge in links:
+                if bridge is not None:
+                    positions[bridge] = (positions[v][0], (positions[v][1] + y) / 2)
+            placed.add(other)
+            queue.append(other)
+
+    for q in range(num_qubits):  # a bridge with one of its edges missing hangs off its row
+        if q not in positions and len(neighbours[q]) == 1:
+            v = next(iter(neighbours[q]))
+            if v in positions:
+                positions[q] = (positions[v][0], positions[v][1] + (-1 if q > v else 1))
+
+    if len(positions) != num_qubits or len(set(positions.values())) != num_qubits:
+        return None
+    for a, b in architecture:
+        if abs(positions[a][0] - positions[b][0]) + abs(positions[a][1] - positions[b][1]) != 1:
+            return None
+    return positions
+
+
 def compose(f, g):
     def h(x):
         return f(g(x))
@@ -34,22 +164,132 @@ def compose(f, g):
     return h
 
 
-def get_backend_graphs(provider):
+class Permutation:
     """
-    Plots the connectivity graphs of each available backend.
+    A permutation of the integers 0, ..., n-1, e.g. a 'logical qubit' --> 'physical qubit' mapping.
+    Both directions are stored as arrays, so looking up the image (by calling it, like a function) or the preimage
+    (via `inverse`) takes constant time, and so does swapping two images via `transpose`.
     """
+
+    def __init__(self, images):
+        """
+        :param images: either the number of elements `n` (for the identity) or a list of images, e.g. [2, 0, 1].
+        """
+        if isinstance(images, int):
+            images = range(images)
+        self._forward = array('l', images)
+        n = len(self._forward)
+        self._inverse = array('l', [-1]) * n
+        for x, y in enumerate(self._forward):
+            if not 0 <= y < n or self._inverse[y] >= 0:  # out of range, or the image of two elements
+                raise ValueError('{} is not a permutation of 0, ..., {}.'.format(list(self._forward), n - 1))
+            self._inverse[y] = x
+
+    def __call__(self, x):
+        return self._forward[x]
+
+    def __len__(self):
+        return len(self._forward)
+
+    def __eq__(self, other):
+        return isinstance(other, Permutation) and self._forward == other._forward
+
+    def __repr__(self):
+        return 'Permutation({})'.format(self.to_list())
+
+    def inverse(self, y):
+        """
+        Returns the `x` which is mapped to `y`.
+        """
+        return self._inverse[y]
+
+    def transpose(self, x, y):
+        """
+        Composes (in place) the transposition of `x` and `y` after this permutation, i.e. whatever was mapped to `x`
+        is now mapped to `y` and vice versa.
+        """
+        a, b = self._inverse[x], self._inverse[y]
+        self._forward[a], self._forward[b] = y, x
+        self._inverse[x], self._inverse[y] = b, a
+
+    def copy(self):
+        new = Permutation.__new__(Permutation)
+        new._forward = array('l', self._forward)
+        new._inverse = array('l', self._inverse)
+        return new
+
+    def to_list(self):
+        return self._forward.tolist()
+
+
+class GridIndex:
+    """
+    A spatial index of circular regions in the plane, e.g. the nodes and buttons of the board.
+    The plane is split into square cells and each region is stored in every cell it overlaps, so finding the region
+    containing a point only needs to look at the regions in the point's cell.
+    """
+
+    def __init__(self, cell_size=0.1):
+        self.cell_size = cell_size
+        self.cells = defaultdict(list)
+        self.num_regions = 0
+
+    def cell(self, x, y):
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def insert(self, key, x, y, radius):
+        """
+        Adds the disc of the given `radius` centred at (`x`, `y`), which will be identified by `key`.
+        When regions overlap, the one inserted first takes priority.
+        """
+        region = (self.num_regions, key, x, y, radius**2)
+        self.num_regions += 1
+
+        i_min, j_min = self.cell(x - radius, y - radius)
+        i_max, j_max = self.cell(x + radius, y + radius)
+        for i in range(i_min, i_max + 1):
+            for j in range(j_min, j_max + 1):
+                self.cells[(i, j)].append(region)
+
+    def query(self, x, y):
+        """
+        Returns the key of the region containing the point (`x`, `y`), or `None` if there is none.
+        """
+        found = None
+        for region in self.cells.get(self.cell(x, y), ()):
+            if (x - region[2])**2 + (y - region[3])**2 < region[4]:
+                if found is None or region[0] < found[0]:
+                    found = region
+
+        return found[1] if found is not None else None
+
+
+def get_backend_graphs(provider=None, plot=True):
+    """
+    Plots the connectivity graphs of each available backend. By default the backends are the stored snapshots (see
+    `SnapshotProvider`), which needs no network access.
+    """
+    import networkx as nx
+
+    provider = provider if provider is not None else SnapshotProvider()
     backend_graphs = {}
     for backend in provider.backends():
-        if backend.properties() is not None:
+        snapshot = getattr(backend, 'snapshot', None)
+        if snapshot is not None:  # the edges are already stored
+            graph = nx.Graph()
+            graph.add_nodes_from(range(snapshot['num_qubits']))
+            graph.add_edges_from(snapshot['edges'])
+            backend_graphs[snapshot['backend_name']] = graph
+        elif backend.properties() is not None:
             backend_dict = backend.properties().to_dict()
-            gates = []
-            for g in backend_dict['gates']:
-                if len(g['qubits']) > 1:  # not a single qubit gate
-                    gates.append(g['qubits'])
             graph = nx.Graph()
-            graph.add_edges_from(gates)
+            graph.add_edges_from(_coupled_qubits(backend_dict))
             backend_graphs[backend_dict['backend_name']] = graph
 
+    if not plot:
+        return backend_graphs
+
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(18, 18))
     for plot_num in range(len(backend_graphs)):
         ax = plt.subplot(int(len(backend_graphs) / 2) + 1, 3, plot_num + 1)
@@ -59,12 +299,204 @@ def get_backend_graphs(provider):
     return backend_graphs
 
 
-def print_backend_info(provider):
+def print_backend_info(provider=None):
     """
-    For each backend, prints the number of jobs and number of qubits.
+    For each backend, prints the number of jobs and number of qubits. By default the backends are the stored snapshots
+    (see `SnapshotProvider`), where the number of jobs is as it was when the snapshot was taken.
     """
+    provider = provider if provider is not None else SnapshotProvider()
     for backend in provider.backends():
         if backend.properties() is not None:
             backend_dict = backend.properties().to_dict()
             jobs_in_queue = backend.status().pending_jobs
             print(backend_dict['backend_name'], ':    {} qubits, {} jobs in queue'.format(len(backend_dict['qubits']),jobs_in_queue))
+
+
+def _coupled_qubits(properties):
+    """
+    The pairs of qubits of the two qubit gates in the (dictionary of the) properties of a device.
+    """
+    return [g['qubits'] for g in properties['gates'] if len(g['qubits']) > 1]
+
+
+def device_snapshot(properties, coupling_map=None, pending_jobs=None):
+    """
+    Makes a snapshot of a device, from the dictionary of its properties (as `backend.properties().to_dict()`, with the
+    dates as strings) and its coupling map (by default the pairs of qubits of its two qubit gates). Besides the
+    properties, the snapshot holds the edges of the device (each once, as the smaller qubit first), the neighbours of
+    each qubit and the distances between the qubits (see `distance_lists`), so nothing has to be computed on loading.
+    """
+    num_qubits = len(properties['qubits'])
+    pairs = coupling_map if coupling_map is not None else _coupled_qubits(properties)
+    edges = sorted(set((min(a, b), max(a, b)) for a, b in pairs))
+
+    neighbours = [[] for _ in range(num_qubits)]
+    for a, b in edges:
+        neighbours[a].append(b)
+        neighbours[b].append(a)
+
+    return {
+            'version': SNAPSHOT_VERSION,
+            'backend_name': properties['backend_name'],
+            'num_qubits': num_qubits,
+            'edges': [list(edge) for edge in edges],
+            'neighbours': neighbours,
+            'distances': distance_lists(edges + [(q, q) for q in range(num_qubits)]),  # with every qubit, even if idle
+            'pending_jobs': pending_jobs,
+            'saved': datetime.datetime.now().isoformat(timespec='seconds'),
+            'properties': properties,
+            }
+
+
+def device_snapshot_from_files(properties_file, configuration_file=None):
+    """
+    Makes a snapshot of a device from its properties (and configuration, for the coupling map) saved as JSON, e.g. the
+    files of the fake backends of `qiskit`.
+    """
+    with open(properties_file, 'r') as file:
+        properties = json.load(file)
+    coupling_map = None
+    if configuration_file is not None:
+        with open(configuration_file, 'r') as file:
+            coupling_map = json.load(file).get('coupling_map')
+    return device_snapshot(_compact_properties(properties), coupling_map)
+
+
+def _compact_properties(properties):
+    # the dates of each calibrated value are dropped (the date of the last update is kept), which halves the snapshot
+    def compact(parameters):
+        return [{k: v for k, v in parameter.items() if k != 'date'} for parameter in parameters]
+    return dict(properties,
+                qubits=[compact(parameters) for parameters in properties['qubits']],
+                gates=[dict(gate, parameters=compact(gate['parameters'])) for gate in properties['gates']])
+
+
+def save_device_snapshot(snapshot, directory=DEVICES_DIR):
+    """
+    Saves a snapshot as `<backend name>.json` in `directory`, returning the filename.
+    """
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    filename = os.path.join(directory, snapshot['backend_name'] + '.json')
+    temporary = '{}.{}'.format(filename, os.getpid())
+    with open(temporary, 'w') as file:
+        json.dump(snapshot, file, separators=(',', ':'))
+    os.replace(temporary, filename)  # so that a snapshot being read is never half written
+    return filename
+
+
+def refresh_device_snapshots(provider, directory=DEVICES_DIR, names=None):
+    """
+    Takes new snapshots of the backends of `provider` (e.g. `IBMQ.load_account()`), and saves them. This is the only
+    function which asks the provider (so the network) for anything.
+
+    :param names:   The names of the backends to refresh, by default all of them which have properties.
+    :return: the filenames of the snapshots saved.
+    """
+    filenames = []
+    for backend in provider.backends():
+        if names is not None and backend.name() not in names:
+            continue
+        properties = backend.properties()
+        if properties is None:  # e.g. a simulator
+            continue
+        properties = _compact_properties(json.loads(json.dumps(properties.to_dict(), default=str)))
+        coupling_map = getattr(backend.configuration(), 'coupling_map', None)
+        snapshot = device_snapshot(properties, coupling_map, pending_jobs=backend.status().pending_jobs)
+        filenames.append(save_device_snapshot(snapshot, directory))
+    return filenames
+
+
+def device_snapshots(directory=DEVICES_DIR):
+    """
+    Returns the stored snapshots in `directory`, by the name of the device. Each file is only read again if it changed.
+    """
+    found = {}
+    if not os.path.exists(directory):
+        return found
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.json'):
+            continue
+        path = os.path.join(directory, filename)
+        modified = os.path.getmtime(path)
+        if path not in _snapshots or _snapshots[path][0] != modified:
+            with open(path, 'r') as file:
+                _snapshots[path] = (modified, json.load(file))
+        snapshot = _snapshots[path][1]
+        if snapshot.get('version') == SNAPSHOT_VERSION:
+            found[snapshot['backend_name']] = snapshot
+    return found
+
+
+def device_architecture(name, directory=DEVICES_DIR):
+    """
+    Returns the architecture (a list of edges) of a stored device, e.g. `device_architecture('ibmq_16_melbourne')`.
+    """
+    snapshots = device_snapshots(directory)
+    if name not in snapshots:
+        raise ValueError('There is no snapshot of {} (the devices stored are {}).'.format(name, ', '.join(snapshots)))
+    return [tuple(edge) for edge in snapshots[name]['edges']]
+
+
+class SnapshotProvider:
+    """
+    A stand-in for a provider of backends (e.g. `IBMQ.load_account()`), which serves the stored snapshots of devices
+    with no network access. Its backends have the `name`, `properties`, `status` and `configuration` methods used in
+    this repository and its notebooks, e.g.
+
+        provider = SnapshotProvider()
+        backend = provider.backends.ibmq_16_melbourne
+        backend_graphs = get_backend_graphs(provider)
+    """
+
+    def __init__(self, directory=DEVICES_DIR):
+        self.directory = directory
+        self.backends = _SnapshotBackends(self)
+
+    def get_backend(self, name):
+        return getattr(self.backends, name)
+
+
+class _SnapshotBackends:
+    """
+    The backends of a `SnapshotProvider`: calling it lists them, and each backend is also an attribute, by its name.
+    """
+
+    def __init__(self, provider):
+        self._provider = provider
+
+    def __call__(self, name=None):
+        snapshots = device_snapshots(self._provider.directory)
+        return [SnapshotBackend(snapshot) for key, snapshot in snapshots.items() if name is None or key == name]
+
+    def __getattr__(self, name):
+        backends = self(name)
+        if not backends:
+            raise AttributeError('There is no snapshot of {}.'.format(name))
+        return backends[0]
+
+
+class SnapshotBackend:
+    """
+    A backend served from a snapshot, see `SnapshotProvider`.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def __repr__(self):
+        return 'SnapshotBackend({!r})'.format(self.name())
+
+    def name(self):
+        return self.snapshot['backend_name']
+
+    def properties(self):
+        return SimpleNamespace(to_dict=lambda: self.snapshot['properties'],
+                               last_update_date=self.snapshot['properties'].get('last_update_date'))
+
+    def status(self):
+        return SimpleNamespace(backend_name=self.name(), operational=True, pending_jobs=self.snapshot['pending_jobs'])
+
+    def configuration(self):
+        return SimpleNamespace(backend_name=self.name(), n_qubits=self.snapshot['num_qubits'],
+                               coupling_map=self.snapshot['edges'] + [[b, a] for a, b in self.snapshot['edges']])